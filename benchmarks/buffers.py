@@ -0,0 +1,19 @@
+"""Compares peak memory and time of loading feed from file object,
+bytes and memory mapped file.
+
+Usage:
+    python -m benchmarks.buffers [events] [repeat]
+"""
+import sys
+
+from .run import run
+
+ENGINES = [
+    'load_bytesio', 'load', 'load_file', 'load_mmap',
+    'streaming', 'streaming_bytes', 'streaming_mmap',
+]
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    run([args[0] if args else 100000], ENGINES, *args[1:])
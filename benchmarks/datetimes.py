@@ -0,0 +1,80 @@
+"""Compares built-in datetime value type with `strptime` filter, both
+parsing single values and loading feed with session times.
+
+Usage:
+    python -m benchmarks.datetimes [events] [repeat]
+"""
+import copy
+import sys
+import timeit
+
+import pytz
+
+from xmlmapper import CachedFilter, XMLMapper
+from xmlmapper.datetimes import compile_parser
+
+from .feed import MAPPINGS, FILTERS, DictFactory, datetime_filter, \
+    generate_feed
+
+FORMAT = '%Y-%m-%d %H:%M'
+
+
+def localized_filter(value):
+    # filter of examples/django_models loadxml command
+    return pytz.utc.localize(datetime_filter(value))
+
+
+def _session_mappings(session_time):
+    mappings = copy.deepcopy(MAPPINGS)
+    for mapping in mappings:
+        if mapping['_type'] == 'session':
+            mapping['time'] = session_time
+    return mappings
+
+
+def run_parsers(values=100000, repeat=3):
+    strings = ['2016-{:02d}-{:02d} {:02d}:{:02d}'.format(
+        1 + i % 12, 1 + i % 28, i % 24, i % 60) for i in range(values)]
+    parsers = [
+        ('strptime', datetime_filter),
+        ('strptime utc', localized_filter),
+        ('format', compile_parser('datetime', FORMAT)),
+        ('format utc', compile_parser('datetime', FORMAT, pytz.utc)),
+        ('iso', compile_parser('datetime')),
+    ]
+    results = {}
+    for name, parse in parsers:
+        total = min(timeit.repeat(lambda: [parse(s) for s in strings],
+                                  number=1, repeat=repeat))
+        results[name] = total / values * 1e6
+        print('{:15s} {:8.3f} us per value'.format(name, results[name]))
+    return results
+
+
+def run_load(events=20000, repeat=3):
+    xml = generate_feed(events)
+    filters = dict(FILTERS)
+    del filters['datetime']
+    session_time = 'concat(@date, " ", @time)'
+    mappers = [
+        ('strptime filter', XMLMapper(MAPPINGS, filters=FILTERS)),
+        ('cached filter', XMLMapper(MAPPINGS, filters=dict(
+            FILTERS, datetime=CachedFilter(datetime_filter)))),
+        ('datetime type', XMLMapper(_session_mappings(
+            'datetime({}): {}'.format(FORMAT, session_time)),
+            filters=filters)),
+    ]
+    results = {}
+    for name, mapper in mappers:
+        results[name] = min(timeit.repeat(
+            lambda: mapper.load(xml, DictFactory()), number=1,
+            repeat=repeat))
+        print('{:15s} {:8.3f} s per load'.format(name, results[name]))
+    return results
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    events, repeat = (args + [20000, 3][len(args):])[:2]
+    run_parsers(repeat=repeat)
+    run_load(events, repeat)
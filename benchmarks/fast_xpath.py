@@ -0,0 +1,48 @@
+"""Compares mapper with attribute and text() fast path against
+plain libxml2 XPath evaluation on example feed.
+
+Usage:
+    python -m benchmarks.fast_xpath [events] [repeat]
+"""
+import sys
+import timeit
+
+from lxml import etree
+
+from xmlmapper import XMLMapper
+
+from .feed import MAPPINGS, FILTERS, DictFactory, feed_counts, generate_feed
+
+
+class XPathOnlyMapper(XMLMapper):
+    """Mapper evaluating all queries with `etree.XPath`."""
+
+    def _compile_xpath(self, xpath):
+        return etree.XPath(xpath, smart_strings=False)
+
+
+def run(events=10000, repeat=5):
+    xml = generate_feed(events)
+    records = sum(feed_counts(events))
+
+    def parse():
+        etree.fromstring(xml, etree.XMLParser(remove_blank_text=True))
+
+    parse_time = min(timeit.repeat(parse, number=1, repeat=repeat))
+    results = {}
+    for name, mapper_cls in (('xpath', XPathOnlyMapper),
+                             ('fast', XMLMapper)):
+        mapper = mapper_cls(MAPPINGS, filters=FILTERS)
+        total = min(timeit.repeat(
+            lambda: mapper.load(xml, DictFactory()),
+            number=1, repeat=repeat))
+        results[name] = (total - parse_time) / records * 1e6
+        print('{:6s} {:8.2f} us per record ({:.3f}s total, '
+              '{:.3f}s parsing)'.format(
+                  name, results[name], total, parse_time))
+    print('speedup {:.2f}x'.format(results['xpath'] / results['fast']))
+    return results
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,178 @@
+"""Synthetic feeds in the format loaded by `loadxml` command of
+django_models example (events, places with persons and schedule)."""
+from datetime import datetime
+from io import BytesIO
+
+from xmlmapper import MapperObjectFactory
+
+
+# Same as _XML_MAPPINGS in examples/django_models loadxml command
+MAPPINGS = [
+    {
+        '_type': 'event',
+        '_match': '/feed/events/event',
+        '_id': '@id',
+        'title': 'title',
+        'text': 'text',
+        'is_paid': 'bool: boolean(@price)',
+        'runtime': 'int: runtime',
+        'min_age': 'min_age: age_restricted',
+        '#tags': [{
+            '_type': 'event_tag',
+            '_match': 'tags/tag',
+            'word': 'text()',
+        }],
+        '#gallery': [{
+            '_type': 'event_image',
+            '_match': 'gallery/image',
+            'url': '@href',
+        }]
+    }, {
+        '_type': 'place',
+        '_match': '/feed/places/place',
+        '_id': '@id',
+        'type': '@type',
+        'title': 'title',
+        'lat': 'float: coordinates/@latitude',
+        'lon': 'float: coordinates/@longitude',
+        '#tags': [{
+            '_type': 'place_tag',
+            '_match': 'tags/tag',
+            'word': 'text()',
+        }],
+        '#gallery': [{
+            '_type': 'place_image',
+            '_match': 'gallery/image',
+            'url': '@href',
+        }],
+    }, {
+        '_type': 'place_person',
+        '_match': '/feed/places/place/persons/person',
+        'place': 'place: ../../@id',
+        'person': {
+            '_type': 'person',
+            '_match': 'name',
+            'full_name': 'text()',
+        },
+        'role': 'role',
+    }, {
+        '_type': 'session',
+        '_match': '/feed/schedule/session',
+        'event': 'event: @event',
+        'place': 'place: @place',
+        'time': 'datetime: concat(@date, " ", @time)',
+    }
+]
+
+
+def datetime_filter(value):
+    return datetime.strptime(value, '%Y-%m-%d %H:%M')
+
+
+def min_age_filter(value):
+    if value is None:
+        return 0
+    return int(value[:-1])
+
+
+FILTERS = {
+    'datetime': datetime_filter,
+    'min_age': min_age_filter,
+}
+
+
+class DictFactory(MapperObjectFactory):
+    """Factory creating plain dicts, cheapest possible factory."""
+
+    def create(self, object_type, fields):
+        return fields
+
+
+def _event(i):
+    price = ' price="{}"'.format(100 + i % 7) if i % 3 else ''
+    tags = ''.join(
+        '<tag>tag{}</tag>'.format((i + j) % 50) for j in range(i % 4))
+    images = ''.join(
+        '<image href="http://img.example.com/{}/{}.jpg"/>'.format(i, j)
+        for j in range(i % 3))
+    runtime = '<runtime>{}</runtime>'.format(60 + i % 120) if i % 5 else ''
+    age = '<age_restricted>{}+</age_restricted>'.format(
+        (6, 12, 16, 18)[i % 4]) if i % 2 else ''
+    return (
+        '<event id="e{0}"{1}><title>Event {0}</title>'
+        '<text>Description of event {0} with some longer text.</text>'
+        '{2}{3}<tags>{4}</tags><gallery>{5}</gallery></event>'.format(
+            i, price, runtime, age, tags, images))
+
+
+def _place(i):
+    tags = ''.join(
+        '<tag>tag{}</tag>'.format((i * 3 + j) % 50) for j in range(i % 3))
+    images = ''.join(
+        '<image href="http://img.example.com/p{}/{}.jpg"/>'.format(i, j)
+        for j in range(i % 2))
+    persons = ''.join(
+        '<person><name>Person {}</name><role>role{}</role></person>'.format(
+            (i + j) % 1000, j) for j in range(i % 3))
+    coordinates = (
+        '<coordinates latitude="{:.4f}" longitude="{:.4f}"/>'.format(
+            55 + i % 100 / 100.0, 37 + i % 77 / 100.0) if i % 4 else '')
+    return (
+        '<place id="p{0}" type="type{1}"><title>Place {0}</title>'
+        '{2}<tags>{3}</tags><gallery>{4}</gallery>'
+        '<persons>{5}</persons></place>'.format(
+            i, i % 5, coordinates, tags, images, persons))
+
+
+def _session(i, events, places):
+    return (
+        '<session event="e{}" place="p{}" date="2016-{:02d}-{:02d}" '
+        'time="{:02d}:{:02d}"/>'.format(
+            i % events, i % places, 1 + i % 12, 1 + i % 28,
+            10 + i % 12, i % 4 * 15))
+
+
+def feed_counts(events):
+    """Returns (events, places, sessions) counts for feed size."""
+    return events, max(1, events // 10), events * 2
+
+
+def iter_feed(events, chunk_records=1000):
+    """Yields feed with `events` events as utf-8 byte chunks.
+
+    Feed also has `events / 10` places with up to two persons each and
+    two schedule sessions per event.
+    """
+    events, places, sessions = feed_counts(events)
+    sections = (
+        ('events', events, _event),
+        ('places', places, _place),
+        ('schedule', sessions, lambda i: _session(i, events, places)),
+    )
+    yield b'<?xml version="1.0" encoding="utf-8"?>\n<feed>'
+    for name, count, record in sections:
+        yield '<{}>'.format(name).encode('utf-8')
+        for start in range(0, count, chunk_records):
+            yield ''.join(
+                record(i) for i in range(
+                    start, min(count, start + chunk_records))
+            ).encode('utf-8')
+        yield '</{}>'.format(name).encode('utf-8')
+    yield b'</feed>\n'
+
+
+def generate_feed(events):
+    """Returns feed with `events` events as bytes."""
+    return b''.join(iter_feed(events))
+
+
+def write_feed(path, events):
+    """Writes feed with `events` events to file."""
+    with open(path, 'wb') as f:
+        for chunk in iter_feed(events):
+            f.write(chunk)
+
+
+def feed_file(events):
+    """Returns file-like object with generated feed."""
+    return BytesIO(generate_feed(events))
@@ -0,0 +1,48 @@
+"""Compares parser options on large feed and cost of creating parser
+on every load of many small feeds.
+
+Usage:
+    python -m benchmarks.parser_options [events] [small_files] [repeat]
+"""
+import sys
+import timeit
+
+from lxml import etree
+
+from xmlmapper import XMLMapper
+
+from .feed import MAPPINGS, FILTERS, DictFactory, generate_feed
+from .run import run
+
+ENGINES = [
+    'load_file', 'no_collect_ids', 'no_resolve_entities', 'no_ids_entities',
+    'huge_tree', 'remove_comments_pis',
+]
+
+
+class NewParserMapper(XMLMapper):
+    """Mapper creating new parser for every load."""
+
+    def _get_parser(self):
+        return etree.XMLParser(**self._parser_options)
+
+
+def run_small_files(files=2000, repeat=3):
+    xml = generate_feed(1)
+    results = {}
+    for name, mapper_cls in (('new parser', NewParserMapper),
+                             ('cached parser', XMLMapper)):
+        mapper = mapper_cls(MAPPINGS, filters=FILTERS)
+        total = min(timeit.repeat(
+            lambda: [mapper.load(xml, DictFactory()) for _ in range(files)],
+            number=1, repeat=repeat))
+        results[name] = total / files * 1e6
+        print('{:15s} {:8.2f} us per file'.format(name, results[name]))
+    return results
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    events, files, repeat = (args + [100000, 2000, 3][len(args):])[:3]
+    run([events], ENGINES, repeat)
+    run_small_files(files, repeat)
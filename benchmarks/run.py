@@ -0,0 +1,312 @@
+"""Benchmark suite measuring loading throughput, peak memory and time
+per phase (see `measure_phases`) on generated feeds of growing size.
+
+Every engine and feed size is measured in a separate process so peak RSS
+of one run doesn't affect others. Results are printed as a table and
+written as JSON to compare runs across commits.
+
+Usage:
+    python -m benchmarks.run [--events 1000,10000,100000]
+        [--engines load,load_file,...] [--repeat 3] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from lxml import etree
+
+from xmlmapper import CachedFilter, XMLMapper, XMLMapperStats
+from xmlmapper.columnar import ColumnarFactory
+from xmlmapper.records import RecordFactory
+
+from .feed import MAPPINGS, FILTERS, DictFactory, feed_counts, write_feed
+
+
+class TimingFactory(DictFactory):
+    """Factory measuring time spent creating objects."""
+
+    def __init__(self):
+        self.time = 0.0
+
+    def create(self, object_type, fields):
+        start = time.perf_counter()
+        obj = super(TimingFactory, self).create(object_type, fields)
+        self.time += time.perf_counter() - start
+        return obj
+
+
+def _load(mapper, path, factory, **kwargs):
+    with open(path, 'rb') as f:
+        xml = f.read()
+    return mapper.load(xml, factory, **kwargs)
+
+
+def _load_bytesio(mapper, path, factory, **kwargs):
+    # loading from bytes before they were parsed without copying
+    with open(path, 'rb') as f:
+        xml = f.read()
+    return mapper.load_file(BytesIO(xml), factory, **kwargs)
+
+
+def _load_file(mapper, path, factory, **kwargs):
+    return mapper.load_file(path, factory, **kwargs)
+
+
+def _load_columnar(mapper, path, factory, **kwargs):
+    return mapper.load_file(path, ColumnarFactory(mapper), **kwargs)
+
+
+def _load_records(mapper, path, factory, **kwargs):
+    return mapper.load_file(path, RecordFactory(mapper), **kwargs)
+
+
+# name: (mapper options, load function, load options)
+ENGINES = {
+    'load': ({}, _load, {}),
+    'load_bytesio': ({}, _load_bytesio, {}),
+    'load_file': ({}, _load_file, {}),
+    'load_mmap': ({}, _load_file, {'use_mmap': True}),
+    'streaming': ({}, _load_file, {'streaming': True}),
+    'streaming_bytes': ({}, _load, {'streaming': True}),
+    'streaming_mmap': (
+        {}, _load_file, {'streaming': True, 'use_mmap': True}),
+    'single_pass': ({}, _load_file, {'single_pass': True}),
+    'codegen': ({'codegen': True}, _load_file, {}),
+    'xslt': ({}, _load_file, {'xslt': True}),
+    'batch': ({}, _load_file, {'batch_size': 1000}),
+    'batch_deferred': (
+        {}, _load_file, {'batch_size': 1000, 'defer_conversion': True}),
+    'split': ({}, _load_file, {'split': '/feed/events/event'}),
+    'columnar': ({}, _load_columnar, {}),
+    'streaming_columnar': ({}, _load_columnar, {'streaming': True}),
+    'columnar_deferred': (
+        {}, _load_columnar, {'batch_size': 1000, 'defer_conversion': True}),
+    'records': ({}, _load_records, {}),
+    'streaming_records': ({}, _load_records, {'streaming': True}),
+    'no_collect_ids': (
+        {'parser_options': {'collect_ids': False}}, _load_file, {}),
+    'no_resolve_entities': (
+        {'parser_options': {'resolve_entities': False}}, _load_file, {}),
+    'no_ids_entities': (
+        {'parser_options': {'collect_ids': False,
+                            'resolve_entities': False}}, _load_file, {}),
+    'huge_tree': ({'parser_options': {'huge_tree': True}}, _load_file, {}),
+    'cached_filters': ({'filters': dict(
+        (name, CachedFilter(f)) for name, f in FILTERS.items())},
+        _load_file, {}),
+    'remove_comments_pis': (
+        {'parser_options': {'remove_comments': True, 'remove_pis': True}},
+        _load_file, {}),
+}
+
+DEFAULT_ENGINES = ['load', 'load_file', 'streaming', 'codegen', 'batch']
+
+# Order phases are printed in
+PHASES = ('parse', 'parse_match', 'match', 'transform', 'xpath', 'convert',
+          'queries', 'decode', 'factory', 'other')
+
+
+def measure_phases(mapper, path, load, options, codegen=False):
+    """Returns time per phase of loading file with engine, or None for
+    `split` as its phases run in worker processes.
+
+    Phases are measured by separate load with `XMLMapperStats`:
+
+        parse: Parsing document with parser of mapper, measured
+            separately by `XMLMapper.parse`.
+        parse_match: Parsing and matching records in streaming mode,
+            where records are matched as they are parsed.
+        match: Evaluating "_match" of mappings.
+        xpath: Evaluating XPath of attribute queries.
+        convert: Converting query results to built-in types, by filters
+            and resolving references.
+        factory: Creating objects.
+        other: Rest of load time, like grouping objects in batches and
+            deferred conversion.
+
+    Generated code and XSLT transform are not used while collecting
+    stats, so they are loaded in separate steps instead, where
+    `queries` (generated loaders) and `decode` (transform result) are
+    whole query evaluation including conversion and `transform` is
+    matching and querying by XSLT.
+    """
+    if 'split' in options:
+        return None
+    if codegen or options.get('xslt'):
+        return _measure_steps(mapper, path, options.get('xslt'))
+
+    stats = XMLMapperStats()
+    load(mapper, path, DictFactory(), stats=stats, **options)
+    top = [stats.mappings[m.mapping_type] for m in mapper._mappings
+           if m.mapping_type in stats.mappings]
+    match = sum(s.match_time for s in stats.mappings.values())
+    queries = stats.queries.values()
+    phases = {
+        'xpath': sum(s.xpath_time for s in queries),
+        'convert': sum(s.convert_time + s.filter_time for s in queries),
+        'factory': stats.factory_time,
+    }
+    # objects are created by create_many outside of mapping time
+    other = stats.total_time - sum(s.match_time + s.time for s in top) - (
+        stats.factory_time if options.get('batch_size') else 0.0)
+    if options.get('streaming'):
+        phases['parse_match'] = match
+    else:
+        start = time.perf_counter()
+        mapper.parse(path)
+        phases['parse'] = time.perf_counter() - start
+        phases['match'] = match
+        other -= phases['parse']
+    phases['other'] = max(other, 0.0)
+    return phases
+
+
+def _measure_steps(mapper, path, xslt):
+    """Returns time of parsing, matching and querying and creating
+    objects by loading file in separate steps."""
+    start = time.perf_counter()
+    root = mapper.parse(path)
+    parse = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if xslt:
+        stylesheet = mapper._get_stylesheet()
+        records = list(stylesheet.iter_records(root))
+        load_record = stylesheet.load_record
+    else:
+        records = list(mapper._iter_tree_records(root))
+        load_record = mapper._load_record
+    match = time.perf_counter() - start
+
+    factory = TimingFactory()
+    start = time.perf_counter()
+    for _ in mapper._iter_load(records, load_record, factory, None):
+        pass
+    load = time.perf_counter() - start
+    if xslt:
+        return {'parse': parse, 'transform': match,
+                'decode': load - factory.time, 'factory': factory.time}
+    return {'parse': parse, 'match': match,
+            'queries': load - factory.time, 'factory': factory.time}
+
+
+def run_engine(engine, path, events, repeat):
+    """Measures single engine on feed file, returns result dict."""
+    mapper_options, load, options = ENGINES[engine]
+    mapper = XMLMapper(MAPPINGS,
+                       **dict({'filters': FILTERS}, **mapper_options))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        objects = load(mapper, path, DictFactory(), **options)
+        times.append(time.perf_counter() - start)
+        count = len(objects)
+        del objects
+
+    result = {
+        'engine': engine,
+        'events': events,
+        'records': sum(feed_counts(events)),
+        'objects': count,
+        'bytes': os.path.getsize(path),
+        'time': min(times),
+        'objects_per_second': count / min(times),
+        'mb_per_second': os.path.getsize(path) / min(times) / 2 ** 20,
+    }
+    phases = measure_phases(mapper, path, load, options,
+                            mapper_options.get('codegen', False))
+    if phases is not None:
+        result['phases'] = phases
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mb'] = rss / (2 ** 20 if sys.platform == 'darwin'
+                                   else 2 ** 10)
+    return result
+
+
+def run_child(engine, path, events, repeat):
+    """Runs `run_engine` in new interpreter process."""
+    output = subprocess.check_output([
+        sys.executable, '-m', 'benchmarks.run', '--child', engine, path,
+        str(events), str(repeat)])
+    return json.loads(output.decode('utf-8'))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(events_list, engines, repeat=3, output=None):
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        for events in events_list:
+            path = os.path.join(directory, 'feed{}.xml'.format(events))
+            write_feed(path, events)
+            for engine in engines:
+                result = run_child(engine, path, events, repeat)
+                results.append(result)
+                print('{engine:20s} {events:>9d} events {time:9.3f}s '
+                      '{objects_per_second:>10.0f} obj/s '
+                      '{mb_per_second:7.2f} MB/s '
+                      '{peak_rss_mb:8.1f} MB RSS'.format(**result))
+                if 'phases' in result:
+                    print('{:20s} phases: {}'.format('', ', '.join(
+                        '{} {:.3f}s'.format(k, result['phases'][k])
+                        for k in PHASES if k in result['phases'])))
+            os.unlink(path)
+    finally:
+        shutil.rmtree(directory)
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'lxml': '.'.join(str(v) for v in etree.LXML_VERSION),
+        'libxml2': '.'.join(str(v) for v in etree.LIBXML_VERSION),
+        'results': results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return report
+
+
+def main(argv):
+    if argv[:1] == ['--child']:
+        engine, path, events, repeat = argv[1:]
+        json.dump(run_engine(engine, path, int(events), int(repeat)),
+                  sys.stdout)
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--events', default='1000,10000,100000',
+                        help='comma separated feed sizes in events')
+    parser.add_argument('--engines', default=','.join(DEFAULT_ENGINES),
+                        help='comma separated engines: {}'.format(
+                            ', '.join(sorted(ENGINES))))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file to write results to')
+    args = parser.parse_args(argv)
+    engines = args.engines.split(',')
+    for engine in engines:
+        if engine not in ENGINES:
+            parser.error('unknown engine {}'.format(engine))
+    run([int(e) for e in args.events.split(',')], engines, args.repeat,
+        args.output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
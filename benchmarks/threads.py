@@ -0,0 +1,35 @@
+"""Measures throughput of one mapper shared by growing number of threads
+loading separate feeds.
+
+Usage:
+    python -m benchmarks.threads [events] [feeds] [max_threads]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from xmlmapper import XMLMapper
+
+from .feed import MAPPINGS, FILTERS, DictFactory, generate_feed
+
+
+def run(events=2000, feeds=32, max_threads=8):
+    xml = generate_feed(events)
+    mapper = XMLMapper(MAPPINGS, filters=FILTERS)
+    results = {}
+    threads = 1
+    while threads <= max_threads:
+        with ThreadPoolExecutor(threads) as executor:
+            start = time.perf_counter()
+            list(executor.map(lambda _: mapper.load(xml, DictFactory()),
+                              range(feeds)))
+            total = time.perf_counter() - start
+        results[threads] = feeds / total
+        print('{:3d} threads {:8.2f} feeds/s {:6.2f}x'.format(
+            threads, results[threads], results[threads] / results[1]))
+        threads *= 2
+    return results
+
+
+if __name__ == '__main__':
+    run(*[int(a) for a in sys.argv[1:]])
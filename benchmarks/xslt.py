@@ -0,0 +1,15 @@
+"""Compares interpreter, generated code and XSLT engine on example feed.
+
+Usage:
+    python -m benchmarks.xslt [events] [repeat]
+"""
+import sys
+
+from .run import run
+
+ENGINES = ['load_file', 'codegen', 'xslt']
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    run([args[0] if args else 100000], ENGINES, *args[1:])
@@ -1,4 +1,8 @@
+from collections import OrderedDict
+
 import six
+from django.core.management.color import no_style
+from django.db import connection, models
 
 from xmlmapper import MapperObjectFactory
 
@@ -21,13 +25,7 @@ class ModelsFactory(MapperObjectFactory):
     def create(self, model_type, fields):
         # Django model has to be saved before its m2m relations
         # can be used so separating those
-        regular_fields = {}
-        m2m_fields = {}
-        for k, v in six.iteritems(fields):
-            if k.startswith('#'):
-                m2m_fields[k[1:]] = v
-            else:
-                regular_fields[k] = v
+        regular_fields, m2m_fields = self._split_fields(fields)
         obj, _ = self.MODELS[model_type].objects.get_or_create(
             **regular_fields)
         for k, v in six.iteritems(m2m_fields):
@@ -35,3 +33,139 @@ class ModelsFactory(MapperObjectFactory):
             for x in v:
                 attr.add(x)
         return obj
+
+    @staticmethod
+    def _split_fields(fields):
+        regular_fields = {}
+        m2m_fields = {}
+        for k, v in six.iteritems(fields):
+            if k.startswith('#'):
+                m2m_fields[k[1:]] = v
+            else:
+                regular_fields[k] = v
+        return regular_fields, m2m_fields
+
+
+class BulkModelsFactory(ModelsFactory):
+    """Factory inserting every batch of objects with one `bulk_create`
+    and their m2m links with one `bulk_create` per relation.
+
+    Has to be used with `batch_size` loading option inside
+    `transaction.atomic`. Objects are reused if there are saved or
+    preceding ones with the same fields like `get_or_create` does in
+    `ModelsFactory`, they are looked up for every batch by one query per
+    chunk of values of model's `LOOKUP_FIELDS` field. Primary keys are
+    assigned from maximum saved key before inserting, so objects can be
+    referenced by following batches with any database, but concurrent
+    loads into the same tables would assign the same keys and fail.
+    `reset_sequences` has to be called after loading.
+    """
+    LOOKUP_FIELDS = {
+        Event: 'title',
+        Place: 'title',
+        Session: 'event',
+        Tag: 'word',
+        Image: 'url',
+        Person: 'full_name',
+        Membership: 'person',
+    }
+
+    def __init__(self):
+        self._next_pks = {}
+
+    def create_many(self, model_type, fields_list):
+        model = self.MODELS[model_type]
+        split = [self._split_fields(fields) for fields in fields_list]
+        objects, new = self._find_existing(
+            model, [regular_fields for regular_fields, _ in split])
+        self._assign_pks(model, new)
+        model.objects.bulk_create(new)
+        self._add_m2m(model, objects, new, [m2m for _, m2m in split])
+        return objects
+
+    def reset_sequences(self):
+        """Updates database sequences of models which primary keys were
+        assigned by factory."""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), list(self._next_pks))
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def _find_existing(self, model, fields_list):
+        """Returns list of objects with saved or preceding ones in place
+        of objects with the same fields and list of objects to insert."""
+        if not fields_list:
+            return [], []
+        fields = [model._meta.get_field(name) for name in fields_list[0]]
+        lookup = model._meta.get_field(self.LOOKUP_FIELDS[model])
+
+        def get_key(obj):
+            # comparing database values, so naive datetimes match
+            # saved aware ones as in query of `get_or_create`
+            return tuple(
+                field.get_db_prep_value(
+                    getattr(obj, field.attname), connection)
+                for field in fields)
+
+        objects = [model(**regular_fields) for regular_fields in fields_list]
+        found = {}
+        for obj in self._filter_in(
+                model.objects.all(), lookup,
+                set(getattr(obj, lookup.attname) for obj in objects)):
+            found.setdefault(get_key(obj), obj)
+        new = []
+        result = []
+        for obj in objects:
+            key = get_key(obj)
+            if key not in found:
+                found[key] = obj
+                new.append(obj)
+            result.append(found[key])
+        return result, new
+
+    def _assign_pks(self, model, objects):
+        if not isinstance(model._meta.pk, models.AutoField):
+            return
+        if model not in self._next_pks:
+            self._next_pks[model] = (model.objects.aggregate(
+                max_pk=models.Max('pk'))['max_pk'] or 0) + 1
+        for obj in objects:
+            obj.pk = self._next_pks[model]
+            self._next_pks[model] += 1
+
+    def _add_m2m(self, model, objects, new, m2m_list):
+        links = OrderedDict()
+        for obj, m2m_fields in zip(objects, m2m_list):
+            for k, v in six.iteritems(m2m_fields):
+                pairs = links.setdefault(k, OrderedDict())
+                for x in v:
+                    pairs[obj.pk, x.pk] = None
+        # reused objects may already have links like `add` skips
+        saved_pks = set(obj.pk for obj in objects).difference(
+            obj.pk for obj in new)
+        for k, pairs in six.iteritems(links):
+            field = model._meta.get_field(k)
+            through = field.remote_field.through
+            column = through._meta.get_field(field.m2m_column_name())
+            reverse_name = field.m2m_reverse_name()
+            if saved_pks:
+                for pair in self._filter_in(
+                        through.objects.values_list(
+                            column.attname, reverse_name),
+                        column, saved_pks):
+                    pairs.pop(pair, None)
+            through.objects.bulk_create([
+                through(**{column.attname: obj_pk, reverse_name: x_pk})
+                for obj_pk, x_pk in pairs])
+
+    @staticmethod
+    def _filter_in(queryset, field, values):
+        """Yields rows of `queryset` with `field` value in `values`
+        querying them in chunks fitting database parameters limit."""
+        values = list(values)
+        size = connection.ops.bulk_batch_size([field], values)
+        for i in range(0, len(values), size):
+            for row in queryset.filter(**{
+                    field.attname + '__in': values[i:i + size]}):
+                yield row
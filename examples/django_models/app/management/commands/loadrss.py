@@ -1,8 +1,9 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from xmlmapper import XMLMapper
 
-from ._factory import ModelsFactory
+from ._factory import BulkModelsFactory, ModelsFactory
 
 # simple rss 2.0 parser, not much data to extract here
 
@@ -39,14 +40,42 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('filename', nargs='+')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Parse files with this number of processes')
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Insert objects with bulk queries in batches of this '
+                 'size in single transaction')
 
     def handle(self, *args, **options):
-        factory = ModelsFactory()
+        if not options['batch_size']:
+            self._load(ModelsFactory(), options)
+            return
+        factory = BulkModelsFactory()
+        with transaction.atomic():
+            self._load(factory, options)
+            factory.reset_sequences()
+
+    def _load(self, factory, options):
+        if options['workers']:
+            if options['verbosity'] > 0:
+                self.stdout.write('Importing {} files ... '.format(
+                    len(options['filename'])), ending="")
+            res = self.mapper.load_files(
+                options['filename'], factory, workers=options['workers'],
+                batch_size=options['batch_size'])
+            if options['verbosity'] > 0:
+                self.stdout.write(self.style.SUCCESS('OK'), ending="")
+                self.stdout.write(" ({} objects)".format(len(res)))
+            return
+
         for filename in options['filename']:
             if options['verbosity'] > 0:
                 self.stdout.write(
                     'Importing {} ... '.format(filename), ending="")
-            res = self.mapper.load_file(filename, factory)
+            res = self.mapper.load_file(
+                filename, factory, batch_size=options['batch_size'])
             if options['verbosity'] > 0:
                 self.stdout.write(self.style.SUCCESS('OK'), ending="")
                 self.stdout.write(" ({} objects)".format(len(res)))
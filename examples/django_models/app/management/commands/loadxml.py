@@ -1,11 +1,11 @@
 import pytz
-from datetime import datetime
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from xmlmapper import XMLMapper
 
-from ._factory import ModelsFactory
+from ._factory import BulkModelsFactory, ModelsFactory
 
 
 _XML_MAPPINGS = [
@@ -61,43 +61,71 @@ _XML_MAPPINGS = [
         '_match': '/feed/schedule/session',
         'event': 'event: @event',
         'place': 'place: @place',
-        'time': 'datetime: concat(@date, " ", @time)',
+        'time': 'datetime(%Y-%m-%d %H:%M): concat(@date, " ", @time)',
     }
 ]
 
 
+# filters are module-level functions so mapper can be pickled
+# for worker processes
+
+def _min_age_filter(value):
+    if value is None:
+        return 0
+    return int(value[:-1])
+
+
 class Command(BaseCommand):
     help = 'Imports XML in kudago test format'
 
     def __init__(self, *args, **kwargs):
         super(Command, self).__init__(*args, **kwargs)
 
-        def datetime_filter(value):
-            return pytz.utc.localize(
-                datetime.strptime(value, '%Y-%m-%d %H:%M'))
-
-        def min_age_filter(value):
-            if value is None:
-                return 0
-            return int(value[:-1])
-
         self.mapper = XMLMapper(
             _XML_MAPPINGS,
             filters={
-                'datetime': datetime_filter,
-                'min_age': min_age_filter,
-            }
+                'min_age': _min_age_filter,
+            },
+            timezone=pytz.utc,
         )
 
     def add_arguments(self, parser):
         parser.add_argument('filename', nargs='+')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Parse files with this number of processes, files can '
+                 'reference objects from preceding files')
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Insert objects with bulk queries in batches of this '
+                 'size in single transaction')
 
     def handle(self, *args, **options):
-        factory = ModelsFactory()
+        if not options['batch_size']:
+            self._load(ModelsFactory(), options)
+            return
+        factory = BulkModelsFactory()
+        with transaction.atomic():
+            self._load(factory, options)
+            factory.reset_sequences()
+
+    def _load(self, factory, options):
+        if options['workers']:
+            if options['verbosity'] > 0:
+                self.stdout.write('Importing {} files ... '.format(
+                    len(options['filename'])), ending="")
+            self.mapper.load_files(
+                options['filename'], factory, workers=options['workers'],
+                batch_size=options['batch_size'])
+            if options['verbosity'] > 0:
+                self.stdout.write(self.style.SUCCESS('OK'))
+            return
+
         for filename in options['filename']:
             if options['verbosity'] > 0:
                 self.stdout.write(
                     'Importing {} ... '.format(filename), ending="")
-            self.mapper.load_file(filename, factory)
+            self.mapper.load_file(
+                filename, factory, batch_size=options['batch_size'])
             if options['verbosity'] > 0:
                 self.stdout.write(self.style.SUCCESS('OK'))
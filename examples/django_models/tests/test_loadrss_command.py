@@ -66,3 +66,17 @@ class TestLoadRSSCommand(CommandTestCase):
 
         self.assertEqual([i.url for i in e1.gallery.all()], ['img1url'])
         self.assertEqual(e2.gallery.count(), 0)
+
+    def test_loadrss_command_bulk(self):
+        management.call_command(
+            'loadrss', self.file.name, batch_size=10, verbosity=0)
+
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(Image.objects.count(), 1)
+
+        e1, e2 = Event.objects.all().order_by('id')
+        self.assertEqual(e1.title, 'item1')
+        self.assertEqual([t.word for t in e1.tags.all()], ['cat1', 'cat2'])
+        self.assertEqual([t.word for t in e2.tags.all()], ['cat2'])
+        self.assertEqual([i.url for i in e1.gallery.all()], ['img1url'])
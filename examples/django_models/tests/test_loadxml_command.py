@@ -3,7 +3,9 @@ import os
 import pytz
 from datetime import datetime
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.core import management
 
 from app.models import Event, Place, Tag, Image, Person, Membership, Session
@@ -259,3 +261,117 @@ class TestLoadXMLCommandSessions(CommandTestCase):
                          datetime(2001, 12, 23, 12, 30, tzinfo=pytz.utc))
         self.assertEqual(s3.time,
                          datetime(2001, 11, 25, 1, 30, tzinfo=pytz.utc))
+
+
+class TestLoadXMLCommandWorkers(CommandTestCase):
+    XML = TestLoadXMLCommandSessions.XML
+    SCHEDULE_XML = b'''
+        <feed>
+            <schedule>
+                <session event="11" place="11" date="2002-01-01" time="10:00"/>
+            </schedule>
+        </feed>
+    '''
+
+    def setUp(self):
+        super(TestLoadXMLCommandWorkers, self).setUp()
+        self.schedule_file = NamedTemporaryFile(delete=False)
+        self.schedule_file.write(self.SCHEDULE_XML)
+        self.schedule_file.close()
+
+    def tearDown(self):
+        super(TestLoadXMLCommandWorkers, self).tearDown()
+        os.unlink(self.schedule_file.name)
+
+    def test_loadxml_command_workers(self):
+        management.call_command(
+            'loadxml', self.file.name, self.schedule_file.name,
+            workers=2, verbosity=0)
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(Place.objects.count(), 2)
+        self.assertEqual(Session.objects.count(), 4)
+        e2 = Event.objects.get(title='event2')
+        self.assertEqual([p.title for p in e2.places.all()],
+                         ['place1', 'place2'])
+
+
+class TestLoadXMLCommandBulk(TestCase):
+    def write_feed(self, events):
+        self.file = NamedTemporaryFile(delete=False)
+        self.addCleanup(os.unlink, self.file.name)
+        self.file.write(b'<feed><events>')
+        for i in range(events):
+            self.file.write(
+                '<event id="{0}"><title>event{0}</title><text>text</text>'
+                '<tags><tag>tag{1}</tag><tag>common</tag></tags>'
+                '<gallery><image href="url{0}"/></gallery>'
+                '</event>'.format(i, i % 3).encode('ascii'))
+        self.file.write(b'</events><places>')
+        for i in range(events):
+            self.file.write(
+                '<place id="{0}" type="type"><title>place{0}</title>'
+                '<tags><tag>common</tag></tags>'
+                '<persons><person><name>person{1}</name><role>actor</role>'
+                '</person></persons></place>'.format(i, i % 2)
+                .encode('ascii'))
+        self.file.write(b'</places><schedule>')
+        for i in range(events):
+            self.file.write(
+                '<session event="{0}" place="{0}" date="2000-01-01" '
+                'time="10:00"/>'.format(i).encode('ascii'))
+        self.file.write(b'</schedule></feed>')
+        self.file.close()
+        return self.file.name
+
+    def load(self, filename):
+        with CaptureQueriesContext(connection) as queries:
+            management.call_command(
+                'loadxml', filename, batch_size=1000, verbosity=0)
+        return len(queries)
+
+    def test_loadxml_command_bulk(self):
+        small = self.load(self.write_feed(4))
+        self.assertEqual(Event.objects.count(), 4)
+        self.assertEqual(Tag.objects.count(), 4)
+        self.assertEqual(Image.objects.count(), 4)
+        self.assertEqual(Person.objects.count(), 2)
+        self.assertEqual(Membership.objects.count(), 4)
+        self.assertEqual(Session.objects.count(), 4)
+        e = Event.objects.get(title='event1')
+        self.assertEqual(sorted(t.word for t in e.tags.all()),
+                         ['common', 'tag1'])
+        self.assertEqual([i.url for i in e.gallery.all()], ['url1'])
+        self.assertEqual([p.title for p in e.places.all()], ['place1'])
+        p = Place.objects.get(title='place3')
+        self.assertEqual([t.word for t in p.tags.all()], ['common'])
+        self.assertEqual(
+            [(m.person.full_name, m.role) for m in p.members.all()],
+            [('person1', 'actor')])
+
+        # existing objects and links are reused as by default factory
+        self.load(self.write_feed(4))
+        for model in (Event, Place, Tag, Image, Membership, Session):
+            self.assertEqual(model.objects.count(), 4)
+        self.assertEqual(Person.objects.count(), 2)
+        e = Event.objects.get(title='event1')
+        self.assertEqual(e.tags.count(), 2)
+        self.assertEqual(e.gallery.count(), 1)
+        # new objects get keys after inserted ones
+        self.assertEqual(Event.objects.create(
+            title='', text='', is_paid=False, min_age=0).pk, 5)
+
+        for model in (Event, Place, Tag, Image, Person):
+            model.objects.all().delete()
+        self.assertEqual(small, self.load(self.write_feed(100)))
+        self.assertEqual(Event.objects.count(), 100)
+        self.assertEqual(Session.objects.count(), 100)
+
+    def test_loadxml_command_bulk_batches(self):
+        batch = self.load(self.write_feed(1000))
+        for model in (Event, Place, Tag, Image, Person):
+            model.objects.all().delete()
+        # queries grow with number of batches, not with number of objects
+        self.assertLessEqual(self.load(self.write_feed(2500)), 3 * batch)
+        self.assertEqual(Event.objects.count(), 2500)
+        self.assertEqual(Session.objects.count(), 2500)
+        self.assertEqual(Membership.objects.count(), 2500)
@@ -1,8 +1,20 @@
+import mmap
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from io import BytesIO
+from unittest import TestCase, skipIf
+
 import six
-from unittest import TestCase
+from lxml import etree
 
 from xmlmapper import MapperObjectFactory, XMLMapper, XMLMapperSyntaxError, \
-    XMLMapperLoadingError
+    XMLMapperLoadingError, XMLMapperStats, CachedFilter
+from xmlmapper import columnar, datetimes, incremental, index, parallel, \
+    records
 
 
 class JsonDumpFactory(MapperObjectFactory):
@@ -446,3 +458,1659 @@ class TestExampleFromClassDocstring(XMLMapperTestCase):
             ],
             data
         )
+
+
+class TestStreaming(XMLMapperTestCase):
+    MAPPINGS = [
+        {
+            '_type': 'a',
+            '_match': '/r/alist/a',
+            '_id': '@id',
+            'id': 'int: @id',
+            'c': [{
+                '_type': 'c',
+                '_match': 'c',
+                'id': '@v',
+            }],
+        }, {
+            '_type': 'b',
+            '_match': '/r/blist/b',
+            '_id': '@id',
+            'id': 'int: @id',
+        }, {
+            '_type': 'ab',
+            '_match': '/r/blist/b/aref',
+            'a': 'a: @aid',
+            'b': 'b: ../@id',
+        }
+    ]
+
+    XML = b"""
+        <r>
+            <alist>
+                <a id="10"><c v="x"/><c v="y"/></a>
+                <a id="11"></a>
+            </alist>
+            <blist>
+                <b id="20">
+                    <aref aid="10"></aref>
+                    <aref aid="11"></aref>
+                </b>
+                <b id="21"></b>
+            </blist>
+        </r>
+    """
+
+    def test_streaming_same_objects(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        data = mapper.load(self.XML, JsonDumpFactory())
+        stream_data = mapper.load(self.XML, JsonDumpFactory(), streaming=True)
+        self.assertEqual(
+            [
+                {'_type': 'c', 'id': 'x'},
+                {'_type': 'c', 'id': 'y'},
+                {'_type': 'a', 'id': 10, 'c': [('c', 'x'), ('c', 'y')]},
+                {'_type': 'a', 'id': 11, 'c': []},
+                {'_type': 'b', 'id': 20},
+                {'_type': 'ab', 'a': ('a', 10), 'b': ('b', 20)},
+                {'_type': 'ab', 'a': ('a', 11), 'b': ('b', 20)},
+                {'_type': 'b', 'id': 21},
+            ],
+            stream_data)
+        self.assertEqual(
+            sorted(data, key=repr), sorted(stream_data, key=repr))
+
+    def test_streaming_clears_records(self):
+        mapper = XMLMapper([{'_type': 'a', '_match': '/r/a', 'id': '@id'}])
+        xml = b'<r>' + b'<a id="1"><b/></a>' * 5 + b'</r>'
+        events = etree.iterparse(BytesIO(xml), events=('end',), tag='a')
+        preceding = []
+        for _, element in mapper._iter_stream_records(events):
+            preceding.append([
+                len(el) for el in element.itersiblings(preceding=True)])
+        self.assertEqual([[], [0], [0], [0], [0]], preceding)
+        self.assertEqual(1, len(element.getparent()))
+        self.assertEqual(0, len(element))
+
+    def test_streaming_root_record(self):
+        mapper = XMLMapper([{'_type': 'r', '_match': '/r', 'v': '@v'}])
+        for xml in (b'<!-- c --><?p?><r v="1"/>', b'<r v="1"/><!-- c -->'):
+            self.assertEqual([{'_type': 'r', 'v': '1'}],
+                             mapper.load(xml, JsonDumpFactory(),
+                                         streaming=True))
+
+    def test_streaming_prunes_unmapped(self):
+        mapper = XMLMapper([{'_type': 'a', '_match': '/r/alist/a'}])
+        parser = mapper._StreamParser(mapper)
+        parser.feed(b'<r><alist><a/></alist><blist>')
+        list(parser.read_events())
+        for i in range(5):
+            parser.feed(b'<b><i/></b>')
+            list(parser.read_events())
+        # completed elements are deleted before each block, only the last
+        # (possibly open) one is kept
+        root = parser._root
+        self.assertEqual(['blist'], [el.tag for el in root])
+        self.assertEqual(2, len(root[0]))
+        parser.feed(b'</blist><alist><a/>')
+        self.assertEqual([('end', 'a')], [
+            (event, el.tag) for event, el in parser.read_events()])
+        parser.feed(b'</alist></r>')
+        parser.close()
+
+    def test_streaming_root_mapping(self):
+        mapper = XMLMapper([
+            {'_type': 'r', '_match': '/r', '_id': '@id', 'id': '@id'},
+            {'_type': 'a', '_match': '/r/a', 'id': '@id', 'r': 'r: ../@id'}])
+        xml = b'<r id="1">' + b'<a id="2"><b/></a>' * 5 + b'</r>'
+        self.assertEqual(
+            [{'_type': 'r', 'id': '1'}] +
+            [{'_type': 'a', 'id': '2', 'r': ('r', '1')}] * 5,
+            mapper.load(xml, JsonDumpFactory(), streaming=True))
+
+        # root is loaded from its start tag and is not a record, so
+        # earlier records are cleared
+        parser = mapper._StreamParser(mapper)
+        parser.feed(b'<r id="1">')
+        records = list(mapper._iter_stream_records(parser.read_events()))
+        self.assertEqual(['r'], [m.mapping_type for m, _ in records])
+        for i in range(5):
+            parser.feed(b'<a id="2"><b/></a>')
+            records = list(
+                mapper._iter_stream_records(parser.read_events()))
+            self.assertEqual(['a'], [m.mapping_type for m, _ in records])
+            self.assertEqual([0], [len(el) for el in parser._root])
+        parser.feed(b'</r>')
+        parser.close()
+
+    def test_streaming_syntax_errors(self):
+        mapper = XMLMapper([{'_type': 'a', '_match': '//a'}])
+        with six.assertRaisesRegex(
+                self, XMLMapperSyntaxError, 'requires "_match"'):
+            mapper.load(b'<a/>', JsonDumpFactory(), streaming=True)
+        # root record using its content would contain whole document
+        mapper = XMLMapper([{'_type': 'a', '_match': '/r/a'},
+                            {'_type': 'r', '_match': '/r', 't': 't'}])
+        with six.assertRaisesRegex(
+                self, XMLMapperSyntaxError,
+                'whole document in memory as "_match" of type "r"'):
+            mapper.load(b'<r/>', JsonDumpFactory(), streaming=True)
+
+    def test_streaming_options(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        for kwargs in ({'single_pass': True}, {'xslt': True}):
+            with six.assertRaisesRegex(self, ValueError, 'with streaming'):
+                mapper.load(self.XML, JsonDumpFactory(), streaming=True,
+                            **kwargs)
+
+    def test_streaming_loading_errors(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        with six.assertRaisesRegex(
+                self, XMLMapperLoadingError, 'Referenced undefined'):
+            mapper.load(
+                b'<r><blist><b id="1"><aref aid="2"/></b></blist>'
+                b'<alist><a id="2"/></alist></r>',
+                JsonDumpFactory(), streaming=True)
+
+
+class TestIterLoad(XMLMapperTestCase):
+    MAPPINGS = [{
+        '_type': 'a',
+        '_match': '/r/a',
+        '_id': '@id',
+        'id': '@id',
+        'b': [{
+            '_type': 'b',
+            '_match': 'b',
+            'id': '@id',
+        }],
+    }, {
+        '_type': 'c',
+        '_match': '/r/c',
+        'a': 'a: @aid',
+    }]
+
+    XML = (b'<r><a id="1"><b id="10"/></a><a id="2"/>'
+           b'<c aid="2"/></r>')
+
+    def test_iter_load(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        self.assertEqual(
+            [
+                ('b', {'_type': 'b', 'id': '10'}),
+                ('a', {'_type': 'a', 'id': '1', 'b': [('b', '10')]}),
+                ('a', {'_type': 'a', 'id': '2', 'b': []}),
+                ('c', {'_type': 'c', 'a': ('a', '2')}),
+            ],
+            list(mapper.iter_load(self.XML, JsonDumpFactory())))
+
+    def test_iter_load_is_lazy(self):
+        created = []
+
+        class LoggingFactory(JsonDumpFactory):
+            def create(self, object_type, fields):
+                created.append(object_type)
+                return super(LoggingFactory, self).create(
+                    object_type, fields)
+
+        mapper = XMLMapper(self.MAPPINGS)
+        for streaming in (False, True):
+            del created[:]
+            objects = mapper.iter_load(
+                self.XML, LoggingFactory(), streaming=streaming)
+            self.assertEqual([], created)
+            self.assertEqual('b', next(objects)[0])
+            self.assertEqual('a', next(objects)[0])
+            self.assertEqual(['b', 'a'], created)
+            self.assertEqual(['a', 'c'], [t for t, _ in objects])
+            self.assertEqual(['b', 'a', 'a', 'c'], created)
+
+
+class TestBatchLoading(XMLMapperTestCase):
+    MAPPINGS = [{
+        '_type': 'e',
+        '_match': '/r/e',
+        '_id': '@id',
+        'id': '@id',
+    }, {
+        '_type': 'a',
+        '_match': '/r/a',
+        '_id': '@id',
+        'id': '@id',
+        'b': [{
+            '_type': 'b',
+            '_match': 'b',
+            'id': '@id',
+        }],
+        'c': {
+            '_type': 'c',
+            '_match': 'c',
+            'id': '@id',
+            'e': 'e: @eid',
+        },
+    }, {
+        '_type': 'd',
+        '_match': '/r/d',
+        'id': '@id',
+        'a': 'a: @aid',
+    }]
+
+    XML = (b'<r><e id="40"/><e id="41"/>'
+           b'<a id="1"><b id="10"/><b id="11"/><b id="12"/></a>'
+           b'<a id="2"><c id="20" eid="40"/></a>'
+           b'<a id="3"><b id="13"/><c id="21" eid="41"/></a>'
+           b'<d id="30" aid="3"/><d id="31" aid="1"/></r>')
+
+    class BatchFactory(JsonDumpFactory):
+        def __init__(self):
+            self.batches = []
+
+        def create(self, object_type, fields):
+            raise AssertionError('create should not be called')
+
+        def create_many(self, object_type, fields_list):
+            self.batches.append(
+                (object_type, [f['id'] for f in fields_list]))
+            return [JsonDumpFactory.create(self, object_type, f)
+                    for f in fields_list]
+
+    def test_batch_loading(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        expected = mapper.load(self.XML, JsonDumpFactory())
+
+        factory = self.BatchFactory()
+        data = mapper.load(self.XML, factory, batch_size=2)
+        self.assertEqual(expected, data)
+        self.assertEqual(
+            [
+                ('e', ['40', '41']),
+                ('b', ['10', '11']),
+                ('b', ['12']),
+                ('a', ['1']),
+                ('c', ['20', '21']),
+                ('b', ['13']),
+                ('a', ['2', '3']),
+                ('d', ['30', '31']),
+            ],
+            factory.batches)
+
+        factory = self.BatchFactory()
+        data = mapper.load(self.XML, factory, batch_size=100)
+        self.assertEqual(expected, data)
+        self.assertEqual(
+            [
+                ('e', ['40', '41']),
+                ('b', ['10', '11', '12', '13']),
+                ('a', ['1']),
+                ('c', ['20', '21']),
+                ('a', ['2', '3']),
+                ('d', ['30', '31']),
+            ],
+            factory.batches)
+
+    def test_batch_default_create_many(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        self.assertEqual(
+            mapper.load(self.XML, JsonDumpFactory()),
+            mapper.load(self.XML, JsonDumpFactory(), batch_size=3))
+
+    def test_batch_iter_load(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        factory = self.BatchFactory()
+        objects = mapper.iter_load(self.XML, factory, batch_size=3)
+        self.assertEqual(('e', '40'), factory._convert(next(objects)[1]))
+        self.assertEqual(
+            [('e', ['40', '41']), ('b', ['10', '11', '12']), ('a', ['1'])],
+            factory.batches)
+
+
+class TestFastXPath(XMLMapperTestCase):
+    XML = (b'<r a="1" b-c.d="2"><x>text</x><y/>'
+           b'<z>t1<i/>t2<!-- c -->t3<?p?>t4</z><w><i/></w></r>')
+
+    def test_fast_xpath_same_results(self):
+        mapper = XMLMapper([])
+        root = etree.fromstring(self.XML)
+        for xpath in ('@a', '@b-c.d', '@missing', 'text()'):
+            compiled = mapper._compile_xpath(xpath)
+            self.assertNotIsInstance(compiled, etree.XPath)
+            expected = etree.XPath(xpath, smart_strings=False)
+            for element in root.iter(tag=etree.Element):
+                self.assertEqual(expected(element), compiled(element))
+
+    def test_fast_xpath_error_message(self):
+        mapper = XMLMapper([{'_type': 'r', '_match': '/r', 'v': 'text()'}])
+        with six.assertRaisesRegex(
+                self, XMLMapperLoadingError,
+                r'XPath "text\(\)" returned multiple elements'):
+            mapper.load(b'<r>1<i/>2</r>', JsonDumpFactory())
+        with six.assertRaisesRegex(
+                self, XMLMapperLoadingError,
+                'XPath "@a" returned multiple elements'):
+            XMLMapper._XPathQuery._get_string(
+                etree.fromstring(b'<r/>'), mapper._compile_xpath('@a'),
+                ['1', '2'])
+
+    def test_fast_xpath_fallback(self):
+        mapper = XMLMapper([])
+        for xpath in ('x', '@*', '@ns:a', 'x/@a', 'text()[1]', '/r/@a'):
+            self.assertIsInstance(mapper._compile_xpath(xpath),
+                                  XMLMapper._ThreadLocalXPath)
+
+
+class TestSharedPrefix(XMLMapperTestCase):
+    MAPPINGS = [{
+        '_type': 'a',
+        '_match': '/r/a',
+        'lat': 'float: c/@lat',
+        'lon': 'float: c/@lon',
+        'text': 'c/text()',
+        'c': [{'_type': 'c', '_match': 'c', 'id': '@lat'}],
+        'title': 'title',
+    }]
+    XML = (b'<r><a><c lat="1.5" lon="2">t<i/></c><title>x</title></a>'
+           b'<a><title>y</title></a>\n'
+           b'<a><c lat="1"/><c lat="2"/></a></r>')
+
+    def test_shared_prefix_compiled(self):
+        mapping = XMLMapper(self.MAPPINGS)._types['a']
+        shared = dict((q.attr, q.shared) for q in mapping.compiled)
+        self.assertEqual({'lat': True, 'lon': True, 'text': True,
+                          'c': True, 'title': False}, shared)
+        prefixes = set(q.match.prefix if q.attr == 'c' else q.xpath.prefix
+                       for q in mapping.compiled if q.shared)
+        self.assertEqual(1, len(prefixes))
+
+    def test_shared_prefix_same_results(self):
+        root = etree.fromstring(self.XML)
+        mapping = XMLMapper(self.MAPPINGS)._types['a']
+        for element in root:
+            cache = {}
+            for query in [q for q in mapping.compiled if q.shared]:
+                xpath = query.match if query.attr == 'c' else query.xpath
+                expected = etree.XPath(str(xpath), smart_strings=False)
+                self.assertEqual(expected(element), xpath(element, cache))
+                self.assertEqual(expected(element), xpath(element))
+
+    def test_shared_prefix_load(self):
+        for codegen in (False, True):
+            mapper = XMLMapper(self.MAPPINGS, codegen=codegen)
+            with six.assertRaisesRegex(
+                    self, XMLMapperLoadingError,
+                    'XPath "c/@lat" returned multiple elements.* line 2'):
+                mapper.load(self.XML, JsonDumpFactory())
+            data = mapper.load(self.XML[:self.XML.index(b'\n')] + b'</r>',
+                               JsonDumpFactory())
+            self.assertEqual(
+                [{'_type': 'c', 'id': '1.5'},
+                 {'_type': 'a', 'lat': 1.5, 'lon': 2.0, 'text': 't',
+                  'title': 'x', 'c': [('c', '1.5')]},
+                 {'_type': 'a', 'lat': None, 'lon': None, 'text': None,
+                  'title': 'y', 'c': []}],
+                data)
+
+
+class TestSinglePass(XMLMapperTestCase):
+
+    def test_single_pass_same_objects(self):
+        mappings = TestStreaming.MAPPINGS + [{
+            '_type': 'x',
+            '_match': '//c[@v="y"]',
+            'id': '@v',
+        }, {
+            '_type': 'r',
+            '_match': '/r',
+            'id': 'count(alist/a)',
+        }]
+        mapper = XMLMapper(mappings)
+        expected = mapper.load(TestStreaming.XML, JsonDumpFactory())
+        self.assertEqual(
+            expected,
+            mapper.load(TestStreaming.XML, JsonDumpFactory(),
+                        single_pass=True))
+        self.assertEqual({'_type': 'x', 'id': 'y'}, expected[-2])
+        self.assertEqual({'_type': 'r', 'id': '2.0'}, expected[-1])
+
+    def test_single_pass_reference_order(self):
+        mapper = XMLMapper(TestStreaming.MAPPINGS)
+        self.assertEqual(
+            [
+                {'_type': 'a', 'id': 2, 'c': []},
+                {'_type': 'b', 'id': 1},
+                {'_type': 'ab', 'a': ('a', 2), 'b': ('b', 1)},
+            ],
+            mapper.load(
+                b'<r><blist><b id="1"><aref aid="2"/></b></blist>'
+                b'<alist><a id="2"/></alist></r>',
+                JsonDumpFactory(), single_pass=True))
+
+
+class TestCodegen(XMLMapperTestCase):
+
+    def assert_same_as_interpreter(self, mappings, xml, filters=None):
+        results = []
+        for codegen in (False, True):
+            mapper = XMLMapper(mappings, filters=filters, codegen=codegen)
+            try:
+                results.append(mapper.load(xml, JsonDumpFactory()))
+            except XMLMapperLoadingError as e:
+                results.append((str(e), e.element_tag, e.source_line))
+        self.assertEqual(results[0], results[1])
+        return results[1]
+
+    def test_codegen_loader_generated(self):
+        mapper = XMLMapper(TestStreaming.MAPPINGS, codegen=True)
+        for mapping in mapper._types.values():
+            self.assertIsNotNone(mapping.loader)
+        self.assertIsNone(XMLMapper(TestStreaming.MAPPINGS)._types['a'].loader)
+
+    def test_codegen_type_names(self):
+        # types named as names of generated code namespace
+        data = self.assert_same_as_interpreter([{
+            '_type': 'mapping',
+            '_match': '/r/a',
+            'string': {
+                '_type': 'string',
+                '_match': 'b',
+                'id': '@id',
+            },
+            'get_string': [{
+                '_type': 'get_string',
+                '_match': 'b',
+                'id': '@id',
+            }],
+        }], b'<r><a><b id="1"/></a><a/></r>')
+        self.assertEqual(
+            {'_type': 'mapping', 'string': ('string', '1'),
+             'get_string': [('get_string', '1')]}, data[2])
+
+    def test_codegen_same_objects(self):
+        data = self.assert_same_as_interpreter(
+            TestStreaming.MAPPINGS, TestStreaming.XML)
+        self.assertEqual(8, len(data))
+        self.assert_same_as_interpreter(
+            TestBatchLoading.MAPPINGS, TestBatchLoading.XML)
+        self.assert_same_as_interpreter(
+            [{
+                '_type': 'a',
+                '_match': '/a',
+                '_skip': 'int: @id',
+                'id': 'int: @id',
+                'b': 'bool: @b',
+                'f': 'float: n',
+                'foo': 'foo: @foo',
+                'none': 'int: @none',
+            }],
+            b'<a id="10" b="true" foo="x"><n>1.5</n></a>',
+            filters={'foo': lambda val: '+{}+'.format(val)})
+
+    MAPPINGS_WITH_ERRORS = [{
+        '_type': 'a',
+        '_match': '/r/a',
+        '_id': '@id',
+        'n': 'int: n',
+        'c': {
+            '_type': 'c',
+            '_match': 'c',
+        },
+    }, {
+        '_type': 'b',
+        '_match': '/r/b',
+        'a': 'a: @aid',
+    }]
+    XML_WITH_ERRORS = (b'<r>\n<a/></r>',
+                       b'<r><a id="1"/>\n<a id="1"/></r>',
+                       b'<r>\n<a id="1"><n>x</n></a></r>',
+                       b'<r>\n<a id="1"><n/><n/></a></r>',
+                       b'<r>\n<a id="1"><c/><c/></a></r>',
+                       b'<r><a id="1"/>\n<b aid="2"/></r>')
+
+    def test_codegen_same_errors(self):
+        for xml in self.XML_WITH_ERRORS:
+            self.assertIsInstance(self.assert_same_as_interpreter(
+                self.MAPPINGS_WITH_ERRORS, xml), tuple)
+
+
+class TestLoadFiles(XMLMapperTestCase):
+    MAPPINGS = [{
+        '_type': 'a',
+        '_match': '/r/a',
+        '_id': '@id',
+        'id': 'int: @id',
+        'b': [{
+            '_type': 'b',
+            '_match': 'b',
+            '_id': '@id',
+            'id': '@id',
+        }],
+    }, {
+        '_type': 'c',
+        '_match': '/r/c',
+        'a': 'a: @aid',
+        'b': 'b: @bid',
+    }]
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_files(self, *contents):
+        paths = []
+        for i, content in enumerate(contents):
+            path = os.path.join(self.dir, '{}.xml'.format(i))
+            with open(path, 'wb') as f:
+                f.write(content)
+            paths.append(path)
+        return paths
+
+    def test_mapper_pickle(self):
+        mapper = pickle.loads(pickle.dumps(
+            XMLMapper(self.MAPPINGS, codegen=True)))
+        self.assertIsNotNone(mapper._types['a'].loader)
+        self.assertEqual(
+            [{'_type': 'a', 'id': 1, 'b': []}],
+            mapper.load(b'<r><a id="1"/></r>', JsonDumpFactory()))
+
+    def test_load_files(self):
+        paths = self.write_files(
+            b'<r><c aid="1" bid="x"/><a id="1"><b id="x"/></a><a id="2"/>'
+            b'</r>',
+            b'<r><a id="3"><b id="y"/><b id="z"/></a>'
+            b'<c aid="2" bid="x"/><c aid="3" bid="z"/></r>',
+            b'<r><c aid="1" bid="y"/></r>')
+        self.assertEqual(
+            [
+                {'_type': 'b', 'id': 'x'},
+                {'_type': 'a', 'id': 1, 'b': [('b', 'x')]},
+                {'_type': 'a', 'id': 2, 'b': []},
+                {'_type': 'c', 'a': ('a', 1), 'b': ('b', 'x')},
+                {'_type': 'b', 'id': 'y'},
+                {'_type': 'b', 'id': 'z'},
+                {'_type': 'a', 'id': 3, 'b': [('b', 'y'), ('b', 'z')]},
+                {'_type': 'c', 'a': ('a', 2), 'b': ('b', 'x')},
+                {'_type': 'c', 'a': ('a', 3), 'b': ('b', 'z')},
+                {'_type': 'c', 'a': ('a', 1), 'b': ('b', 'y')},
+            ],
+            XMLMapper(self.MAPPINGS).load_files(
+                paths, JsonDumpFactory(), workers=2))
+
+    def test_load_files_errors(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        for contents, message, line in (
+                ((b'<r><a id="1"/></r>', b'<r>\n<a id="1"/></r>'),
+                 'Duplicate object', 2),
+                ((b'<r><a id="1"/></r>', b'<r>\n\n<c aid="2"/></r>'),
+                 'Referenced undefined', 3),
+                ((b'<r><a id="1"/></r>', b'<r>\n<a id="x"/></r>'),
+                 'Invalid literal', 2)):
+            paths = self.write_files(*contents)
+            with six.assertRaisesRegex(self, XMLMapperLoadingError, message):
+                try:
+                    mapper.load_files(paths, JsonDumpFactory(), workers=2)
+                except XMLMapperLoadingError as e:
+                    self.assertEqual(('a' if line != 3 else 'c', line),
+                                     (e.element_tag, e.source_line))
+                    raise
+
+
+class TestSplit(XMLMapperTestCase):
+    MAPPINGS = TestLoadFiles.MAPPINGS
+    XML = (b'<?xml version="1.0"?>\n'
+           b'<!-- <r><a id="9"/></r> -->\n'
+           b'<r>\n'
+           b'  <a id="1"><b id="x"/></a>\n'
+           b'  <c aid="1" bid="y"/>\n'
+           b'  <a id="2"><b id="y"/><b id="z"/></a>\n'
+           b'  <a id="3"/>\n'
+           b'  <c aid="3" bid="x"/>\n'
+           b'  <a id="4"><![CDATA[</a>]]><b id="w"/></a>\n'
+           b'</r>\n')
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.min_chunk_size = parallel.MIN_CHUNK_SIZE
+        parallel.MIN_CHUNK_SIZE = 1
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        parallel.MIN_CHUNK_SIZE = self.min_chunk_size
+
+    def write_file(self, content):
+        path = os.path.join(self.dir, 'split.xml')
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_scan_chunks(self):
+        root_start, chunks = parallel._scan_chunks(self.XML, ['r', 'a'], 50)
+        self.assertEqual(self.XML.index(b'<r>\n'), root_start)
+        self.assertEqual(
+            [(b'<a id="1"><b id="x"/></a>', (b'<r>',)),
+             (b'<a id="2"><b id="y"/><b id="z"/></a>\n  <a id="3"/>',
+              (b'<r>',)),
+             (b'<a id="4"><![CDATA[</a>]]><b id="w"/></a>', (b'<r>',))],
+            [(self.XML[start:end], ancestors)
+             for start, end, ancestors in chunks])
+
+    def test_scan_chunks_skip(self):
+        # x and first a are skipped, other records have content that
+        # has to be scanned
+        xml = (b'<r><x><a id="9"/></x><a id="1"><b/></a>'
+               b'<a id="2"><a/></a><a id="3"><!-- </a> --></a>'
+               b'<a id="4"><?pi </a>?></a></r>')
+        self.assertEqual(
+            [(b'<a id="1"><b/></a><a id="2"><a/></a><a id="3">'
+              b'<!-- </a> --></a><a id="4"><?pi </a>?></a>', (b'<r>',))],
+            [(xml[start:end], ancestors) for start, end, ancestors in
+             parallel._scan_chunks(xml, ['r', 'a'], 1000)[1]])
+
+    def test_split_encoding(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        for xml in (self.XML.decode('ascii').encode('utf-16'),
+                    self.XML.replace(b'?>', b' encoding="UTF-16"?>', 1),
+                    self.XML.replace(b'?>', b' encoding="cp037"?>', 1)):
+            path = self.write_file(xml)
+            with six.assertRaisesRegex(self, ValueError,
+                                       'ASCII compatible encoding'):
+                mapper.load_file(path, JsonDumpFactory(), split='/r/a')
+        xml = self.XML.replace(b'?>', b' encoding="ISO-8859-1"?>', 1)
+        self.assertEqual(
+            mapper.load(xml, JsonDumpFactory()),
+            mapper.load_file(self.write_file(xml), JsonDumpFactory(),
+                             split='/r/a', workers=2))
+
+    def test_split(self):
+        path = self.write_file(self.XML)
+        mapper = XMLMapper(self.MAPPINGS)
+        expected = mapper.load(self.XML, JsonDumpFactory())
+        self.assertEqual(
+            expected,
+            mapper.load_file(path, JsonDumpFactory(), split='/r/a',
+                             workers=2))
+        self.assertEqual(
+            expected,
+            mapper.load_file(path, JsonDumpFactory(), split='/r/a',
+                             workers=2, batch_size=2))
+
+    def test_split_other_parents(self):
+        xml = (b'<r><g><a id="1"/><a id="2"/></g><c aid="2" bid="x"/>'
+               b'<g><a id="3"><b id="x"/></a></g></r>')
+        path = self.write_file(xml)
+        mappings = [dict(self.MAPPINGS[0], _match='/r/g/a'), self.MAPPINGS[1]]
+        mapper = XMLMapper(mappings)
+        self.assertEqual(
+            mapper.load(xml, JsonDumpFactory()),
+            mapper.load_file(path, JsonDumpFactory(), split='/r/g/a',
+                             workers=2))
+
+    def test_split_other_siblings(self):
+        xml = (b'<r><a id="1"/><c aid="1" bid="x"/><a id="2"><b id="x"/>'
+               b'</a><!-- c --><c aid="2" bid="x"/><a id="3"/></r>')
+        path = self.write_file(xml)
+        self.assertEqual(
+            [(b'<a id="1"/>', (b'<r>',)),
+             (b'<a id="2"><b id="x"/></a>', (b'<r>',)),
+             (b'<a id="3"/>', (b'<r>',))],
+            [(xml[start:end], ancestors) for start, end, ancestors in
+             parallel._scan_chunks(xml, ['r', 'a'], 1000)[1]])
+        mapper = XMLMapper(self.MAPPINGS)
+        expected = mapper.load(xml, JsonDumpFactory())
+        self.assertEqual(6, len(expected))
+        self.assertEqual(
+            expected,
+            mapper.load_file(path, JsonDumpFactory(), split='/r/a',
+                             workers=2))
+
+    def test_split_mappings_not_routed(self):
+        path = self.write_file(self.XML)
+        for match in ('//c', '/r'):
+            mapper = XMLMapper([self.MAPPINGS[0], dict(
+                self.MAPPINGS[1], _match=match)])
+            with six.assertRaisesRegex(self, ValueError, match):
+                mapper.load_file(path, JsonDumpFactory(), split='/r/a')
+
+    def test_split_errors(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        for xml, message, tag, line in (
+                (b'<r>\n<a id="1"/>\n\n<a id="1"/></r>',
+                 'Duplicate object', 'a', 4),
+                (b'<r>\n<a id="1"/>\n<a id="x"/></r>',
+                 'Invalid literal', 'a', 3),
+                (b'<r>\n<a id="1"/>\n\n<c aid="2"/></r>',
+                 'Referenced undefined', 'c', 4)):
+            path = self.write_file(xml)
+            with six.assertRaisesRegex(self, XMLMapperLoadingError, message):
+                try:
+                    mapper.load_file(path, JsonDumpFactory(), split='/r/a',
+                                     workers=2)
+                except XMLMapperLoadingError as e:
+                    self.assertEqual((tag, line),
+                                     (e.element_tag, e.source_line))
+                    raise
+
+    def test_split_path(self):
+        path = self.write_file(self.XML)
+        with self.assertRaises(ValueError):
+            XMLMapper(self.MAPPINGS).load_file(
+                path, JsonDumpFactory(), split='r/a')
+
+    def test_split_options(self):
+        path = self.write_file(self.XML)
+        for kwargs in ({'streaming': True}, {'single_pass': True},
+                       {'use_mmap': True}, {'defer_conversion': True},
+                       {'defer_conversion': True, 'batch_size': 2},
+                       {'stats': XMLMapperStats()}):
+            with six.assertRaisesRegex(self, ValueError, 'with split'):
+                XMLMapper(self.MAPPINGS).load_file(
+                    path, JsonDumpFactory(), split='/r/a', **kwargs)
+        with six.assertRaisesRegex(self, ValueError,
+                                   'workers requires split'):
+            XMLMapper(self.MAPPINGS).load_file(
+                path, JsonDumpFactory(), workers=2)
+
+
+@skipIf(six.PY2, 'asyncio is not available')
+class TestLoadStream(XMLMapperTestCase):
+    MAPPINGS = TestStreaming.MAPPINGS
+    XML = TestStreaming.XML
+
+    class AsyncFactory(JsonDumpFactory):
+        def __init__(self):
+            self.types = []
+
+        async def create(self, object_type, fields):
+            import asyncio
+            await asyncio.sleep(0)
+            self.types.append(object_type)
+            return super(TestLoadStream.AsyncFactory, self).create(
+                object_type, fields)
+
+    def iter_chunks(self, xml, size):
+        async def chunks():
+            for i in range(0, len(xml), size):
+                yield xml[i:i + size]
+        return chunks()
+
+    def load_stream(self, *streams):
+        import asyncio
+
+        async def load_all():
+            return await asyncio.gather(*(
+                XMLMapper(self.MAPPINGS).load_stream(chunks, factory)
+                for chunks, factory in streams))
+        return asyncio.run(load_all())
+
+    def test_load_stream(self):
+        expected = XMLMapper(self.MAPPINGS).load(
+            self.XML, JsonDumpFactory(), streaming=True)
+        for size in (1, 7, len(self.XML)):
+            self.assertEqual(
+                [expected],
+                self.load_stream(
+                    (self.iter_chunks(self.XML, size), JsonDumpFactory())))
+
+    def test_load_stream_async_factory(self):
+        expected = XMLMapper(self.MAPPINGS).load(
+            self.XML, JsonDumpFactory(), streaming=True)
+        factories = [self.AsyncFactory(), self.AsyncFactory()]
+        self.assertEqual(
+            [expected, expected],
+            self.load_stream(
+                (self.iter_chunks(self.XML, 5), factories[0]),
+                (self.iter_chunks(memoryview(self.XML), 11), factories[1])))
+        self.assertEqual(['c', 'c', 'a', 'a', 'b', 'ab', 'ab', 'b'],
+                         factories[0].types)
+
+    def test_load_stream_root_record(self):
+        self.MAPPINGS = [{'_type': 'r', '_match': '/r', 'v': '@v'}]
+        self.assertEqual(
+            [[{'_type': 'r', 'v': '1'}]],
+            self.load_stream((self.iter_chunks(
+                b'<!-- c --><r v="1"/>', 4), JsonDumpFactory())))
+
+    def test_load_stream_errors(self):
+        with six.assertRaisesRegex(self, XMLMapperLoadingError,
+                                   'Referenced undefined'):
+            self.load_stream((self.iter_chunks(
+                b'<r><blist><b id="1"><aref aid="2"/></b></blist></r>', 3),
+                self.AsyncFactory()))
+
+
+class TestStats(XMLMapperTestCase):
+    MAPPINGS = [{
+        '_type': 'a',
+        '_match': '/r/a',
+        '_id': '@id',
+        'id': 'int: @id',
+        'name': 'upper: name',
+        'b': [{
+            '_type': 'b',
+            '_match': 'b',
+            'id': '@id',
+        }],
+    }, {
+        '_type': 'c',
+        '_match': '/r/c',
+        'a': 'a: @aid',
+    }]
+    FILTERS = {'upper': lambda v: v.upper() if v else v}
+    XML = (b'<r><a id="1"><name>x</name><b id="1"/><b id="2"/></a>'
+           b'<a id="2"/><c aid="1"/><c aid="2"/><c aid="1"/></r>')
+
+    def test_stats(self):
+        for codegen in (False, True):
+            mapper = XMLMapper(self.MAPPINGS, self.FILTERS, codegen=codegen)
+            stats = XMLMapperStats()
+            self.assertEqual(
+                mapper.load(self.XML, JsonDumpFactory()),
+                mapper.load(self.XML, JsonDumpFactory(), stats=stats))
+            self.assertEqual(
+                {'a': (2, 2), 'b': (2, 2), 'c': (3, 3)},
+                dict((k, (s.matches, s.objects))
+                     for k, s in stats.mappings.items()))
+            self.assertEqual(
+                {('a', '_id'): 2, ('a', 'id'): 2, ('a', 'name'): 2,
+                 ('b', 'id'): 2, ('c', 'a'): 3},
+                dict((k, s.evaluations) for k, s in stats.queries.items()))
+            self.assertGreater(stats.queries['a', 'name'].filter_time, 0)
+            self.assertEqual(0, stats.queries['a', 'name'].convert_time)
+            self.assertEqual(7, stats.factory_calls)
+            self.assertGreaterEqual(stats.total_time, stats.factory_time)
+            self.assertEqual(1 + 3 + 5, len(stats.report().split('\n')))
+
+    def test_stats_batch(self):
+        mapper = XMLMapper(self.MAPPINGS, self.FILTERS)
+        stats = XMLMapperStats()
+        mapper.load(self.XML, JsonDumpFactory(), stats=stats, batch_size=10)
+        self.assertEqual(3, stats.factory_calls)
+        self.assertEqual(3, stats.mappings['c'].objects)
+
+
+class TestBufferLoading(XMLMapperTestCase):
+    MAPPINGS = TestStreaming.MAPPINGS
+    XML = TestStreaming.XML
+
+    def setUp(self):
+        self.file = tempfile.NamedTemporaryFile(delete=False)
+        self.file.write(self.XML)
+        self.file.close()
+
+    def tearDown(self):
+        os.unlink(self.file.name)
+
+    def test_load_buffers(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        mapper.BUFFER_FEED_SIZE = 7
+        with open(self.file.name, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for streaming in (False, True):
+                expected = mapper.load(
+                    self.XML, JsonDumpFactory(), streaming=streaming)
+                for xml in (bytearray(self.XML), memoryview(self.XML),
+                            data):
+                    self.assertEqual(
+                        expected, mapper.load(xml, JsonDumpFactory(),
+                                              streaming=streaming))
+        finally:
+            data.close()
+
+    def test_load_invalid_buffer(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        mapper.BUFFER_FEED_SIZE = 7
+        with self.assertRaises(etree.XMLSyntaxError):
+            mapper.load(bytearray(self.XML[:40]), JsonDumpFactory())
+        self.assertEqual(
+            mapper.load(self.XML, JsonDumpFactory()),
+            mapper.load(bytearray(self.XML), JsonDumpFactory()))
+
+    def test_load_file_mmap(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        for options in ({}, {'streaming': True}, {'single_pass': True}):
+            self.assertEqual(
+                mapper.load_file(self.file.name, JsonDumpFactory(),
+                                 **options),
+                mapper.load_file(self.file.name, JsonDumpFactory(),
+                                 use_mmap=True, **options))
+
+
+class TestLoadTree(XMLMapperTestCase):
+    XML = TestStreaming.XML
+
+    def test_load_tree(self):
+        mappers = [XMLMapper(TestStreaming.MAPPINGS),
+                   XMLMapper(TestStreaming.MAPPINGS[1:2])]
+        tree = mappers[0].parse(BytesIO(self.XML))
+        xml = etree.tostring(tree)
+        for mapper in mappers:
+            expected = mapper.load(self.XML, JsonDumpFactory())
+            self.assertEqual(expected,
+                             mapper.load_tree(tree, JsonDumpFactory()))
+            self.assertEqual(expected,
+                             mapper.load_tree(tree.getroot(),
+                                              JsonDumpFactory()))
+            self.assertEqual(expected,
+                             mapper.load_tree(tree, JsonDumpFactory(),
+                                              single_pass=True))
+        self.assertEqual(xml, etree.tostring(tree))
+
+    def test_parse_mmap(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(self.XML)
+        try:
+            mapper = XMLMapper(TestStreaming.MAPPINGS)
+            self.assertEqual(
+                etree.tostring(mapper.parse(f.name)),
+                etree.tostring(mapper.parse(f.name, use_mmap=True)))
+        finally:
+            os.unlink(f.name)
+
+
+class TestParserOptions(XMLMapperTestCase):
+    MAPPINGS = [{
+        '_type': 'r',
+        '_match': '/r',
+        'nodes': 'float: count(node())',
+    }]
+    XML = b'<r><!-- comment --><?pi?><a/></r>'
+
+    def test_parser_options(self):
+        for options, nodes in (
+                (None, 3),
+                ({'remove_comments': True}, 2),
+                ({'remove_comments': True, 'remove_pis': True}, 1)):
+            mapper = XMLMapper(self.MAPPINGS, parser_options=options)
+            for streaming in (False, True):
+                self.assertEqual(
+                    [{'_type': 'r', 'nodes': nodes}],
+                    mapper.load(self.XML, JsonDumpFactory(),
+                                streaming=streaming))
+            mapper = pickle.loads(pickle.dumps(mapper))
+            self.assertEqual([{'_type': 'r', 'nodes': nodes}],
+                             mapper.load(self.XML, JsonDumpFactory()))
+
+    def test_parser_options_streaming_file(self):
+        mapper = XMLMapper(self.MAPPINGS, parser_options={
+            'ns_clean': True, 'remove_comments': True})
+        fd, path = tempfile.mkstemp(suffix='.xml')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.XML)
+            for xml_file in (path, BytesIO(self.XML)):
+                self.assertEqual(
+                    [{'_type': 'r', 'nodes': 2}],
+                    mapper.load_file(xml_file, JsonDumpFactory(),
+                                     streaming=True))
+        finally:
+            os.remove(path)
+
+    def test_parser_options_invalid(self):
+        with self.assertRaises(TypeError):
+            XMLMapper(self.MAPPINGS, parser_options={'no_such_option': 1})
+
+    def test_parser_per_thread(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        parsers = [mapper._get_parser()]
+        thread = threading.Thread(
+            target=lambda: parsers.append(mapper._get_parser()))
+        thread.start()
+        thread.join()
+        self.assertIs(parsers[0], mapper._get_parser())
+        self.assertIsNot(parsers[0], parsers[1])
+
+
+class TestThreads(XMLMapperTestCase):
+
+    def test_threads(self):
+        mapper = XMLMapper(TestStreaming.MAPPINGS + [{
+            '_type': 'x',
+            '_match': '//c[@v="y"]',
+            'id': 'concat(@v, count(../c))',
+        }])
+        expected = mapper.load(TestStreaming.XML, JsonDumpFactory())
+        errors = []
+
+        def load():
+            try:
+                for i in range(200):
+                    self.assertEqual(
+                        expected,
+                        mapper.load(TestStreaming.XML, JsonDumpFactory(),
+                                    single_pass=bool(i % 2)))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=load) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+
+
+class TestIncremental(XMLMapperTestCase):
+    MAPPINGS = [{
+        '_type': 'a',
+        '_match': '/r/alist/a',
+        '_id': '@id',
+        'id': '@id',
+        'v': '@v',
+    }, {
+        '_type': 'c',
+        '_match': '/r/clist/c',
+        'a': 'a: @aid',
+    }]
+    XML = (b'<r><alist><a id="1" v="x"/><a id="2" v="y"/></alist>'
+           b'<clist><c aid="1"/><c aid="2"/></clist></r>')
+
+    class LookupFactory(JsonDumpFactory):
+        def __init__(self, objects):
+            self.objects = objects
+
+        def create(self, object_type, fields):
+            obj = super(TestIncremental.LookupFactory, self).create(
+                object_type, fields)
+            if 'id' in obj:
+                self.objects[object_type, obj['id']] = obj
+            return obj
+
+        def lookup(self, object_type, obj_id):
+            return self.objects.get((object_type, obj_id))
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.objects = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def load(self, xml, **kwargs):
+        store = incremental.FingerprintStore(
+            os.path.join(self.dir, 'fingerprints.db'))
+        try:
+            return XMLMapper(self.MAPPINGS).load(
+                xml, self.LookupFactory(self.objects), incremental=store,
+                **kwargs), (store.loaded, store.skipped)
+        finally:
+            store.close()
+
+    def test_incremental(self):
+        for streaming in (False, True):
+            self.objects.clear()
+            shutil.rmtree(self.dir)
+            os.mkdir(self.dir)
+            self.assertEqual(
+                (XMLMapper(self.MAPPINGS).load(self.XML, JsonDumpFactory()),
+                 (4, 0)),
+                self.load(self.XML, streaming=streaming))
+            self.assertEqual(([], (0, 4)),
+                             self.load(self.XML, streaming=streaming))
+            self.assertEqual(
+                ([{'_type': 'a', 'id': '2', 'v': 'z'},
+                  {'_type': 'c', 'a': ('a', '1')}], (2, 3)),
+                self.load(self.XML.replace(b'v="y"', b'v="z"').replace(
+                    b'</clist>', b'<c aid="1" x=""/></clist>'),
+                    streaming=streaming))
+            # changed record is loaded again after being replaced back
+            self.assertEqual(
+                ([{'_type': 'a', 'id': '2', 'v': 'y'}], (1, 3)),
+                self.load(self.XML, streaming=streaming, batch_size=2))
+
+    def test_incremental_failed_load(self):
+        self.load(self.XML)
+        with six.assertRaisesRegex(self, XMLMapperLoadingError,
+                                   'Referenced undefined'):
+            self.load(self.XML.replace(b'v="x"', b'v="w"').replace(
+                b'</clist>', b'<c aid="3"/></clist>'))
+        self.assertEqual(([], (0, 4)), self.load(self.XML))
+
+    def test_incremental_context(self):
+        self.MAPPINGS = TestIncremental.MAPPINGS + [{
+            '_type': 'p',
+            '_match': '/r/alist/a/p',
+            'a': 'a: ../@id',
+            'name': '@name',
+        }]
+        xml = (b'<r><alist><a id="1" v="x"><p name="n"/></a>'
+               b'<a id="2" v="y"><p name="n"/><p name="n"/></a></alist></r>')
+        self.assertEqual((5, 0), self.load(xml)[1])
+        # identical records under different parents are all skipped
+        self.assertEqual(([], (0, 5)), self.load(xml))
+        # record moved to other parent is loaded
+        moved = xml.replace(b'v="x"><p name="n"/>', b'v="x">').replace(
+            b'</a></alist>', b'<p name="n"/></a></alist>')
+        self.assertEqual(
+            ([{'_type': 'p', 'a': ('a', '2'), 'name': 'n'}], (1, 4)),
+            self.load(moved))
+        self.assertEqual(([], (0, 5)), self.load(moved))
+
+
+class TestColumnar(XMLMapperTestCase):
+    MAPPINGS = [{
+        '_type': 'a',
+        '_match': '/r/a',
+        '_id': '@id',
+        'id': 'int: @id',
+        'weight': 'float: @w',
+        'active': 'bool: @active',
+        'name': 'name',
+        'upper': 'upper: name',
+        'b': [{
+            '_type': 'b',
+            '_match': 'b',
+            'v': '@v',
+        }],
+        'c': {
+            '_type': 'c',
+            '_match': 'c',
+            'v': 'int: @v',
+        },
+    }, {
+        '_type': 'd',
+        '_match': '/r/d',
+        'a': 'a: @aid',
+    }]
+    XML = (b'<r><a id="1" w="0.5" active="true"><name>x</name>'
+           b'<b v="p"/><b v="q"/><c v="7"/></a>'
+           b'<a id="2"><name>x</name></a>'
+           b'<d aid="2"/><d aid="1"/></r>')
+
+    def test_columnar(self):
+        mapper = XMLMapper(self.MAPPINGS,
+                           filters={'upper': lambda v: v.upper()})
+        for batch_size in (None, 2):
+            factory = columnar.ColumnarFactory(mapper)
+            self.assertEqual(
+                [0, 1, 0, 0, 1, 0, 1],
+                mapper.load(self.XML, factory, batch_size=batch_size))
+            a = factory.tables['a']
+            self.assertEqual(2, len(a))
+            self.assertEqual(
+                {'id': 1, 'weight': 0.5, 'active': True, 'name': 'x',
+                 'upper': 'X', 'b': [0, 1], 'c': 0},
+                a.row(0))
+            self.assertEqual(
+                {'id': 2, 'weight': None, 'active': None, 'name': 'x',
+                 'upper': 'X', 'b': [], 'c': None},
+                a.row(1))
+            self.assertEqual('q', a.columns['id'].values.typecode)
+            self.assertEqual('d', a.columns['weight'].values.typecode)
+            self.assertEqual([1, 0], list(a.columns['active'].values))
+            self.assertIs(a.columns['name'][0], a.columns['name'][1])
+            self.assertEqual([0, 2, 2], list(a.columns['b'].offsets))
+            self.assertEqual(['p', 'q'],
+                             factory.tables['b'].columns['v'].values)
+            self.assertEqual([1, 0],
+                             list(factory.tables['d'].columns['a'].values))
+
+
+class TestRecordFactory(XMLMapperTestCase):
+    MAPPINGS = TestColumnar.MAPPINGS + [{
+        '_type': 'e',
+        '_match': '/r/d',
+        '#a': 'a: @aid',
+    }]
+    XML = TestColumnar.XML
+    FILTERS = {'upper': lambda v: v.upper()}
+
+    class FieldsFactory(MapperObjectFactory):
+        def create(self, object_type, fields):
+            return fields
+
+    def test_records(self):
+        mapper = XMLMapper(self.MAPPINGS, filters=self.FILTERS)
+
+        def as_dict(value):
+            if isinstance(value, tuple):
+                return dict(
+                    (k, as_dict(v)) for k, v in
+                    zip(mapper.fields(type(value).__name__), value))
+            if isinstance(value, list):
+                return [as_dict(v) for v in value]
+            return value
+
+        for kwargs in ({}, {'batch_size': 2}, {'streaming': True}):
+            loaded = mapper.load(self.XML, records.RecordFactory(mapper),
+                                 **kwargs)
+            self.assertEqual(
+                mapper.load(self.XML, self.FieldsFactory(), **kwargs),
+                as_dict(loaded))
+        a = loaded[3]
+        self.assertEqual((1, 'x', 0.5), (a.id, a.name, a.weight))
+        self.assertEqual(['p', 'q'], [b.v for b in a.b])
+        self.assertIs(a, loaded[-1][0])
+        self.assertFalse(hasattr(a, '__dict__'))
+
+    def test_record_class_names(self):
+        mapper = XMLMapper([
+            {'_type': '1a', '_match': '/r', 'v': '@v'},
+            {'_type': 'b-c', '_match': '/r', 'v': '@v'},
+            {'_type': 'class', '_match': '/r', 'v': '@v'},
+        ])
+        factory = records.RecordFactory(mapper)
+        self.assertEqual(
+            ['Record_1a', 'b_c', 'Record_class'],
+            [factory.classes[t].__name__ for t in ('1a', 'b-c', 'class')])
+        self.assertEqual(
+            [('x',)] * 3, [tuple(r) for r in mapper.load(
+                b'<r v="x"/>', factory)])
+
+
+class TestDeferConversion(XMLMapperTestCase):
+    MAPPINGS = TestColumnar.MAPPINGS
+    XML = TestColumnar.XML
+    FILTERS = TestRecordFactory.FILTERS
+
+    def test_defer_conversion(self):
+        for codegen in (False, True):
+            mapper = XMLMapper(self.MAPPINGS, filters=self.FILTERS,
+                               codegen=codegen)
+            factory = TestRecordFactory.FieldsFactory()
+            expected = mapper.load(self.XML, factory)
+            for batch_size in (1, 2, 100):
+                self.assertEqual(
+                    expected,
+                    mapper.load(self.XML, factory, batch_size=batch_size,
+                                defer_conversion=True))
+            columns = columnar.ColumnarFactory(mapper)
+            mapper.load(self.XML, columns, batch_size=100,
+                        defer_conversion=True)
+            self.assertEqual([1, 2],
+                             list(columns.tables['a'].columns['id'].values))
+
+    def test_defer_conversion_error(self):
+        xml = self.XML.replace(b'<a id="2">', b'\n<a id="2" w="x">')
+        for codegen in (False, True):
+            mapper = XMLMapper(self.MAPPINGS, filters=self.FILTERS,
+                               codegen=codegen)
+            with six.assertRaisesRegex(
+                    self, XMLMapperLoadingError,
+                    r'Invalid literal for float: "x"\. In element "a" line 2'):
+                mapper.load(xml, TestRecordFactory.FieldsFactory(),
+                            batch_size=100, defer_conversion=True)
+
+    def test_defer_conversion_requires_batch(self):
+        mapper = XMLMapper(self.MAPPINGS, filters=self.FILTERS)
+        with self.assertRaises(ValueError):
+            mapper.load(self.XML, TestRecordFactory.FieldsFactory(),
+                        defer_conversion=True)
+
+    def test_convert_many(self):
+        class ConvertingFactory(TestRecordFactory.FieldsFactory):
+            calls = []
+
+            def convert_many(self, value_type, values, convert):
+                self.calls.append((value_type, values))
+                return [convert(v) for v in values]
+
+        mapper = XMLMapper(self.MAPPINGS, filters=self.FILTERS)
+        factory = ConvertingFactory()
+        mapper.load(self.XML, factory, batch_size=100, defer_conversion=True,
+                    stats=XMLMapperStats())
+        self.assertIn(('int', ['1', '2']), factory.calls)
+        self.assertIn(('float', ['0.5']), factory.calls)
+
+
+class TestIndex(XMLMapperTestCase):
+    MAPPINGS = TestIncremental.MAPPINGS
+    XML = TestIncremental.XML
+
+    class CountingFactory(TestIncremental.LookupFactory):
+        def __init__(self, objects):
+            TestIncremental.LookupFactory.__init__(self, objects)
+            self.lookups = []
+
+        def lookup(self, object_type, obj_id):
+            self.lookups.append(obj_id)
+            return TestIncremental.LookupFactory.lookup(
+                self, object_type, obj_id)
+
+    def test_index(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        expected = mapper.load(self.XML, JsonDumpFactory())
+        ids = index.SqliteIndex(cache_size=1)
+        try:
+            for kwargs in ({}, {'batch_size': 1}, {'batch_size': 10},
+                           {'streaming': True}):
+                factory = self.CountingFactory({})
+                self.assertEqual(expected, mapper.load(
+                    self.XML, factory, index=ids, **kwargs))
+                # "1" was evicted by "2" and then "2" by "1", unless
+                # their creation is pending
+                self.assertEqual(
+                    [] if kwargs.get('batch_size') == 10 else ['1', '2'],
+                    factory.lookups)
+        finally:
+            ids.close()
+
+    def test_index_handle(self):
+        class RowFactory(MapperObjectFactory):
+            def __init__(self):
+                self.rows = []
+                self.resolved = []
+
+            def create(self, object_type, fields):
+                self.rows.append(dict(fields, _type=object_type))
+                return self.rows[-1]
+
+            def handle(self, object_type, obj):
+                return self.rows.index(obj)
+
+            def resolve(self, object_type, handle):
+                self.resolved.append(handle)
+                return self.rows[handle]
+
+        mappings = [{
+            '_type': 'a',
+            '_match': '/r/alist/a',
+            '_id': '@id',
+            'v': '@v',
+        }, TestIncremental.MAPPINGS[1]]
+        mapper = XMLMapper(mappings)
+        ids = index.SqliteIndex(cache_size=1)
+        try:
+            for kwargs in ({}, {'batch_size': 1}, {'streaming': True}):
+                factory = RowFactory()
+                objects = mapper.load(self.XML, factory, index=ids,
+                                      **kwargs)
+                self.assertEqual(['x', 'y'],
+                                 [obj['a']['v'] for obj in objects[2:]])
+                self.assertEqual([0, 1], factory.resolved)
+        finally:
+            ids.close()
+
+    def test_index_incremental(self):
+        class RowFactory(self.CountingFactory):
+            def __init__(self, objects):
+                TestIndex.CountingFactory.__init__(self, objects)
+                self.rows = []
+                self.resolved = []
+
+            def create(self, object_type, fields):
+                obj = TestIndex.CountingFactory.create(
+                    self, object_type, fields)
+                self.rows.append(obj)
+                return obj
+
+            def handle(self, object_type, obj):
+                return self.rows.index(obj)
+
+            def resolve(self, object_type, handle):
+                self.resolved.append(handle)
+                return self.rows[handle]
+
+        tmp = tempfile.mkdtemp()
+        store = incremental.FingerprintStore(
+            os.path.join(tmp, 'fingerprints.db'))
+        ids = index.SqliteIndex(cache_size=1)
+        try:
+            mapper = XMLMapper(self.MAPPINGS)
+            objects = {}
+            factory = RowFactory(objects)
+            self.assertEqual(4, len(mapper.load(
+                self.XML, factory, incremental=store, index=ids)))
+            # evicted objects are resolved by handle
+            self.assertEqual(([], [0, 1]),
+                             (factory.lookups, factory.resolved))
+            factory = RowFactory(objects)
+            self.assertEqual(
+                [{'_type': 'c', 'a': ('a', '1')}],
+                mapper.load(self.XML.replace(
+                    b'</clist>', b'<c aid="1" x=""/></clist>'),
+                    factory, incremental=store, index=ids))
+            # skipped objects are looked up by id
+            self.assertEqual((['1'], []),
+                             (factory.lookups, factory.resolved))
+        finally:
+            ids.close()
+            store.close()
+            shutil.rmtree(tmp)
+
+    def test_index_errors(self):
+        mapper = XMLMapper(self.MAPPINGS)
+        ids = index.SqliteIndex(cache_size=1)
+        try:
+            with six.assertRaisesRegex(self, XMLMapperLoadingError,
+                                       'Duplicate object with id "1"'):
+                mapper.load(self.XML.replace(b'id="2"', b'id="1"'),
+                            self.CountingFactory({}), index=ids)
+            factory = self.CountingFactory({})
+            with six.assertRaisesRegex(self, XMLMapperLoadingError,
+                                       'Referenced undefined "a" object '
+                                       'with id "3"'):
+                mapper.load(self.XML.replace(b'aid="2"', b'aid="3"'),
+                            factory, index=ids)
+            self.assertEqual(['1'], factory.lookups)
+        finally:
+            ids.close()
+
+
+class TestCachedFilter(XMLMapperTestCase):
+    MAPPINGS = [{
+        '_type': 'a',
+        '_match': '/r/a',
+        'v': 'upper: @v',
+    }]
+    XML = b'<r><a v="x"/><a v="y"/><a v="x"/><a/><a v="z"/><a v="x"/></r>'
+
+    def test_cached_filter(self):
+        calls = []
+
+        def upper(value):
+            calls.append(value)
+            return value and value.upper()
+
+        for codegen in (False, True):
+            del calls[:]
+            upper_filter = CachedFilter(upper, maxsize=2)
+            mapper = XMLMapper(self.MAPPINGS, filters={'upper': upper_filter},
+                               codegen=codegen)
+            self.assertEqual(
+                ['X', 'Y', 'X', None, 'Z', 'X'],
+                [a['v'] for a in mapper.load(self.XML, JsonDumpFactory())])
+            # "x" was evicted by None and "z"
+            self.assertEqual(['x', 'y', None, 'z', 'x'], calls)
+            self.assertEqual((1, 5),
+                             (upper_filter.hits, upper_filter.misses))
+            upper_filter.cache_clear()
+            self.assertEqual('X', upper_filter('x'))
+            self.assertEqual((0, 1),
+                             (upper_filter.hits, upper_filter.misses))
+
+    def test_cached_filter_pickle(self):
+        upper_filter = CachedFilter(str.upper, maxsize=10)
+        upper_filter('x')
+        mapper = pickle.loads(pickle.dumps(
+            XMLMapper(self.MAPPINGS, filters={'upper': upper_filter})))
+        self.assertEqual(['X', 'Y'], [a['v'] for a in mapper.load(
+            self.XML.replace(b'<a/>', b''), JsonDumpFactory())][:2])
+        upper_filter = mapper._filters['upper']
+        self.assertEqual((10, 3), (upper_filter.maxsize,
+                                   upper_filter.misses))
+
+
+class TestDateTimeTypes(XMLMapperTestCase):
+    MAPPINGS = [{
+        '_type': 'a',
+        '_match': '/r/a',
+        'dt': 'datetime: @dt',
+        'd': 'date: @d',
+        't': 'time: @t',
+        'fdt': 'datetime(%d.%m.%y %H:%M): @fdt',
+        'fd': 'date(%d.%m.%y): @fd',
+        'bdt': 'datetime(%d %b %Y): @bd',
+    }]
+    XML = (b'<r><a dt="2016-06-27T14:07:05.25+03:00" d="2016-06-27" '
+           b't="14:07" fdt="27.06.16 9:05" fd="27.06.16" bd="27 Jun 2016"/>'
+           b'<a dt="2016-06-27 14:07"/><a/></r>')
+
+    def test_datetime_types(self):
+        offset = datetimes.timezone(timedelta(hours=3))
+        for codegen in (False, True):
+            mapper = XMLMapper(self.MAPPINGS, codegen=codegen)
+            a1, a2, a3 = mapper.load(self.XML, JsonDumpFactory())
+            self.assertEqual(
+                datetime(2016, 6, 27, 14, 7, 5, 250000, offset), a1['dt'])
+            self.assertEqual(offset, a1['dt'].tzinfo)
+            self.assertEqual(date(2016, 6, 27), a1['d'])
+            self.assertEqual(time(14, 7), a1['t'])
+            self.assertEqual(datetime(2016, 6, 27, 9, 5), a1['fdt'])
+            self.assertEqual(date(2016, 6, 27), a1['fd'])
+            self.assertEqual(datetime(2016, 6, 27), a1['bdt'])
+            self.assertEqual(datetime(2016, 6, 27, 14, 7), a2['dt'])
+            self.assertEqual(None, a3['dt'])
+
+            self.assertEqual(
+                datetime(2016, 6, 27, 14, 7, tzinfo=datetimes.timezone.utc),
+                XMLMapper(self.MAPPINGS, codegen=codegen,
+                          timezone=datetimes.timezone.utc).load(
+                    self.XML, JsonDumpFactory())[1]['dt'])
+
+            with six.assertRaisesRegex(
+                    self, XMLMapperLoadingError,
+                    r'Invalid literal for date: "27.06.2016"\. '
+                    r'In element "a" line 1'):
+                mapper.load(b'<r><a d="27.06.2016"/></r>', JsonDumpFactory())
+
+    def test_filter_overrides_type(self):
+        mappings = [{'_type': 'a', '_match': '/r/a',
+                     'dt': 'datetime: @dt', 'd': 'date(%Y-%m-%d): @d'}]
+        for codegen in (False, True):
+            mapper = XMLMapper(mappings, codegen=codegen, filters={
+                'datetime': lambda v: 'filtered', 'date': str})
+            self.assertEqual(
+                [{'_type': 'a', 'dt': 'filtered', 'd': date(2016, 6, 27)}],
+                mapper.load(self.XML, JsonDumpFactory())[:1])
+
+    def test_mapping_type_overrides_type(self):
+        mappings = [{'_type': 'date', '_match': '/r/date', '_id': '@id',
+                     'id': '@id'},
+                    {'_type': 'a', '_match': '/r/a', 'd': 'date: @d',
+                     'fd': 'date(%Y-%m-%d): @fd'}]
+        xml = b'<r><date id="x"/><a d="x" fd="2016-06-27"/></r>'
+        for codegen in (False, True):
+            mapper = XMLMapper(mappings, codegen=codegen,
+                               timezone=datetimes.timezone.utc)
+            self.assertEqual(
+                {'_type': 'a', 'd': ('date', 'x'), 'fd': date(2016, 6, 27)},
+                mapper.load(xml, JsonDumpFactory())[1])
+        mappings[0] = {'_type': 'date', '_match': '/r/date', 'id': '@id'}
+        with six.assertRaisesRegex(self, XMLMapperSyntaxError,
+                                   r'Invalid value type "date" for "d" '
+                                   r'attribute in type "a" \(only types '
+                                   r'with "_id" can be referenced\)'):
+            XMLMapper(mappings)
+
+    def test_format_syntax_error(self):
+        with six.assertRaisesRegex(self, XMLMapperSyntaxError,
+                                   'Value type "int" of "v" attribute'):
+            XMLMapper([{'_type': 'a', '_match': '/r', 'v': 'int(%d): @v'}])
+
+    def test_compile_parser(self):
+        parse = datetimes.compile_parser('datetime', '%Y%m%d%H%M%S%z')
+        self.assertEqual(
+            datetime(2016, 6, 27, 14, 7, 5,
+                     tzinfo=datetimes.timezone(-timedelta(minutes=330))),
+            parse('20160627140705-0530'))
+        parse = datetimes.compile_parser('time', '%H:%M:%S.%f%%')
+        self.assertEqual(time(1, 2, 3, 400000), parse('01:02:03.4%'))
+        # unpadded numbers backtrack like in strptime
+        for fmt, value in (('%Y%m%d', '1983821'), ('%Y%m%d', '1983111'),
+                           ('%d%m%Y%H%M', '1121983945'),
+                           ('%Y-%m-%dt%H:%M', '2016-6-27T9:5'),
+                           ('%d %m %Y', '1  2\t2016')):
+            self.assertEqual(
+                datetime.strptime(value, fmt),
+                datetimes.compile_parser('datetime', fmt)(value))
+        for value in ('2016-06-27T14:07:0', '2016-06-27X14:07', '16-06-27'):
+            with self.assertRaises(ValueError):
+                datetimes.compile_parser('datetime')(value)
+        # "Z" offset is case sensitive, literal text is not
+        parse = datetimes.compile_parser('datetime', '%Y-%m-%dT%H:%M%z')
+        self.assertEqual(
+            datetime(2016, 6, 27, 14, 7, tzinfo=datetimes.timezone.utc),
+            parse('2016-06-27t14:07Z'))
+        with self.assertRaises(ValueError):
+            parse('2016-06-27T14:07z')
+
+
+class TestXSLT(XMLMapperTestCase):
+
+    def assert_same_as_interpreter(self, mappings, xml, filters=None,
+                                   **kwargs):
+        mapper = XMLMapper(mappings, filters=filters)
+        results = []
+        for xslt in (False, True):
+            try:
+                results.append(mapper.load(
+                    xml, JsonDumpFactory(), xslt=xslt, **kwargs))
+            except XMLMapperLoadingError as e:
+                results.append((str(e), e.element_tag, e.source_line))
+        self.assertEqual(results[0], results[1])
+        return results[1]
+
+    def test_xslt_same_objects(self):
+        data = self.assert_same_as_interpreter(
+            TestStreaming.MAPPINGS, TestStreaming.XML)
+        self.assertEqual(8, len(data))
+        self.assert_same_as_interpreter(
+            TestStreaming.MAPPINGS, TestStreaming.XML, batch_size=2)
+        self.assert_same_as_interpreter(
+            TestBatchLoading.MAPPINGS, TestBatchLoading.XML)
+        data = self.assert_same_as_interpreter(
+            [{
+                '_type': 'a',
+                '_match': '/a',
+                'id': 'int: @id',
+                'b': 'bool: @b',
+                'f': 'float: n',
+                'foo': 'foo: @foo',
+                'none': 'int: @none',
+                'count': 'float: count(n)',
+                'has_n': 'bool: boolean(n)',
+                'concat': 'concat(@id, "-", n)',
+                'mixed': 'm',
+                'empty': 'e',
+                'nested': {'_type': 'n', '_match': 'n', 'id': '.'},
+            }],
+            b'<a id="10" b="true" foo="x"><n>1.5</n>'
+            b'<m> x <i/></m><e><i/></e></a>',
+            filters={'foo': lambda val: '+{}+'.format(val)})
+        self.assertEqual(
+            [{'_type': 'n', 'id': '1.5'},
+             {'_type': 'a', 'id': 10, 'b': True, 'f': 1.5, 'foo': '+x+',
+              'none': None, 'count': 1.0, 'has_n': True, 'concat': '10-1.5',
+              'mixed': 'x', 'empty': 'None', 'nested': ('n', '1.5')}],
+            data)
+
+    def test_xslt_same_errors(self):
+        mappings = TestCodegen.MAPPINGS_WITH_ERRORS
+        for xml in TestCodegen.XML_WITH_ERRORS:
+            self.assertIsInstance(
+                self.assert_same_as_interpreter(mappings, xml), tuple)
+
+    def test_xslt_options(self):
+        mapper = XMLMapper(TestStreaming.MAPPINGS)
+        for kwargs in ({'streaming': True}, {'single_pass': True},
+                       {'stats': XMLMapperStats()},
+                       {'split': '/root/a'}):
+            with self.assertRaises(ValueError):
+                mapper.load(TestStreaming.XML, JsonDumpFactory(), xslt=True,
+                            **kwargs)
+
+    def test_xslt_threads(self):
+        mapper = XMLMapper(TestStreaming.MAPPINGS)
+        expected = mapper.load(TestStreaming.XML, JsonDumpFactory())
+        results = []
+
+        def run():
+            results.append(mapper.load(
+                TestStreaming.XML, JsonDumpFactory(), xslt=True))
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([expected] * 4, results)
@@ -0,0 +1,56 @@
+"""Loading XML from asynchronous streams of bytes.
+
+Chunks are fed into `etree.XMLPullParser` and records are mapped as soon
+as they are closed, same as in streaming mode of `XMLMapper.load_file`.
+"""
+import inspect
+
+import six
+
+from .xmlmapper import _ElementInfo
+
+
+async def load_stream(mapper, chunks, object_factory):
+    """Parses XML chunks from async iterable and loads objects.
+
+    See `XMLMapper.load_stream`.
+    """
+    parser = mapper._StreamParser(mapper)
+    if inspect.iscoroutinefunction(object_factory.create):
+        load = _load_records_async
+    else:
+        load = _load_records
+
+    state = mapper._State()
+    result = []
+    async for chunk in chunks:
+        parser.feed(bytes(chunk) if isinstance(chunk, memoryview) else chunk)
+        records = mapper._iter_stream_records(parser.read_events())
+        await load(mapper, state, records, object_factory, result)
+    parser.close()
+    records = mapper._iter_stream_records(parser.read_events())
+    await load(mapper, state, records, object_factory, result)
+    return [obj for _, obj in result]
+
+
+async def _load_records(mapper, state, records, object_factory, result):
+    for record in records:
+        mapper._load_record(state, record, object_factory, result)
+
+
+async def _load_records_async(mapper, state, records, object_factory,
+                              result):
+    """Records fields of each record and replays them awaiting
+    `create` of object factory"""
+    for record in records:
+        for _, log in mapper._record([record]):
+            created = []
+            for object_type, fields, has_id, obj_id, tag, line in log:
+                for k, v in six.iteritems(fields):
+                    fields[k] = mapper._resolve_recorded(state, created, v)
+                obj = await object_factory.create(object_type, fields)
+                created.append(obj)
+                result.append((object_type, obj))
+                if has_id:
+                    state.add_object(
+                        _ElementInfo(tag, line), object_type, obj_id, obj)
@@ -0,0 +1,99 @@
+"""Generates specialized Python loaders for compiled mappings.
+
+Generated loader does the same as `XMLMapper._load_element` for one
+mapping but with all value types, filters and references resolved when
+it's generated, so no type checks are made while loading.
+"""
+from .xmlmapper import XMLMapper, XMLMapperLoadingError, _Deferred
+
+
+def generate_loader(mapper, mapping):
+    """Generates loader function for mapping.
+
+    Args:
+        mapper: `XMLMapper` mapping was compiled by.
+        mapping: `XMLMapper._MappingQuery` to generate loader for.
+
+    Returns:
+        Function with (state, element, object_factory, result) arguments
+        returning loaded object.
+    """
+    namespace = {
+        'XMLMapperLoadingError': XMLMapperLoadingError,
+        'Deferred': _Deferred,
+        'get_string': XMLMapper._XPathQuery._get_string,
+        'load_mapping': mapper._load_mapping,
+    }
+    # fixed name so mapping type can't shadow names of namespace,
+    # type is shown in code filename instead
+    lines = ['def loader(state, element, object_factory, result):',
+             '    data = {}']
+
+    for i, query in enumerate(mapping.compiled):
+        if query.attr == '_id':
+            target = 'obj_id'
+        elif query.attr.startswith('_'):
+            target = 'internal'
+        else:
+            target = 'data[{!r}]'.format(query.attr)
+
+        if isinstance(query, XMLMapper._MappingQuery):
+            namespace['mapping_{}'.format(i)] = query
+            lines.append(
+                '    {} = load_mapping(state, element, mapping_{}, '
+                'object_factory, result)'.format(target, i))
+            continue
+
+        namespace['xpath_{}'.format(i)] = query.xpath
+        lines.append(
+            '    value = get_string(element, xpath_{0}, '
+            'xpath_{0}(element{1}))'.format(
+                i, ', state.prefix_nodes' if query.shared else ''))
+        if query.value_type == 'string':
+            pass
+        elif query.type_conv is not None:
+            namespace['convert_{}'.format(i)] = query.type_conv
+            message = 'Invalid literal for {}: "{{}}".'.format(
+                query.value_type)
+            lines.extend([
+                '    if value is not None:',
+                '        if state.deferred:',
+                '            value = Deferred({!r}, convert_{}, value, '
+                'element.tag, element.sourceline)'.format(
+                    query.value_type, i),
+                '        else:',
+                '            try:',
+                '                value = convert_{}(value)'.format(i),
+                '            except ValueError:',
+                '                raise XMLMapperLoadingError(',
+                '                    element, {!r}.format(value))'.format(
+                    message),
+            ])
+        elif query.value_type in mapper._filters:
+            namespace['filter_{}'.format(i)] = \
+                mapper._filters[query.value_type]
+            lines.append('    value = filter_{}(value)'.format(i))
+        else:
+            lines.append(
+                '    value = state.get_object(element, {!r}, value)'.format(
+                    query.value_type))
+        lines.append('    {} = value'.format(target))
+
+    lines.extend([
+        '    obj = object_factory.create({!r}, data)'.format(
+            mapping.mapping_type),
+        '    result.append(({!r}, obj))'.format(mapping.mapping_type),
+    ])
+    if mapping.has_id:
+        lines.append(
+            '    state.add_object(element, {!r}, obj_id, obj)'.format(
+                mapping.mapping_type))
+    lines.append('    return obj')
+
+    source = '\n'.join(lines) + '\n'
+    code = compile(source, '<xmlmapper {}>'.format(mapping.mapping_type),
+                   'exec')
+    exec(code, namespace)
+    loader = namespace['loader']
+    loader.source = source
+    return loader
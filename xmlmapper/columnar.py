@@ -0,0 +1,189 @@
+"""Object factory collecting fields of each type into typed columns."""
+from array import array
+
+import six
+
+from .xmlmapper import MapperObjectFactory, XMLMapper
+
+
+class Column(object):
+    """Column of numbers in `array.array`.
+
+    None values are stored as zero and marked in `nulls` array (1 for None)
+    which is only created once first None is added.
+    """
+    def __init__(self, typecode):
+        self.values = array(typecode)
+        self.nulls = None
+
+    def append(self, value):
+        if value is None:
+            if self.nulls is None:
+                self.nulls = array('b', [0]) * len(self.values)
+            self.values.append(0)
+            self.nulls.append(1)
+        else:
+            self.values.append(value)
+            if self.nulls is not None:
+                self.nulls.append(0)
+
+    def extend(self, values):
+        if None in values:
+            for value in values:
+                self.append(value)
+            return
+        self.values.extend(values)
+        if self.nulls is not None:
+            self.nulls.extend(array('b', [0]) * len(values))
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if self.nulls is not None and self.nulls[index]:
+            return None
+        return self.values[index]
+
+    def to_numpy(self):
+        """Returns values as numpy array sharing memory with column,
+        masked array if column has None values. Requires numpy."""
+        import numpy
+        values = numpy.frombuffer(self.values, dtype=self.values.typecode)
+        if self.values.typecode == 'b':
+            values = values.view(numpy.bool_)
+        if self.nulls is None:
+            return values
+        return numpy.ma.MaskedArray(
+            values, numpy.frombuffer(self.nulls, dtype=numpy.bool_))
+
+
+class StringColumn(object):
+    """Column of strings (or None) where equal strings share one object."""
+    def __init__(self):
+        self.values = []
+        self._strings = {}
+
+    def append(self, value):
+        if value is not None:
+            value = self._strings.setdefault(value, value)
+        self.values.append(value)
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+
+class ObjectColumn(StringColumn):
+    """Column of arbitrary values returned by filters."""
+    def append(self, value):
+        self.values.append(value)
+
+    def extend(self, values):
+        self.values.extend(values)
+
+
+class ListColumn(object):
+    """Column of lists of row indexes stored as flat `values` array and
+    `offsets` array where row i has values[offsets[i]:offsets[i + 1]]."""
+    def __init__(self):
+        self.values = array('q')
+        self.offsets = array('q', [0])
+
+    def append(self, value):
+        self.values.extend(value)
+        self.offsets.append(len(self.values))
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return list(self.values[self.offsets[index]:self.offsets[index + 1]])
+
+
+class Table(object):
+    """Rows of single mapping type.
+
+    Attributes:
+        columns: Dict of columns by field name.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+        self._rows = 0
+
+    def append(self, fields):
+        for name, value in six.iteritems(fields):
+            self.columns[name].append(value)
+        self._rows += 1
+        return self._rows - 1
+
+    def extend(self, fields_list):
+        """Appends rows column by column, returns their row indexes."""
+        for name, column in six.iteritems(self.columns):
+            column.extend([fields[name] for fields in fields_list])
+        start = self._rows
+        self._rows += len(fields_list)
+        return list(range(start, self._rows))
+
+    def __len__(self):
+        return self._rows
+
+    def row(self, index):
+        """Returns fields of row as dict."""
+        return dict((name, column[index])
+                    for name, column in six.iteritems(self.columns))
+
+
+class ColumnarFactory(MapperObjectFactory):
+    """Collects fields of each mapping type into `Table` of columns
+    instead of creating object per record.
+
+    Column type is chosen by attribute value type: int, float and bool
+    fields are stored in `array.array` columns, references to other types
+    and nested mappings as row indexes in table of that type (lists of
+    nested objects as `ListColumn`), strings in `StringColumn` and filter
+    results in `ObjectColumn`. Objects returned by mapper are row indexes.
+
+    Attributes:
+        tables: Dict of `Table` by mapping type.
+    """
+    _TYPECODES = {'int': 'q', 'float': 'd', 'bool': 'b'}
+
+    def __init__(self, mapper):
+        """Creates empty tables for mapper types.
+
+        Args:
+            mapper: `XMLMapper` which loads objects.
+        """
+        self.tables = {}
+        for mapping_type, mapping in six.iteritems(mapper._types):
+            self.tables[mapping_type] = Table(dict(
+                (query.attr, self._make_column(mapper, query))
+                for query in mapping.compiled
+                if not query.attr.startswith('_')))
+
+    def _make_column(self, mapper, query):
+        if isinstance(query, XMLMapper._MappingQuery):
+            return ListColumn() if query.returns_list else Column('q')
+        if query.value_type in self._TYPECODES:
+            return Column(self._TYPECODES[query.value_type])
+        if query.value_type in mapper._types:
+            return Column('q')
+        if query.value_type == 'string':
+            return StringColumn()
+        return ObjectColumn()
+
+    def create(self, object_type, fields):
+        return self.tables[object_type].append(fields)
+
+    def create_many(self, object_type, fields_list):
+        return self.tables[object_type].extend(fields_list)
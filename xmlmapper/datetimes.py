@@ -0,0 +1,184 @@
+"""Parsers of datetime, date and time value types.
+
+Parsers are compiled once per attribute query from ISO 8601 or from
+`strptime` format into regular expression building values directly,
+formats with directives other than %Y, %y, %m, %d, %H, %M, %S, %f, %z
+and %% fall back to `datetime.strptime`. Compiled formats use the same
+patterns as `strptime`, so they accept the same strings.
+"""
+import re
+import string
+from datetime import date, datetime, time, timedelta, tzinfo
+
+try:
+    from datetime import timezone
+except ImportError:  # Python 2
+    class timezone(tzinfo):
+        """Fixed offset from UTC."""
+        def __init__(self, offset):
+            self._offset = offset
+
+        def utcoffset(self, dt):
+            return self._offset
+
+        def dst(self, dt):
+            return timedelta(0)
+
+        def tzname(self, dt):
+            return None
+
+    timezone.utc = timezone(timedelta(0))
+
+
+VALUE_TYPES = ('datetime', 'date', 'time')
+
+_ISO_DATE = r'(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})'
+_ISO_TIME = (r'(?P<hour>\d{2}):(?P<minute>\d{2})'
+             r'(?::(?P<second>\d{2})(?:[.,](?P<microsecond>\d{1,6})\d*)?)?'
+             r'(?P<tz>Z|[+-]\d{2}(?::?\d{2})?)?')
+_ISO_FORMATS = {
+    'datetime': re.compile(_ISO_DATE + '(?:[T ]' + _ISO_TIME + ')?$'),
+    'date': re.compile(_ISO_DATE + '$'),
+    'time': re.compile(_ISO_TIME + '$'),
+}
+
+# same patterns as `_strptime`, ranges let unpadded numbers backtrack
+_DIRECTIVES = {
+    'Y': r'(?P<year>\d\d\d\d)',
+    'y': r'(?P<short_year>\d\d)',
+    'm': r'(?P<month>1[0-2]|0[1-9]|[1-9])',
+    'd': r'(?P<day>3[01]|[12]\d|0[1-9]|[1-9]| [1-9])',
+    'H': r'(?P<hour>2[0-3]|[0-1]\d|\d)',
+    'M': r'(?P<minute>[0-5]\d|\d)',
+    'S': r'(?P<second>6[0-1]|[0-5]\d|\d)',
+    'f': r'(?P<microsecond>[0-9]{1,6})',
+    'z': r'(?P<tz>Z|[+-]\d\d:?[0-5]\d(?::?[0-5]\d(?:\.\d{1,6})?)?)',
+}
+_RX_DIRECTIVE = re.compile(r'%(.)')
+_RX_WHITESPACE = re.compile(r'\s+')
+
+_offsets = {'Z': timezone.utc}
+
+
+def compile_parser(value_type, fmt=None, default_timezone=None):
+    """Returns function parsing string into value of type.
+
+    Args:
+        value_type: "datetime", "date" or "time".
+        fmt: `strptime` format, ISO 8601 by default.
+        default_timezone: tzinfo (or pytz timezone) of datetime values
+            without UTC offset, they are naive by default.
+
+    Returns:
+        Function raising ValueError for strings not matching format.
+    """
+    localize = None
+    if value_type != 'datetime':
+        default_timezone = None
+    elif default_timezone is not None and hasattr(
+            default_timezone, 'localize') and \
+            default_timezone.utcoffset(None) is None:
+        # pytz timezones with DST have to choose offset by date
+        localize, default_timezone = default_timezone.localize, None
+
+    regex = _ISO_FORMATS[value_type] if fmt is None else _compile_format(fmt)
+    if regex is None:
+        return _strptime_parser(value_type, fmt, localize, default_timezone)
+    match = regex.match
+    build = {'datetime': datetime, 'date': date, 'time': time}[value_type]
+    # (group index or None, default value, conversion) per argument
+    fields = [(regex.groupindex.get(name), default, convert)
+              for name, default, convert in _FIELDS[value_type]]
+    if value_type != 'time' and 'year' not in regex.groupindex and \
+            'short_year' in regex.groupindex:
+        fields[0] = (regex.groupindex['short_year'], 1900, _short_year)
+    if default_timezone is not None:
+        fields[-1] = fields[-1][:1] + (default_timezone, _offset)
+
+    def parse(value):
+        m = match(value)
+        if m is None:
+            raise ValueError(
+                '"{}" does not match {} format'.format(value, value_type))
+        groups = (None,) + m.groups()
+        result = build(*[
+            default if i is None or groups[i] is None else convert(groups[i])
+            for i, default, convert in fields])
+        if localize is not None and result.tzinfo is None:
+            result = localize(result)
+        return result
+    return parse
+
+
+def _compile_format(fmt):
+    """Compiles `strptime` format into regular expression, returns None
+    if format has unsupported or repeated directives."""
+    parts = []
+    directives = set()
+    for i, part in enumerate(_RX_DIRECTIVE.split(fmt)):
+        if i % 2 == 0:
+            # whitespace matches any whitespace like in `strptime`
+            parts.append(r'\s+'.join(
+                _literal(p) for p in _RX_WHITESPACE.split(part)))
+        elif part == '%':
+            parts.append('%')
+        elif part in _DIRECTIVES and part not in directives:
+            directives.add(part)
+            parts.append(_DIRECTIVES[part])
+        else:
+            return None
+    return re.compile(''.join(parts) + '$')
+
+
+def _literal(text):
+    # literal text is case insensitive like in `strptime`, patterns
+    # are compiled without IGNORECASE so "Z" offset stays upper case
+    return ''.join('[{}{}]'.format(c.upper(), c.lower())
+                   if c in string.ascii_letters else re.escape(c)
+                   for c in text)
+
+
+def _short_year(text):
+    # same pivot as strptime
+    year = int(text)
+    return year + (1900 if year >= 69 else 2000)
+
+
+def _microsecond(text):
+    return int(text.ljust(6, '0'))
+
+
+def _offset(text):
+    if text not in _offsets:
+        digits = text[1:].replace(':', '')
+        offset = timedelta(hours=int(digits[:2]),
+                           minutes=int(digits[2:4] or 0),
+                           seconds=float(digits[4:] or 0))
+        _offsets[text] = timezone(-offset if text[0] == '-' else offset)
+    return _offsets[text]
+
+
+_DATE_FIELDS = [('year', 1900, int), ('month', 1, int), ('day', 1, int)]
+_TIME_FIELDS = [('hour', 0, int), ('minute', 0, int), ('second', 0, int),
+                ('microsecond', 0, _microsecond), ('tz', None, _offset)]
+_FIELDS = {
+    'datetime': _DATE_FIELDS + _TIME_FIELDS,
+    'date': _DATE_FIELDS,
+    'time': _TIME_FIELDS,
+}
+
+
+def _strptime_parser(value_type, fmt, localize, default_timezone):
+    def parse(value):
+        result = datetime.strptime(value, fmt)
+        if value_type == 'date':
+            return result.date()
+        if value_type == 'time':
+            return result.timetz()
+        if result.tzinfo is None:
+            if localize is not None:
+                result = localize(result)
+            elif default_timezone is not None:
+                result = result.replace(tzinfo=default_timezone)
+        return result
+    return parse
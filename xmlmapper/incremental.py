@@ -0,0 +1,109 @@
+"""Incremental loading skipping records unchanged since previous load."""
+import hashlib
+import sqlite3
+
+import six
+
+from .xmlmapper import _Reference
+
+
+class FingerprintStore(object):
+    """Fingerprints of records loaded by previous load stored in sqlite
+    database, see `incremental` option of `XMLMapper.iter_load_file`.
+
+    Fingerprint is a hash of types and fields of all objects mapping
+    creates from top-level matched element, recorded with the same
+    queries as loading, so values taken from outside of the element
+    (like attributes of ancestors) are part of it. References are
+    compared by type and id of referenced objects. Field values are
+    compared by `repr`, so values of filters without stable `repr` make
+    their records always loaded. Changed records are mapped twice, once
+    for fingerprint and once for loading.
+
+    Records with the same fingerprint are told apart by number of
+    preceding ones in document, so each of identical records is skipped
+    only if previous load had at least as many of them. Fingerprints
+    are replaced with ones of current load only when it completes,
+    failed load leaves store unchanged.
+
+    Attributes:
+        loaded (int): Number of records loaded by last load.
+        skipped (int): Number of unchanged records skipped by last load.
+    """
+
+    def __init__(self, path):
+        """Opens store creating database if necessary.
+
+        Args:
+            path: Filename of sqlite database.
+        """
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints ('
+            'mapping_type TEXT, fingerprint BLOB, occurrence INTEGER, '
+            'run INTEGER, '
+            'PRIMARY KEY (mapping_type, fingerprint, occurrence))')
+        self._db.commit()
+        self._run = None
+        self.loaded = self.skipped = 0
+
+    def close(self):
+        self._db.close()
+
+    def iter_changed(self, mapper, records):
+        """Yields (mapping, element) records of mapper which were not
+        loaded by previous load marking all records as seen by current
+        one."""
+        self._run = self._db.execute(
+            'SELECT COALESCE(MAX(run), 0) + 1 FROM fingerprints'
+        ).fetchone()[0]
+        self.loaded = self.skipped = 0
+        occurrences = {}
+        for mapping, element in records:
+            key = (mapping.mapping_type,
+                   self.fingerprint(mapper, mapping, element))
+            occurrences[key] = occurrences.get(key, -1) + 1
+            key += (occurrences[key],)
+            seen = self._db.execute(
+                'UPDATE fingerprints SET run = ? WHERE mapping_type = ? '
+                'AND fingerprint = ? AND occurrence = ? AND run != ?',
+                (self._run,) + key + (self._run,)).rowcount
+            if seen:
+                self.skipped += 1
+                continue
+            self._db.execute(
+                'INSERT OR IGNORE INTO fingerprints VALUES (?, ?, ?, ?)',
+                key + (self._run,))
+            self.loaded += 1
+            yield mapping, element
+
+    @staticmethod
+    def fingerprint(mapper, mapping, element):
+        """Returns fingerprint of objects mapping creates from element."""
+        recorder = mapper._Recorder()
+        mapper._load_element(recorder, element, mapping, recorder, [])
+        log = [(object_type, sorted(
+            (k, _comparable(v)) for k, v in six.iteritems(fields)),
+            has_id, obj_id)
+            for object_type, fields, has_id, obj_id, _, _ in recorder.log]
+        return sqlite3.Binary(hashlib.sha1(
+            repr(log).encode('utf-8')).digest())
+
+    def commit(self):
+        """Replaces fingerprints of previous load with current ones."""
+        self._db.execute(
+            'DELETE FROM fingerprints WHERE run != ?', (self._run,))
+        self._db.commit()
+
+    def rollback(self):
+        """Discards fingerprints of current load."""
+        self._db.rollback()
+
+
+def _comparable(value):
+    """Strips element tag and line from recorded references."""
+    if isinstance(value, _Reference):
+        return ('reference', value.obj_type, value.obj_id)
+    if isinstance(value, list):
+        return [_comparable(v) for v in value]
+    return value
@@ -0,0 +1,69 @@
+"""Disk-backed index of objects for loads with too many objects with
+"_id" to keep them all in memory."""
+import sqlite3
+
+
+class SqliteIndex(object):
+    """Ids and handles of objects evicted from memory stored in sqlite
+    database, see `index` option of `XMLMapper.iter_load_file`.
+
+    Only `cache_size` most recently added or referenced objects are kept
+    in memory while loading, references to other objects are resolved by
+    `MapperObjectFactory.resolve` of object factory with handle returned
+    by its `handle` method. Index is cleared at start of every load.
+
+    Other index implementations (like dbm or LMDB ones) only need
+    `cache_size` attribute and `clear`, `add`, `__contains__` and
+    `__getitem__` methods. Ids and handles have to be values sqlite can
+    store: strings, numbers, bytes or None.
+
+    Attributes:
+        cache_size (int): Number of objects kept in memory.
+    """
+
+    def __init__(self, path='', cache_size=10000):
+        """Opens index creating database if necessary.
+
+        Args:
+            path: Filename of sqlite database, private temporary file
+                removed on close by default.
+            cache_size: Number of objects kept in memory.
+        """
+        if cache_size < 1:
+            raise ValueError('cache_size should be positive')
+        self.cache_size = cache_size
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode = OFF')
+        self._db.execute('PRAGMA synchronous = OFF')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS ids ('
+            'mapping_type TEXT, obj_id, handle, '
+            'PRIMARY KEY (mapping_type, obj_id))')
+
+    def close(self):
+        self._db.close()
+
+    def clear(self):
+        """Removes all ids."""
+        self._db.execute('DELETE FROM ids')
+
+    def add(self, mapping_type, obj_id, handle=None):
+        """Adds id and handle of object, returns False if it's already
+        added."""
+        return self._db.execute(
+            'INSERT OR IGNORE INTO ids VALUES (?, ?, ?)',
+            (mapping_type, obj_id, handle)).rowcount == 1
+
+    def __contains__(self, key):
+        return self._db.execute(
+            'SELECT 1 FROM ids WHERE mapping_type = ? AND obj_id = ?',
+            key).fetchone() is not None
+
+    def __getitem__(self, key):
+        """Returns handle of (mapping type, id) key."""
+        row = self._db.execute(
+            'SELECT handle FROM ids WHERE mapping_type = ? AND obj_id = ?',
+            key).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
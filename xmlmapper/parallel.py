@@ -0,0 +1,331 @@
+"""Loading XML with process pool.
+
+Workers parse and map XML with `XMLMapper._Recorder` and send recorded
+fields back, objects are created in the calling process by replaying
+them with single `XMLMapper._State`.
+"""
+import bisect
+import codecs
+import mmap
+import multiprocessing
+import re
+
+import six
+from .xmlmapper import XMLMapper, XMLMapperLoadingError, _Buffer, \
+    _ElementInfo
+
+
+# Minimal size in bytes of chunks file is split into
+MIN_CHUNK_SIZE = 1 << 20
+
+# Markup in XML document, only start and end tags have name group
+_RX_MARKUP = re.compile(
+    br'<(?:!--.*?-->|!\[CDATA\[.*?\]\]>|\?.*?\?>|![A-Z]+(?:[^\[>]|\[.*?\])*>|'
+    br'(?P<end>/?)(?P<name>[^\s/>]+)(?:"[^"]*"|\'[^\']*\'|[^\'">])*?'
+    br'(?P<empty>/?)>)',
+    re.S)
+
+# Encoding in XML declaration
+_RX_ENCODING = re.compile(
+    br'<\?xml[^>]*?\sencoding\s*=\s*["\']([^"\']*)["\']')
+
+_mapper = None
+
+
+def _init_worker(mapper):
+    global _mapper
+    _mapper = mapper
+
+
+def _record_file(xml_file):
+    root = _mapper.parse(xml_file)
+    return _mapper._record(_mapper._iter_tree_records(root))
+
+
+def _record_piece(piece):
+    """Maps part of document made of file byte ranges with prefix and
+    suffix added.
+
+    Args:
+        piece: Tuple of filename, list of (start, end) byte ranges,
+            prefix, suffix, list of (piece line, file line) pairs where
+            ranges start and indexes of mappings to apply.
+    """
+    xml_file, ranges, prefix, suffix, lines, indexes = piece
+    parts = [prefix]
+    with open(xml_file, 'rb') as f:
+        for start, end in ranges:
+            f.seek(start)
+            parts.append(f.read(end - start))
+    parts.append(suffix)
+
+    piece_lines = [line for line, _ in lines]
+
+    def source_line(line):
+        if line is None:
+            return None
+        i = max(bisect.bisect_right(piece_lines, line) - 1, 0)
+        return lines[i][1] + line - lines[i][0]
+
+    root = _mapper._parse(_Buffer(b''.join(parts)))
+    mappings = [_mapper._mappings[i] for i in indexes]
+    records = ((m, el) for m in mappings for el in m.match(root))
+    try:
+        return _mapper._record(records, _mapper._Recorder(source_line))
+    except XMLMapperLoadingError as e:
+        # report line in file instead of line in piece
+        message = e.args[0]
+        suffix = ' In element "{}" line {}.'.format(
+            e.element_tag, e.source_line)
+        if e.element_tag is None or not message.endswith(suffix):
+            raise
+        raise XMLMapperLoadingError(
+            _ElementInfo(e.element_tag, source_line(e.source_line)),
+            message[:-len(suffix)])
+
+
+def iter_file_logs(mapper, xml_files, workers=None):
+    """Maps files with process pool.
+
+    Yields:
+        Recorded logs in the same order as objects would be created by
+        loading files one after another.
+    """
+    pool = multiprocessing.Pool(workers, _init_worker, (mapper,))
+    try:
+        for groups in pool.imap(_record_file, xml_files):
+            for _, log in groups:
+                yield log
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _check_encoding(data):
+    """Raises ValueError unless document is in ASCII compatible encoding
+    `_scan_chunks` can find markup in."""
+    head = data[:1024]
+    start = len(codecs.BOM_UTF8) if head.startswith(codecs.BOM_UTF8) else 0
+    m = _RX_ENCODING.match(head, start)
+    encoding = m.group(1).decode('ascii', 'replace') if m else None
+    if (head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE,
+                         codecs.BOM_UTF32_BE)) or b'\x00' in head[:4]):
+        encoding = encoding or 'UTF-16 or UTF-32'
+    elif encoding is not None:
+        markup = b'<>/="\'!?-[]'
+        try:
+            if markup.decode('ascii').encode(encoding) == markup:
+                return
+        except (LookupError, UnicodeError):
+            pass
+    else:
+        return
+    raise ValueError(
+        'split requires ASCII compatible encoding, document is in '
+        '{}'.format(encoding))
+
+
+def _scan_chunks(data, path, chunk_size):
+    """Finds chunks of consecutive elements with path in XML document.
+
+    Args:
+        data: Document bytes (or mmap).
+        path: List of element names from root.
+        chunk_size: Minimal chunk size in bytes, chunks are also split
+            if elements have different parents or other elements between
+            them.
+
+    Returns:
+        Tuple of root element start offset and list of chunks, each
+        chunk is a list of start and end offsets and tuple of start
+        tags of ancestors.
+    """
+    names = [name.encode('utf-8') for name in path]
+    depth = len(names) - 1
+    stack = []  # (name, start tag or None, offset) of open elements
+    root_start = None
+    chunks = []
+    chunk = None
+    in_record = False
+    skip_patterns = {}
+
+    def skip(name, start):
+        """Returns end offset of element which content starts at start
+        or None if content has comments, CDATA, PIs or elements with the
+        same name, so it can't be skipped without scanning."""
+        if name not in skip_patterns:
+            skip_patterns[name] = (
+                re.compile(br'</' + re.escape(name) + br'\s*>'),
+                re.compile(br'<[!?]|<' + re.escape(name) + br'[\s/>]'))
+        end_rx, stop_rx = skip_patterns[name]
+        end = end_rx.search(data, start)
+        if end is None or stop_rx.search(data, start, end.start()):
+            return None
+        return end.end()
+
+    offset = 0
+    while True:
+        m = _RX_MARKUP.search(data, offset)
+        if m is None:
+            break
+        offset = m.end()
+        name = m.group('name')
+        if name is None:
+            continue
+        if root_start is None:
+            root_start = m.start()
+
+        if m.group('end'):
+            stack.pop()
+            if in_record and len(stack) == depth:
+                chunk[1] = m.end()
+                in_record = False
+            continue
+
+        empty = bool(m.group('empty'))
+        on_path = [n for n, _, _ in stack] == names[:len(stack)]
+        in_parent = on_path and len(stack) == depth
+        if in_parent and name != names[-1]:
+            # other sibling ends chunk so it's left in the rest
+            chunk = None
+        elif in_parent:
+            parent = stack[-1][2] if stack else None
+            if (chunk is None or chunk[3] != parent or
+                    m.start() - chunk[0] >= chunk_size):
+                chunk = [m.start(), m.end(),
+                         tuple(tag for _, tag, _ in stack), parent]
+                chunks.append(chunk)
+            if empty:
+                chunk[1] = m.end()
+
+        if empty:
+            continue
+        if on_path and (in_parent or name != names[len(stack)]):
+            # content of records and elements records can't be in is
+            # skipped to their end tag when possible
+            end = skip(name, offset)
+            if end is not None:
+                offset = end
+                if in_parent and name == names[-1]:
+                    chunk[1] = end
+                continue
+        if in_parent and name == names[-1]:
+            in_record = True
+        tag = m.group(0) if len(stack) < depth else None
+        stack.append((name, tag, m.start()))
+
+    return root_start or 0, [c[:3] for c in chunks]
+
+
+def _make_pieces(data, xml_file, root_start, chunks, record_indexes,
+                 other_indexes):
+    """Builds `_record_piece` arguments for chunks and the rest of document.
+
+    Returns:
+        Tuple of list of chunk pieces and rest piece.
+    """
+    prolog = data[:root_start]
+    prolog_lines = prolog.count(b'\n')
+    position = [0, 1]  # offset and its line, offsets only increase
+
+    def line_at(offset):
+        position[1] += data[position[0]:offset].count(b'\n')
+        position[0] = offset
+        return position[1]
+
+    pieces = []
+    rest_ranges = []
+    rest_lines = []
+    rest_line = 1
+    rest_start = 0
+    for start, end, ancestors in chunks:
+        rest_ranges.append((rest_start, start))
+        rest_lines.append((rest_line, line_at(rest_start)))
+        rest_line += data[rest_start:start].count(b'\n')
+        rest_start = end
+
+        prefix = prolog + b''.join(ancestors)
+        suffix = b''.join(
+            b'</' + _RX_MARKUP.match(tag).group('name') + b'>'
+            for tag in reversed(ancestors))
+        lines = [(1, 1), (1 + prolog_lines + b''.join(ancestors).count(
+            b'\n'), line_at(start))]
+        pieces.append((xml_file, [(start, end)], prefix, suffix, lines,
+                       record_indexes))
+
+    rest_ranges.append((rest_start, len(data)))
+    rest_lines.append((rest_line, line_at(rest_start)))
+    rest = (xml_file, rest_ranges, b'', b'', rest_lines, other_indexes)
+    return pieces, rest
+
+
+def iter_split_logs(mapper, xml_file, split, workers=None):
+    """Splits file into chunks of elements matching `split` path and maps
+    them with process pool, see `XMLMapper.iter_load_file`.
+
+    Yields:
+        Recorded logs in the same order as objects would be created by
+        loading file without splitting.
+    """
+    if not XMLMapper._RX_ABSOLUTE_PATH.match(split):
+        raise ValueError(
+            'split should be an absolute path of element names')
+    if not isinstance(xml_file, six.string_types):
+        raise ValueError('split requires xml_file to be a filename')
+    path = split[1:].split('/')
+
+    record_indexes, other_indexes = [], []
+    for i, mapping in enumerate(mapper._mappings):
+        if not XMLMapper._RX_ABSOLUTE_PATH.match(mapping.match_xpath):
+            raise ValueError(
+                'split requires "_match" of top-level mappings to be '
+                'absolute paths of element names, "{}" is not'.format(
+                    mapping.match_xpath))
+        match_path = mapping.match_xpath[1:].split('/')
+        if match_path[:len(path)] == path:
+            record_indexes.append(i)
+        elif path[:len(match_path)] == match_path:
+            # chunks are cut out of its elements
+            raise ValueError(
+                '"_match" "{}" matches ancestors of split elements'.format(
+                    mapping.match_xpath))
+        else:
+            other_indexes.append(i)
+
+    workers = workers or multiprocessing.cpu_count()
+    with open(xml_file, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        _check_encoding(data)
+        chunk_size = max(MIN_CHUNK_SIZE, len(data) // (workers * 4))
+        root_start, chunks = _scan_chunks(data, path, chunk_size)
+        pieces, rest = _make_pieces(data, xml_file, root_start, chunks,
+                                    record_indexes, other_indexes)
+    finally:
+        data.close()
+
+    pool = multiprocessing.Pool(workers, _init_worker, (mapper,))
+    try:
+        rest_result = pool.apply_async(_record_piece, (rest,))
+        chunk_results = pool.imap(_record_piece, pieces)
+        # logs of first record mapping are replayed as chunks are mapped,
+        # logs of other record mappings are kept until their turn
+        buffered = dict((i, []) for i in record_indexes[1:])
+        for index in range(len(mapper._mappings)):
+            if index in other_indexes:
+                for i, log in rest_result.get():
+                    if i == index:
+                        yield log
+            elif index == record_indexes[0]:
+                for groups in chunk_results:
+                    for i, log in groups:
+                        if i == index:
+                            yield log
+                        else:
+                            buffered[i].append(log)
+            else:
+                for log in buffered.pop(index):
+                    yield log
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,53 @@
+"""Object factory creating compact records of classes generated for
+mapping types."""
+import keyword
+import re
+from collections import namedtuple
+
+from .xmlmapper import MapperObjectFactory
+
+
+class RecordFactory(MapperObjectFactory):
+    """Creates records of `namedtuple` class generated for each mapping
+    type with its attributes as fields.
+
+    Records are filled positionally by `XMLMapper` without building
+    fields dict. Attribute names that are not valid identifiers (like
+    "#tags") are renamed to "_<index>" in record class but can always
+    be accessed by index in `XMLMapper.fields(object_type)`. Class names
+    are mapping types with invalid characters replaced by "_" and
+    prefixed by "Record_" if they are still not valid identifiers.
+
+    Attributes:
+        classes: Dict of record classes by mapping type.
+    """
+    positional = True
+
+    def __init__(self, mapper):
+        """Generates record classes for mapper types.
+
+        Args:
+            mapper: `XMLMapper` which loads objects.
+        """
+        self.classes = {}
+        self._fields = {}
+        for mapping_type in mapper._types:
+            fields = mapper.fields(mapping_type)
+            self._fields[mapping_type] = fields
+            self.classes[mapping_type] = namedtuple(
+                _class_name(mapping_type), fields, rename=True)
+
+    def create(self, object_type, fields):
+        return tuple.__new__(
+            self.classes[object_type],
+            [fields[f] for f in self._fields[object_type]])
+
+    def create_positional(self, object_type, values):
+        return tuple.__new__(self.classes[object_type], values)
+
+
+def _class_name(mapping_type):
+    name = re.sub(r'\W', '_', mapping_type)
+    if not re.match(r'[^\W\d]', name) or keyword.iskeyword(name):
+        name = 'Record_' + name
+    return name
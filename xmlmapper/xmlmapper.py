@@ -1,8 +1,15 @@
 import re
-from io import BytesIO
+import threading
+import mmap
+from collections import OrderedDict, namedtuple
+from contextlib import closing
+from timeit import default_timer
 
 import six
 from lxml import etree
+from six.moves.urllib.request import urlopen
+
+from . import datetimes
 
 
 class XMLMapperError(Exception):
@@ -33,13 +40,38 @@ class XMLMapperLoadingError(XMLMapperError, RuntimeError):
             message += ' In element "{}" line {}.'.format(
                 element.tag, element.sourceline)
         super(XMLMapperLoadingError, self).__init__(message)
-        self.element_tag = element.tag
-        self.source_line = element.sourceline
+        self.element_tag = element.tag if element is not None else None
+        self.source_line = \
+            element.sourceline if element is not None else None
+
+    def __reduce__(self):
+        return self.__class__, (None, self.args[0]), self.__dict__
+
+
+# Tag and line of element loaded in other process, used in place of
+# element for XMLMapperLoadingError
+_ElementInfo = namedtuple('_ElementInfo', 'tag sourceline')
+
+# XML document in memory buffer (bytes, bytearray, memoryview or mmap)
+# passed instead of file to be parsed from memory
+_Buffer = namedtuple('_Buffer', 'data')
+
+# Tokens used in recorded fields instead of nested and referenced objects
+_Created = namedtuple('_Created', 'index')
+_Reference = namedtuple('_Reference', 'obj_type obj_id tag sourceline')
+
+# String value of built-in type converted later in bulk with other values
+# of the same field
+_Deferred = namedtuple('_Deferred',
+                       'value_type type_conv value tag sourceline')
 
 
 class MapperObjectFactory:
     """Interface for object factory used by `XMLMapper`"""
 
+    # Whether `XMLMapper` loads objects with `create_positional`
+    positional = False
+
     def create(self, object_type, fields):
         """Creates object with specified type and attributes
 
@@ -53,6 +85,242 @@ class MapperObjectFactory:
         """
         raise NotImplementedError
 
+    def create_many(self, object_type, fields_list):
+        """Creates batch of objects with the same type.
+
+        Used instead of `create` when `XMLMapper` loads objects in
+        batches. Default implementation calls `create` for each object.
+
+        Args:
+            object_type (str): Type of objects to create
+                as in  "_type" attribute of mapping.
+            fields_list: List of attribute dictionaries, one per object.
+
+        Returns:
+            List of constructed objects in the same order as fields.
+        """
+        return [self.create(object_type, fields) for fields in fields_list]
+
+    def convert_many(self, value_type, values, convert):
+        """Converts strings of one field in batch to built-in type.
+
+        Used when `XMLMapper` loads objects in batches with
+        `defer_conversion`, can be overridden to parse whole column at
+        once. Default implementation calls `convert` for each value.
+
+        Args:
+            value_type (str): "int", "float", "bool", "datetime", "date"
+                or "time".
+            values: List of strings.
+            convert: Function converting single string.
+
+        Returns:
+            List of converted values. ValueError is raised for invalid
+            strings and reported with the element of first invalid one.
+        """
+        return list(map(convert, values))
+
+    def create_positional(self, object_type, values):
+        """Creates object from list of attribute values.
+
+        Used instead of `create` if `positional` is True, except for
+        loading in batches, with stats or in worker processes.
+
+        Args:
+            object_type (str): Type of object to create
+                as in  "_type" attribute of mapping.
+            values: List of attribute values in the same order as names
+                in `XMLMapper.fields(object_type)`.
+
+        Returns:
+            The constructed object.
+        """
+        raise NotImplementedError
+
+    def handle(self, object_type, obj):
+        """Returns compact key of created object, like its primary key.
+
+        Used by loading with `index` to store key of object evicted from
+        memory, which is then passed to `resolve`. Has to be a value the
+        index can store. Default implementation returns None, so evicted
+        objects are found by `lookup` of their "_id" instead.
+
+        Args:
+            object_type (str): Type of object as in "_type" attribute
+                of mapping.
+            obj: Object as returned by `create` or `create_many`.
+
+        Returns:
+            Key of object or None.
+        """
+        return None
+
+    def lookup(self, object_type, obj_id):
+        """Returns object created by previous load.
+
+        Used by incremental loading to resolve references to objects of
+        records that were skipped as unchanged and by loading with
+        `index` to resolve references to objects evicted from memory.
+
+        Args:
+            object_type (str): Type of object as in "_type" attribute
+                of mapping.
+            obj_id: Value of "_id" of object.
+
+        Returns:
+            The object or None if there is no such object.
+        """
+        raise NotImplementedError
+
+    def resolve(self, object_type, handle):
+        """Returns object by key returned by `handle`.
+
+        Used by loading with `index` to resolve references to objects
+        evicted from memory.
+
+        Args:
+            object_type (str): Type of object as in "_type" attribute
+                of mapping.
+            handle: Key returned by `handle`, never None.
+
+        Returns:
+            The object or None if there is no such object.
+        """
+        raise NotImplementedError
+
+
+class CachedFilter(object):
+    """Filter wrapper memoizing results of `function` for `maxsize` most
+    recently used values, so expensive parsing is done once per distinct
+    string. Results are shared between objects, so function should not
+    return mutable values that are modified later.
+
+    Attributes:
+        hits (int): Number of calls returning cached result.
+        misses (int): Number of calls of `function`.
+    """
+
+    def __init__(self, function, maxsize=1024):
+        """Creates filter with empty cache.
+
+        Args:
+            function: Filter function taking string or None.
+            maxsize: Maximum number of cached results.
+        """
+        if maxsize < 1:
+            raise ValueError('maxsize should be positive')
+        self.function = function
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, value):
+        with self._lock:
+            if value in self._cache:
+                result = self._cache.pop(value)
+                self._cache[value] = result
+                self.hits += 1
+                return result
+        result = self.function(value)
+        with self._lock:
+            self.misses += 1
+            self._cache[value] = result
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return result
+
+    def cache_clear(self):
+        """Removes cached results and resets counters."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+    def __reduce__(self):
+        return self.__class__, (self.function, self.maxsize)
+
+
+class XMLMapperStats:
+    """Counters and cumulative wall time (in seconds) collected by loading
+    with `stats` option of `XMLMapper.iter_load_file`.
+
+    Attributes:
+        mappings: Dict of `MappingStats` by mapping type.
+        queries: Dict of `QueryStats` by (mapping type, attribute) pairs.
+        factory_calls (int): Number of `create` and `create_many` calls.
+        factory_time (float): Time spent in object factory.
+        total_time (float): Time of the whole load.
+    """
+
+    class MappingStats:
+        """Stats of single mapping.
+
+        Attributes:
+            matches (int): Number of elements matched by "_match".
+            match_time (float): Time of evaluating "_match".
+            objects (int): Number of objects loaded.
+            time (float): Time of loading objects including nested
+                mappings, attribute queries and object factory.
+        """
+        def __init__(self):
+            self.matches = self.objects = 0
+            self.match_time = self.time = 0.0
+
+    class QueryStats:
+        """Stats of single attribute query.
+
+        Attributes:
+            evaluations (int): Number of evaluations.
+            xpath_time (float): Time of evaluating XPath.
+            convert_time (float): Time of converting result to built-in
+                type or resolving reference.
+            filter_time (float): Time of converting result with filter.
+        """
+        def __init__(self):
+            self.evaluations = 0
+            self.xpath_time = self.convert_time = self.filter_time = 0.0
+
+    def __init__(self):
+        self.mappings = {}
+        self.queries = {}
+        self.factory_calls = 0
+        self.factory_time = self.total_time = 0.0
+
+    def mapping(self, mapping_type):
+        """Returns stats of mapping type creating them if necessary."""
+        if mapping_type not in self.mappings:
+            self.mappings[mapping_type] = self.MappingStats()
+        return self.mappings[mapping_type]
+
+    def query(self, mapping_type, attr):
+        """Returns stats of attribute query creating them if necessary."""
+        key = (mapping_type, attr)
+        if key not in self.queries:
+            self.queries[key] = self.QueryStats()
+        return self.queries[key]
+
+    def report(self):
+        """Returns stats formatted as text table, slowest first."""
+        lines = ['total {:.3f}s, factory {:.3f}s ({} calls)'.format(
+            self.total_time, self.factory_time, self.factory_calls)]
+        for mapping_type, s in sorted(six.iteritems(self.mappings),
+                                      key=lambda item: -item[1].time):
+            lines.append(
+                '{:20s} {:8d} objects {:8.3f}s, {:8d} matches '
+                '{:8.3f}s'.format(mapping_type, s.objects, s.time,
+                                  s.matches, s.match_time))
+        for (mapping_type, attr), s in sorted(
+                six.iteritems(self.queries),
+                key=lambda item: -(item[1].xpath_time +
+                                   item[1].convert_time +
+                                   item[1].filter_time)):
+            lines.append(
+                '{:20s} {:8d} evaluations xpath {:.3f}s convert {:.3f}s '
+                'filter {:.3f}s'.format(
+                    '{}.{}'.format(mapping_type, attr), s.evaluations,
+                    s.xpath_time, s.convert_time, s.filter_time))
+        return '\n'.join(lines)
+
 
 class XMLMapper:
     """Loads data from XML into objects according to provided mappings.
@@ -79,12 +347,14 @@ class XMLMapper:
 
             String in form "[type: ]xpath", where xpath is an expression
                 that gets attribute value and type is either one of
-                built-in types (string, bool, int, float), _type of other
-                mapping (with `id`) or name of filter passed to XMLMapper
-                constructor. If other mapping type is uses result value
-                will be and object (as returned by factory) with id
-                determined by following xpath. If no type is specified
-                string type is used.
+                built-in types (string, bool, int, float, datetime, date,
+                time), _type of other mapping (with `id`) or name of
+                filter passed to XMLMapper constructor. If other mapping
+                type is uses result value will be and object (as returned
+                by factory) with id determined by following xpath. If no
+                type is specified string type is used. datetime, date and
+                time values are parsed from ISO 8601 or from `strptime`
+                format in parentheses, like "date(%d.%m.%Y): @date".
 
             Another mapping. Will be applied to current element returning
                 object as result. If no elements match None will be returned.
@@ -127,25 +397,125 @@ class XMLMapper:
             ('c', {'a': a_obj_returned_by_second_call})
     """
 
-    _RX_QUERY = re.compile(r'(?:(?P<type>\w+)\s*:\s*)?(?P<xpath>.*)')
+    _RX_QUERY = re.compile(
+        r'(?:(?P<type>\w+)(?:\((?P<args>[^)]*)\))?\s*:\s*)?(?P<xpath>.*)')
+    _RX_ABSOLUTE_PATH = re.compile(r'^(?:/[A-Za-z_][\w.\-]*)+$')
+    _RX_ATTRIBUTE_PATH = re.compile(r'^@[A-Za-z_][\w.\-]*$')
+    _RX_URL = re.compile(r'^[A-Za-z][\w+.\-]*://')
+    # path of child elements optionally followed by "@name" or "text()"
+    _RX_CHILD_PATH = re.compile(
+        r'^(?P<prefix>[A-Za-z_][\w.\-]*(?:/[A-Za-z_][\w.\-]*)*)'
+        r'(?:/(?P<last>@[A-Za-z_][\w.\-]*|text\(\)))?$')
     _VALUE_TYPES = {
         'string': str,
         'int': int,
         'float': float,
         'bool': lambda v: v is True or v.lower() == 'true',
+        'datetime': datetimes.compile_parser('datetime'),
+        'date': datetimes.compile_parser('date'),
+        'time': datetimes.compile_parser('time'),
     }
+    DEFAULT_PARSER_OPTIONS = {'remove_blank_text': True}
+    # Size of slices memory buffers are fed to parser in streaming mode
+    BUFFER_FEED_SIZE = 1 << 16
+
+    class _AttributeXPath(object):
+        """Evaluates "@name" XPath with direct attribute access."""
+        def __init__(self, path):
+            self.path, self._name = path, path[1:]
+
+        def __call__(self, element):
+            value = element.get(self._name)
+            return [] if value is None else [value]
+
+        def __str__(self):
+            return self.path
+
+    class _TextXPath(object):
+        """Evaluates "text()" XPath with direct text access."""
+        path = 'text()'
+
+        def __call__(self, element):
+            text = element.text
+            nodes = [] if text is None else [text]
+            if len(element):
+                nodes.extend(c.tail for c in element if c.tail is not None)
+            return nodes
+
+        def __str__(self):
+            return self.path
+
+    class _ThreadLocalXPath(object):
+        """Evaluates `etree.XPath` compiled separately for each thread as
+        XPath evaluators can't be shared between threads."""
+        def __init__(self, path):
+            self.path = path
+            self._local = threading.local()
+            # compiled here to report syntax errors with mapping spec
+            self._local.xpath = etree.XPath(path, smart_strings=False)
+
+        def __call__(self, element):
+            try:
+                xpath = self._local.xpath
+            except AttributeError:
+                xpath = self._local.xpath = etree.XPath(
+                    self.path, smart_strings=False)
+            return xpath(element)
+
+        def __str__(self):
+            return self.path
+
+    class _SharedPrefixXPath(object):
+        """Evaluates "prefix[/@name|/text()]" XPath whose child elements
+        prefix is shared by several queries of a mapping.
+
+        With `cache` (`prefix_nodes` of load state) prefix nodes of an
+        element are found once and reused by all queries sharing it,
+        without it whole path is evaluated as usual.
+        """
+        def __init__(self, path, prefix, last, full):
+            self.path, self.prefix = path, prefix
+            self._last, self._full = last, full
+
+        def __call__(self, element, cache=None):
+            if cache is None:
+                return self._full(element)
+            cached = cache.get(self.prefix)
+            if cached is None or cached[0] is not element:
+                cached = cache[self.prefix] = (element, self.prefix(element))
+            nodes = cached[1]
+            if self._last is None:
+                return nodes
+            if len(nodes) == 1:
+                return self._last(nodes[0])
+            values = []
+            for node in nodes:
+                values.extend(self._last(node))
+            return values
+
+        def __str__(self):
+            return self.path
 
     class _Query:
+        # whether XPath is `_SharedPrefixXPath`
+        shared = False
+
         def __init__(self, mapping_type, attr):
             self.mapping_type, self.attr = mapping_type, attr
 
     class _XPathQuery(_Query):
-        """Attribute query ([type:] xpath)."""
-        def __init__(self, mapping_type, attr, value_type, xpath):
+        """Attribute query ([type[(format)]:] xpath).
+
+        `type_conv` is function converting string to built-in type.
+        """
+        def __init__(self, mapping_type, attr, value_type, xpath,
+                     type_conv=None):
             XMLMapper._Query.__init__(self, mapping_type, attr)
             self.value_type, self.xpath = value_type, xpath
+            self.type_conv = type_conv
 
-        def _get_string(self, element, xpath_query, value):
+        @staticmethod
+        def _get_string(element, xpath_query, value):
             if isinstance(value, list):
                 if len(value) == 0:
                     return None
@@ -160,16 +530,25 @@ class XMLMapper:
             return six.text_type(value).strip()
 
         def run(self, mapper, state, element, object_factory, result):
-            value = self.xpath(element)
+            if self.shared:
+                return self.convert(mapper, state, element, self.xpath(
+                    element, state.prefix_nodes))
+            return self.convert(mapper, state, element, self.xpath(element))
+
+        def convert(self, mapper, state, element, value):
+            """Converts XPath result to value of query type"""
             str_value = self._get_string(element, self.xpath, value)
             if self.value_type == 'string':
                 return str_value
-            elif self.value_type in mapper._VALUE_TYPES:
+            elif self.type_conv is not None:
                 if str_value is None:
                     return None
-                type_conv = mapper._VALUE_TYPES[self.value_type]
+                if state.deferred:
+                    return _Deferred(self.value_type, self.type_conv,
+                                     str_value, element.tag,
+                                     element.sourceline)
                 try:
-                    return type_conv(str_value)
+                    return self.type_conv(str_value)
                 except ValueError:
                     raise XMLMapperLoadingError(
                         element,
@@ -182,20 +561,34 @@ class XMLMapper:
 
     class _MappingQuery(_Query):
         """Mapping query, either primary or nested."""
-        def __init__(self, mapping_type, attr, match, has_id,
+        def __init__(self, mapping_type, attr, match_xpath, match, has_id,
                      returns_list, compiled):
             XMLMapper._Query.__init__(self, mapping_type, attr)
-            self.match, self.has_id = match, has_id
+            self.match_xpath, self.match = match_xpath, match
+            self.has_id = has_id
             self.returns_list, self.compiled = returns_list, compiled
+            self.fields = tuple(
+                q.attr for q in compiled if not q.attr.startswith('_'))
+            self.loader = None
 
         def run(self, mapper, state, element, object_factory, result):
             return mapper._load_mapping(state, element, self,
                                         object_factory, result)
 
     class _State:
-        """Stores loaded objects while mapping."""
-        def __init__(self):
+        """Stores loaded objects while mapping.
+
+        If `deferred` is set values of built-in types are returned by
+        queries as `_Deferred` to be converted in bulk. `prefix_nodes`
+        caches nodes of shared XPath prefixes for the last element they
+        were evaluated on. `profiler` is `_Profiler` when collecting
+        stats.
+        """
+        def __init__(self, deferred=False):
             self._objects = {}
+            self.deferred = deferred
+            self.prefix_nodes = {}
+            self.profiler = None
 
         def add_object(self, element, obj_type, obj_id, obj):
             if obj_id is None:
@@ -221,16 +614,450 @@ class XMLMapper:
                     'id "{}".'.format(obj_type, obj_id))
             return self._objects[obj_key]
 
-    def __init__(self, mappings, filters=None):
+    class _LookupState(_State):
+        """State resolving references to objects that were not loaded
+        with `MapperObjectFactory.lookup`."""
+        def __init__(self, object_factory, deferred=False):
+            XMLMapper._State.__init__(self, deferred)
+            self._object_factory = object_factory
+            self._found = {}
+
+        def get_object(self, element, obj_type, obj_id):
+            obj_key = (obj_type, obj_id)
+            if obj_key in self._objects:
+                return self._objects[obj_key]
+            if obj_key not in self._found:
+                self._found[obj_key] = self._object_factory.lookup(
+                    obj_type, obj_id)
+            if self._found[obj_key] is None:
+                return XMLMapper._State.get_object(
+                    self, element, obj_type, obj_id)
+            return self._found[obj_key]
+
+    class _IndexState(_State):
+        """State keeping only `index.cache_size` recently used objects in
+        memory. Objects are evicted to disk-backed `index` as their id
+        and key returned by `MapperObjectFactory.handle`, and resolved
+        with `MapperObjectFactory.resolve` of that key (or `lookup` of
+        id if it's None). With `lookup_missing` objects not in index are
+        looked up by id too.
+
+        Evicted objects which creation is still postponed by
+        `_BatchingFactory` are kept until they are created.
+        """
+        def __init__(self, index, object_factory, deferred=False,
+                     lookup_missing=False):
+            XMLMapper._State.__init__(self, deferred)
+            self._objects = OrderedDict()
+            self._index = index
+            self._object_factory = object_factory
+            self._lookup_missing = lookup_missing
+            self._unflushed = {}
+            self._sweep_size = index.cache_size
+            index.clear()
+
+        def add_object(self, element, obj_type, obj_id, obj):
+            if obj_id is None:
+                raise XMLMapperLoadingError(
+                    element,
+                    '"_id" is None for type "{}".'.format(obj_type))
+            obj_key = (obj_type, obj_id)
+            if (obj_key in self._objects or obj_key in self._unflushed or
+                    obj_key in self._index):
+                raise XMLMapperLoadingError(
+                    element,
+                    'Duplicate object with id "{}" '
+                    'for type "{}"'.format(obj_id, obj_type))
+            self._cache(obj_key, obj)
+
+        def get_object(self, element, obj_type, obj_id):
+            obj_key = (obj_type, obj_id)
+            if obj_key in self._objects:
+                obj = self._objects.pop(obj_key)
+                self._objects[obj_key] = obj
+                return obj
+            if obj_key in self._unflushed:
+                return self._unflushed[obj_key]
+            obj = None
+            try:
+                handle = self._index[obj_key]
+            except KeyError:
+                if self._lookup_missing:
+                    obj = self._object_factory.lookup(obj_type, obj_id)
+            else:
+                if handle is None:
+                    obj = self._object_factory.lookup(obj_type, obj_id)
+                else:
+                    obj = self._object_factory.resolve(obj_type, handle)
+            if obj is not None:
+                self._cache(obj_key, obj)
+                return obj
+            raise XMLMapperLoadingError(
+                element,
+                'Referenced undefined "{}" object with '
+                'id "{}".'.format(obj_type, obj_id))
+
+        def _cache(self, obj_key, obj):
+            self._objects[obj_key] = obj
+            if len(self._objects) <= self._index.cache_size:
+                return
+            obj_key, obj = self._objects.popitem(last=False)
+            if not XMLMapper._Pending.is_unresolved(obj):
+                self._evict(obj_key, obj)
+                return
+            self._unflushed[obj_key] = obj
+            if len(self._unflushed) > self._sweep_size:
+                unflushed = {}
+                for k, p in six.iteritems(self._unflushed):
+                    if XMLMapper._Pending.is_unresolved(p):
+                        unflushed[k] = p
+                    else:
+                        self._evict(k, p)
+                self._unflushed = unflushed
+                self._sweep_size = max(
+                    self._index.cache_size, 2 * len(self._unflushed))
+
+        def _evict(self, obj_key, obj):
+            obj_type, obj_id = obj_key
+            self._index.add(obj_type, obj_id, self._object_factory.handle(
+                obj_type, XMLMapper._Pending.resolve(obj)))
+
+    class _Pending(object):
+        """Placeholder for object which creation is postponed."""
+        __slots__ = ('object_type', 'fields', 'obj')
+        UNRESOLVED = object()
+
+        def __init__(self, object_type, fields):
+            self.object_type, self.fields = object_type, fields
+            self.obj = self.UNRESOLVED
+
+        @classmethod
+        def is_unresolved(cls, value):
+            if isinstance(value, list):
+                return any(cls.is_unresolved(v) for v in value)
+            return isinstance(value, cls) and value.obj is cls.UNRESOLVED
+
+        @classmethod
+        def resolve(cls, value):
+            if isinstance(value, list):
+                return [cls.resolve(v) for v in value]
+            if isinstance(value, cls):
+                return value.obj
+            return value
+
+    class _BatchingFactory(object):
+        """Object factory wrapper postponing object creation so it can
+        be done in batches by `MapperObjectFactory.create_many`.
+
+        If `defer_conversion` is set `_Deferred` field values are
+        converted for whole batch at once.
+        """
+        def __init__(self, object_factory, batch_size,
+                     defer_conversion=False):
+            if batch_size < 1:
+                raise ValueError('batch_size should be positive')
+            self._object_factory = object_factory
+            self._batch_size = batch_size
+            self._defer_conversion = defer_conversion
+            self._pending = []
+            self._counts = {}
+            self.full = False
+
+        def create(self, object_type, fields):
+            pending = XMLMapper._Pending(object_type, fields)
+            self._pending.append(pending)
+            count = self._counts.get(object_type, 0) + 1
+            self._counts[object_type] = count
+            if count >= self._batch_size:
+                self.full = True
+            return pending
+
+        def flush(self, result):
+            """Creates all pending objects and resolves them in result.
+
+            Objects are created in rounds, every round creates objects
+            with all nested and referenced objects already created,
+            grouped by type. Objects of the same type are created in
+            loading order. Since nested and referenced objects are always
+            loaded before objects using them, each round creates at least
+            the earliest pending object.
+            """
+            _Pending = XMLMapper._Pending
+            pending = self._pending
+            while pending:
+                batches = OrderedDict()
+                blocked = []
+                blocked_types = set()
+                for p in pending:
+                    if p.object_type in blocked_types or any(
+                            _Pending.is_unresolved(v)
+                            for v in six.itervalues(p.fields)):
+                        blocked.append(p)
+                        blocked_types.add(p.object_type)
+                    else:
+                        batches.setdefault(p.object_type, []).append(p)
+
+                for object_type, batch in six.iteritems(batches):
+                    for i in range(0, len(batch), self._batch_size):
+                        self._create_batch(
+                            object_type, batch[i:i + self._batch_size])
+                pending = blocked
+
+            self._pending = []
+            self._counts = {}
+            self.full = False
+            result[:] = [(t, p.obj) for t, p in result]
+
+        def _create_batch(self, object_type, batch):
+            fields_list = []
+            for p in batch:
+                fields_list.append(dict(
+                    (k, XMLMapper._Pending.resolve(v))
+                    for k, v in six.iteritems(p.fields)))
+            if self._defer_conversion:
+                self._convert_deferred(fields_list)
+            objects = self._object_factory.create_many(
+                object_type, fields_list)
+            if len(objects) != len(batch):
+                raise XMLMapperError(
+                    'create_many returned {} objects instead of {} '
+                    'for type "{}"'.format(
+                        len(objects), len(batch), object_type))
+            for p, obj in zip(batch, objects):
+                p.obj, p.fields = obj, None
+
+        def _convert_deferred(self, fields_list):
+            """Converts `_Deferred` values field by field.
+
+            All values of a field come from the same query so they are
+            either all `_Deferred` of the same type or None.
+            """
+            for name in fields_list[0]:
+                deferred = [f[name] for f in fields_list
+                            if f[name] is not None]
+                if not deferred or not isinstance(deferred[0], _Deferred):
+                    continue
+                value_type, type_conv = deferred[0][:2]
+                try:
+                    values = iter(self._object_factory.convert_many(
+                        value_type, [d.value for d in deferred], type_conv))
+                except ValueError:
+                    for d in deferred:
+                        try:
+                            type_conv(d.value)
+                        except ValueError:
+                            raise XMLMapperLoadingError(
+                                _ElementInfo(d.tag, d.sourceline),
+                                'Invalid literal for {}: "{}".'.format(
+                                    value_type, d.value))
+                    raise
+                for fields in fields_list:
+                    if fields[name] is not None:
+                        fields[name] = next(values)
+
+    class _StreamParser(object):
+        """Pull parser of streaming mode reading "end" events of record
+        elements and "start" events of elements of mappings loaded from
+        their start tag.
+
+        Before each fed block completed elements that are not records
+        are deleted along the path of open elements, so subtrees that no
+        mapping uses (and records already loaded) don't stay in memory
+        until the end of document. Events of previous block have to be
+        consumed before next block is fed.
+        """
+        def __init__(self, mapper):
+            self._records, starts = mapper._get_stream_records()
+            self._start_tags = set(path[-1] for path in starts)
+            # "start" of root gives element to prune from
+            tags = set(path[-1] for path in self._records)
+            tags.update(path[0] for path in self._records)
+            tags.update(self._start_tags)
+            self._parser = etree.XMLPullParser(
+                events=('start', 'end'), tag=tags,
+                **mapper._parser_options)
+            self._root = None
+
+        def feed(self, data):
+            self._prune()
+            self._parser.feed(data)
+
+        def close(self):
+            self._parser.close()
+
+        def read_events(self):
+            for event, element in self._parser.read_events():
+                if event == 'end':
+                    yield event, element
+                    continue
+                if self._root is None and element.getparent() is None:
+                    self._root = element
+                if element.tag in self._start_tags:
+                    yield event, element
+
+        def _prune(self):
+            element = self._root
+            if element is None:
+                return
+            path = (element.tag,)
+            while path not in self._records and len(element):
+                # only the last child can still be open
+                del element[:-1]
+                element = element[0]
+                path += (element.tag,)
+
+    class _Recorder(object):
+        """Records objects creation so it can be replayed in other
+        process, used as both state and object factory.
+
+        Log entries are lists of object type, fields, whether object has
+        "_id", its value and tag and line of its element. Fields reference
+        nested objects as `_Created` with index in log and objects of other
+        types as `_Reference` that are resolved while replaying.
+
+        Optional `source_line` function maps element line numbers
+        to lines of original document.
+        """
+        deferred = False
+        profiler = None
+
+        def __init__(self, source_line=None):
+            self.log = []
+            self.source_line = source_line or (lambda line: line)
+            self.prefix_nodes = {}
+
+        def create(self, object_type, fields):
+            self.log.append([object_type, fields, False, None, None, None])
+            return _Created(len(self.log) - 1)
+
+        def add_object(self, element, obj_type, obj_id, obj):
+            self.log[obj.index][2:] = [
+                True, obj_id, element.tag,
+                self.source_line(element.sourceline)]
+
+        def get_object(self, element, obj_type, obj_id):
+            return _Reference(obj_type, obj_id, element.tag,
+                              self.source_line(element.sourceline))
+
+    class _Profiler(MapperObjectFactory):
+        """Collects `XMLMapperStats`, used in place of object factory
+        and as `profiler` of load state timing interpreter with hooks
+        that are skipped when it's None."""
+        def __init__(self, mapper, stats, object_factory):
+            self.mapper, self.stats = mapper, stats
+            self.object_factory = object_factory
+
+        def create(self, object_type, fields):
+            start = default_timer()
+            obj = self.object_factory.create(object_type, fields)
+            self.stats.factory_time += default_timer() - start
+            self.stats.factory_calls += 1
+            return obj
+
+        def create_many(self, object_type, fields_list):
+            start = default_timer()
+            objects = self.object_factory.create_many(
+                object_type, fields_list)
+            self.stats.factory_time += default_timer() - start
+            self.stats.factory_calls += 1
+            return objects
+
+        def convert_many(self, value_type, values, convert):
+            return self.object_factory.convert_many(
+                value_type, values, convert)
+
+        def iter_records(self, records):
+            """Yields records adding time of getting each of them to
+            match time of its mapping."""
+            records = iter(records)
+            while True:
+                start = default_timer()
+                try:
+                    mapping, element = next(records)
+                except StopIteration:
+                    return
+                self.matched(mapping, 1, start)
+                yield mapping, element
+
+        def matched(self, mapping, count, start):
+            """Adds matching of `count` elements started at `start` to
+            match time of mapping."""
+            mapping_stats = self.stats.mapping(mapping.mapping_type)
+            mapping_stats.matches += count
+            mapping_stats.match_time += default_timer() - start
+
+        def run_query(self, state, element, query, object_factory,
+                      result):
+            """Runs query adding its XPath and conversion times."""
+            if isinstance(query, XMLMapper._MappingQuery):
+                return query.run(self.mapper, state, element,
+                                 object_factory, result)
+            start = default_timer()
+            if query.shared:
+                value = query.xpath(element, state.prefix_nodes)
+            else:
+                value = query.xpath(element)
+            xpath_end = default_timer()
+            value = query.convert(self.mapper, state, element, value)
+            end = default_timer()
+
+            query_stats = self.stats.query(query.mapping_type, query.attr)
+            query_stats.evaluations += 1
+            query_stats.xpath_time += xpath_end - start
+            if query.value_type in self.mapper._filters:
+                query_stats.filter_time += end - xpath_end
+            else:
+                query_stats.convert_time += end - xpath_end
+            return value
+
+        def loaded(self, mapping, start):
+            """Adds object loaded since `start` to stats of mapping."""
+            mapping_stats = self.stats.mapping(mapping.mapping_type)
+            mapping_stats.objects += 1
+            mapping_stats.time += default_timer() - start
+
+    def __init__(self, mappings, filters=None, codegen=False,
+                 parser_options=None, timezone=None):
         """Creates new mapper for provided spec.
 
         Args:
             mappings: List of mapping specs to be applied in same order.
             filters: Dict of functions that can be used as custom value types
+            codegen: Generate specialized Python function for each mapping
+                instead of interpreting compiled queries.
+            parser_options: Dict of `etree.XMLParser` keyword arguments
+                (like huge_tree, collect_ids, resolve_entities, no_network,
+                remove_comments, remove_pis) updating
+                `DEFAULT_PARSER_OPTIONS`. Parsers are created once per
+                thread and reused by all loads.
+            timezone: tzinfo (or pytz timezone) of datetime values
+                without UTC offset, they are naive by default.
         """
+        self._spec = (mappings, filters, codegen, parser_options, timezone)
+        self._timezone = timezone
+        self._parser_options = dict(self.DEFAULT_PARSER_OPTIONS)
+        self._parser_options.update(parser_options or {})
+        self._parsers = threading.local()
+        self._get_parser()  # fail early on invalid options
         self._types = {}
         self._filters = filters or {}
         self._mappings = [self._compile_mapping(None, m) for m in mappings]
+        if codegen:
+            from .codegen import generate_loader
+            for mapping in six.itervalues(self._types):
+                mapping.loader = generate_loader(self, mapping)
+        self._stream_records = None
+        self._traversal_tree = None
+        self._stylesheet = None
+
+    def fields(self, mapping_type):
+        """Returns tuple of attribute names passed to object factory
+        for mapping type."""
+        return self._types[mapping_type].fields
+
+    def __reduce__(self):
+        # compiled XPath can't be pickled so mapper is compiled again
+        return self.__class__, self._spec
 
     def _compile_mapping(self, attr, mapping, returns_list=True):
         # Parses and compiles mapping spec (dict)
@@ -272,15 +1099,63 @@ class XMLMapper:
                     'Invalid query type {} for "{}" attribute '
                     'in type "{}"'.format(type(v), k, mtype))
             compiled.append(query)
+        self._share_prefixes(compiled)
 
         # Create mapping object and add it to types index
-        query_obj = self._MappingQuery(mtype, attr, match, '_id' in mapping,
-                                       returns_list, compiled)
+        query_obj = self._MappingQuery(mtype, attr, mapping['_match'], match,
+                                       '_id' in mapping, returns_list,
+                                       compiled)
         self._types[mtype] = query_obj
         return query_obj
 
     def _compile_xpath(self, xpath):
-        return etree.XPath(xpath, smart_strings=False)
+        """Compiles XPath expression into callable returning same results
+        as `etree.XPath`.
+
+        Attribute and text() queries on the element itself are evaluated
+        without libxml2 XPath engine as it has noticeable per call
+        overhead. Child element steps are left to XPath since lxml
+        element iteration is not faster. XPath evaluators are compiled per
+        thread so mapper can be used from several threads at once.
+        """
+        if self._RX_ATTRIBUTE_PATH.match(xpath):
+            return self._AttributeXPath(xpath)
+        if xpath == 'text()':
+            return self._TextXPath()
+        return self._ThreadLocalXPath(xpath)
+
+    def _share_prefixes(self, compiled):
+        """Replaces XPath of queries (and matches of nested mappings)
+        with the same child elements path followed by "@name", "text()"
+        or nothing with `_SharedPrefixXPath`, so the path is evaluated
+        once per loaded element."""
+        groups = OrderedDict()
+        for query in compiled:
+            if isinstance(query, self._MappingQuery):
+                path = query.match_xpath
+            else:
+                path = query.xpath.path
+            m = self._RX_CHILD_PATH.match(path)
+            if m is not None:
+                groups.setdefault(m.group('prefix'), []).append(
+                    (query, m.group('last')))
+
+        for prefix, queries in six.iteritems(groups):
+            if len(queries) < 2:
+                continue
+            prefix_xpath = self._compile_xpath(prefix)
+            for query, last in queries:
+                last_xpath = None if last is None else \
+                    self._compile_xpath(last)
+                if isinstance(query, self._MappingQuery):
+                    query.match = self._SharedPrefixXPath(
+                        query.match_xpath, prefix_xpath, last_xpath,
+                        query.match)
+                else:
+                    query.xpath = self._SharedPrefixXPath(
+                        query.xpath.path, prefix_xpath, last_xpath,
+                        query.xpath)
+                query.shared = True
 
     def _compile_query(self, mapping_type, attr, query):
         """Parses and compiles attribute query spec ([type:] xpath)"""
@@ -291,7 +1166,13 @@ class XMLMapper:
         if q_type is None:
             q_type = 'string'
 
-        if q_type not in self._VALUE_TYPES and q_type not in self._filters:
+        q_args = q_match.group('args')
+        # mapping types named as datetime types override them unless
+        # used with format
+        is_value_type = q_type in self._VALUE_TYPES and not (
+            q_type in datetimes.VALUE_TYPES and q_args is None and
+            q_type in self._types)
+        if not is_value_type and q_type not in self._filters:
             if q_type not in self._types:
                 raise XMLMapperSyntaxError(
                     'Unknown value type "{}" for "{}" attribute '
@@ -307,64 +1188,772 @@ class XMLMapper:
                 'In type "{}" attribute "_id" is required '
                 'to be a string.'.format(mapping_type))
 
+        if q_args is not None and q_type not in datetimes.VALUE_TYPES:
+            raise XMLMapperSyntaxError(
+                'Value type "{}" of "{}" attribute in type "{}" has no '
+                'format'.format(q_type, attr, mapping_type))
+        if q_type in datetimes.VALUE_TYPES and q_args is None and (
+                q_type in self._filters or q_type in self._types):
+            # filters and mapping types named as datetime types
+            # override them
+            type_conv = None
+        elif q_type in datetimes.VALUE_TYPES and (
+                q_args is not None or self._timezone is not None):
+            type_conv = datetimes.compile_parser(
+                q_type, q_args, self._timezone)
+        else:
+            type_conv = self._VALUE_TYPES.get(q_type)
+
         q_xpath = self._compile_xpath(q_match.group('xpath'))
-        return self._XPathQuery(mapping_type, attr, q_type, q_xpath)
+        return self._XPathQuery(mapping_type, attr, q_type, q_xpath,
+                                type_conv)
+
+    def _get_stylesheet(self):
+        """Returns `xslt.Stylesheet` of mappings compiling it on first
+        use."""
+        if self._stylesheet is None:
+            from .xslt import Stylesheet
+            self._stylesheet = Stylesheet(self)
+        return self._stylesheet
+
+    def _get_stream_records(self):
+        """Returns streaming records and start mappings specs compiling
+        them on first use."""
+        if self._stream_records is None:
+            self._stream_records = self._compile_stream_records()
+        return self._stream_records
+
+    def _compile_stream_records(self):
+        """Groups top-level mappings into records for streaming mode.
+
+        Mappings which `_match` path is an ancestor of `_match` of other
+        mappings and which only query attributes of their element are
+        loaded from start tag of the element, so its content can be
+        pruned. Of the other mappings, record is an element matched by
+        the shortest absolute `_match` path, mappings with longer paths
+        under it are evaluated relatively to the record element once it
+        is closed. Records matching root element that other mappings are
+        under are rejected, as they would keep whole document in memory.
+
+        Returns:
+            Tuple of dict of record path tuples to lists of (mapping,
+            relative match) pairs where relative match is None for the
+            record itself and dict of path tuples to lists of mappings
+            loaded from start tag.
+        """
+        paths = []
+        for mapping in self._mappings:
+            if not self._RX_ABSOLUTE_PATH.match(mapping.match_xpath):
+                raise XMLMapperSyntaxError(
+                    'Streaming mode requires "_match" to be an absolute '
+                    'path of element names in type "{}"'.format(
+                        mapping.mapping_type))
+            paths.append(tuple(mapping.match_xpath[1:].split('/')))
+
+        starts = {}
+        record_paths = []
+        for mapping, path in zip(self._mappings, paths):
+            is_ancestor = any(
+                len(p) > len(path) and p[:len(path)] == path for p in paths)
+            if is_ancestor and all(
+                    isinstance(q, self._XPathQuery) and
+                    isinstance(q.xpath, self._AttributeXPath)
+                    for q in mapping.compiled):
+                starts.setdefault(path, []).append(mapping)
+            else:
+                record_paths.append((mapping, path))
+
+        records = {}
+        for mapping, path in record_paths:
+            record = min((p for _, p in record_paths
+                          if path[:len(p)] == p), key=len)
+            if record == path:
+                match = None
+            else:
+                if len(record) == 1:
+                    raise XMLMapperSyntaxError(
+                        'Streaming mode would keep whole document in '
+                        'memory as "_match" of type "{}" is ancestor of '
+                        '"_match" of type "{}" and its element is used '
+                        'beyond its attributes'.format(
+                            next(m for m, p in record_paths
+                                 if p == record).mapping_type,
+                            mapping.mapping_type))
+                match = self._compile_xpath('/'.join(path[len(record):]))
+            records.setdefault(record, []).append((mapping, match))
+        return records, starts
+
+    def _iter_tree_records(self, root):
+        """Yields (mapping, element) pairs for all top-level matches."""
+        for mapping in self._mappings:
+            for element in mapping.match(root):
+                yield mapping, element
+
+    def _get_traversal_tree(self):
+        """Returns tree of element names of simple absolute "_match"
+        paths building it on first use.
 
-    def load(self, xml, object_factory):
+        Each node is a pair of list of indexes of mappings matching it
+        and dict of child nodes by element name.
+        """
+        if self._traversal_tree is None:
+            tree = {}
+            for index, mapping in enumerate(self._mappings):
+                if not self._RX_ABSOLUTE_PATH.match(mapping.match_xpath):
+                    continue
+                node = ([], tree)
+                for tag in mapping.match_xpath[1:].split('/'):
+                    node = node[1].setdefault(tag, ([], {}))
+                node[0].append(index)
+            self._traversal_tree = tree
+        return self._traversal_tree
+
+    def _iter_single_pass_records(self, root):
+        """Yields (mapping, element) pairs for all top-level matches
+        in the same order as `_iter_tree_records`.
+
+        Matches of simple absolute paths are collected for all mappings
+        at once visiting each element at most once, other mappings are
+        matched by XPath.
+        """
+        tree = self._get_traversal_tree()
+        matches = [[] for _ in self._mappings]
+        root_el = root.getroot() if hasattr(root, 'getroot') else root
+        node = tree.get(root_el.tag)
+        if node is not None:
+            for index in node[0]:
+                matches[index].append(root_el)
+            self._collect_matches(root_el, node[1], matches)
+
+        for index, mapping in enumerate(self._mappings):
+            if self._RX_ABSOLUTE_PATH.match(mapping.match_xpath):
+                elements, matches[index] = matches[index], None
+            else:
+                elements = mapping.match(root)
+            for element in elements:
+                yield mapping, element
+
+    def _collect_matches(self, element, children, matches):
+        """Adds element descendants matching traversal tree to matches"""
+        for tag, (indexes, node_children) in six.iteritems(children):
+            elements = list(element.iterchildren(tag))
+            for index in indexes:
+                matches[index].extend(elements)
+            if node_children:
+                for child in elements:
+                    self._collect_matches(child, node_children, matches)
+
+    def _iter_stream_records(self, events):
+        """Yields (mapping, element) pairs for records closed by "end"
+        events and mappings loaded from start tag by "start" events of an
+        incremental parser.
+
+        Each record element is cleared together with its preceding
+        siblings after all its pairs were consumed, other elements are
+        deleted by `_StreamParser`.
+        """
+        records, starts = self._get_stream_records()
+        for event, element in events:
+            path = [element.tag]
+            path.extend(a.tag for a in element.iterancestors())
+            path.reverse()
+            if event == 'start':
+                for mapping in starts.get(tuple(path), ()):
+                    yield mapping, element
+                continue
+            record = records.get(tuple(path))
+            if record is None:
+                continue
+
+            for mapping, match in record:
+                if match is None:
+                    yield mapping, element
+                else:
+                    for match_el in match(element):
+                        yield mapping, match_el
+
+            element.clear()
+            parent = element.getparent()
+            # root record may be preceded by comments outside of tree
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    def load(self, xml, object_factory, **kwargs):
         """Parse XML bytes and load objects according to spec.
 
         Args:
-            xml: binary string (bytes) containing XML.
+            xml: bytes, bytearray, memoryview or mmap containing XML.
+                Buffers other than bytes are fed to parser in slices of
+                `BUFFER_FEED_SIZE`, so only one slice is copied at a time.
             object_factory: `MapperObjectFactory` for creating objects.
+            **kwargs: Loading options, see `iter_load_file`.
 
         Returns:
             List of loaded objects as returned by `object_factory`.
         """
-        return self.load_file(BytesIO(xml), object_factory)
+        return self.load_file(_Buffer(xml), object_factory, **kwargs)
 
-    def load_file(self, xml_file, object_factory):
+    def load_file(self, xml_file, object_factory, **kwargs):
         """Parse XML file and load objects according to spec.
 
         Args:
             xml: file, file-like object, filename or url to get XML from.
             object_factory: `MapperObjectFactory` for creating objects.
+            **kwargs: Loading options, see `iter_load_file`.
+
+        Returns:
+            List of loaded objects as returned by `object_factory`.
+        """
+        return [obj for _, obj in self.iter_load_file(
+            xml_file, object_factory, **kwargs)]
+
+    def iter_load(self, xml, object_factory, **kwargs):
+        """Same as `load` but yields (object_type, object) pairs.
+
+        See `iter_load_file` for details.
+        """
+        return self.iter_load_file(_Buffer(xml), object_factory, **kwargs)
+
+    def iter_load_file(self, xml_file, object_factory, streaming=False,
+                       batch_size=None, single_pass=False, split=None,
+                       workers=None, stats=None, use_mmap=False,
+                       incremental=None, defer_conversion=False,
+                       index=None, xslt=False):
+        """Parse XML file and yield objects as they are loaded.
+
+        Objects are yielded in the same order they are created by
+        `object_factory` right after each top-level matched element
+        is processed and are not referenced by mapper afterwards unless
+        they have "_id".
+
+        In streaming mode document is parsed incrementally and every
+        matched element is processed as soon as it is closed and then
+        cleared, as are elements that no mapping uses, so memory usage
+        doesn't depend on document size. This
+        requires all top-level "_match" attributes to be absolute paths
+        of element names (like "/feed/events/event") and attribute
+        queries not to look outside of the matched element except for
+        its ancestors. Objects are created in document order instead of
+        mappings order, so referenced objects have to precede references
+        in the document. Mappings with "_match" that is an ancestor of
+        other "_match" and only attribute queries are loaded from start
+        tag of their element, other such mappings keep their element in
+        memory until it's closed and can't match root element.
+
+        With `single_pass` document is traversed once collecting matches
+        for all mappings with "_match" in form of absolute path of element
+        names instead of evaluating every "_match" separately. Objects
+        are created in the same order as without it.
+
+        With `split` set to an absolute path of element names that is
+        "_match" of some mappings (like "/feed/events/event") file is split
+        into chunks of elements matching it which are parsed and mapped by
+        pool of `workers` processes. Mappings with "_match" under this path
+        are applied to chunks and other mappings to the rest of document,
+        so their attribute queries can only look at the chunk they are
+        in. "_match" of all top-level mappings has to be an absolute path
+        of element names not matching ancestors of split elements. Objects
+        are created in calling process in the same order as without
+        splitting. `xml_file` has to be a local filename and mapper and
+        its filters have to be picklable unless processes are forked.
+        File has to be in ASCII compatible encoding. Chunks are found by
+        scanning file in calling process before mapping starts, which
+        takes about half the time of parsing it. Only `batch_size` and
+        `workers` options can be combined with it.
+
+        If `batch_size` is set objects are created by
+        `MapperObjectFactory.create_many` instead of `create`. Fields
+        are collected per type and all pending objects are created once
+        any type collects `batch_size` of them, nested and referenced
+        objects are created before objects using them. Objects are
+        yielded after they are created. With `defer_conversion` int,
+        float, bool, datetime, date and time values are converted for
+        whole batch field by field right before `create_many` instead of
+        one by one.
+
+        If `stats` is set to `XMLMapperStats` counters and time of
+        matching mappings, evaluating attribute queries and creating
+        objects are added to it. Generated code is not used while
+        collecting stats, match time in streaming mode includes parsing.
+
+        With `use_mmap` local file is mapped into memory and fed to
+        parser in slices of `BUFFER_FEED_SIZE` instead of being read
+        through file object.
+
+        With `incremental` set to `incremental.FingerprintStore` records
+        (top-level matched elements) unchanged since previous load with
+        the same store are skipped, only objects of new and changed
+        records are created. References to objects with "_id" that were
+        not created are resolved by `MapperObjectFactory.lookup`.
+
+        With `index` set to `index.SqliteIndex` only objects with "_id"
+        most recently added or referenced are kept in memory, others are
+        stored on disk as their id and `MapperObjectFactory.handle` and
+        references to them are resolved by `MapperObjectFactory.resolve`
+        (or `lookup` if `handle` returned None).
+
+        With `xslt` all mappings are evaluated by single XSLT transform
+        of parsed document compiled from them, so XPath queries are run by
+        libxslt instead of being called from Python for every attribute
+        of every object. Can't be used in streaming or single pass modes,
+        with stats or incremental loading. It is not a speed option:
+        transform result is built before loading and decoding it costs
+        more than calling XPath, so on simple mappings it is slower than
+        the interpreter and uses more memory.
+
+        Args:
+            xml: file, file-like object, filename or url to get XML from.
+            object_factory: `MapperObjectFactory` for creating objects.
+            streaming: Use streaming mode.
+            batch_size: Maximum number of objects passed to
+                `MapperObjectFactory.create_many`.
+            single_pass: Collect matches of all mappings in one pass,
+                can't be used with `streaming`.
+            split: Path of elements to split file into chunks by.
+            workers: Number of worker processes for `split`, number of CPUs
+                by default. Requires `split`.
+            stats: `XMLMapperStats` to collect stats to.
+            use_mmap: Map file into memory, `xml_file` has to be
+                a filename.
+            incremental: `FingerprintStore` of previous load.
+            defer_conversion: Convert built-in types in bulk, requires
+                `batch_size`.
+            index: `SqliteIndex` to store evicted objects in.
+            xslt: Evaluate mappings by XSLT transform.
+
+        Yields:
+            Tuples of object type (as in "_type" attribute of mapping)
+            and loaded object as returned by `object_factory`.
+        """
+        if split is not None:
+            if (stats is not None or incremental is not None or
+                    index is not None or xslt or streaming or
+                    single_pass or use_mmap or defer_conversion):
+                raise ValueError(
+                    'stats, incremental, index, xslt, streaming, '
+                    'single_pass, use_mmap and defer_conversion can not '
+                    'be used with split')
+            from .parallel import iter_split_logs
+            logs = iter_split_logs(self, xml_file, split, workers)
+            for item in self._iter_load(
+                    logs, self._replay, object_factory, batch_size):
+                yield item
+            return
+        if workers is not None:
+            raise ValueError('workers requires split')
+
+        if use_mmap:
+            with open(xml_file, 'rb') as f:
+                xml_file = _Buffer(
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            try:
+                for item in self.iter_load_file(
+                        xml_file, object_factory, streaming=streaming,
+                        batch_size=batch_size, single_pass=single_pass,
+                        stats=stats, incremental=incremental,
+                        defer_conversion=defer_conversion, index=index,
+                        xslt=xslt):
+                    yield item
+            finally:
+                xml_file.data.close()
+            return
+
+        start = default_timer()
+        if streaming:
+            if xslt:
+                raise ValueError('xslt can not be used with streaming')
+            if single_pass:
+                raise ValueError('single_pass can not be used with streaming')
+            if isinstance(xml_file, _Buffer):
+                events = self._iter_buffer_events(xml_file.data)
+            else:
+                events = self._iter_file_events(xml_file)
+            records = self._iter_stream_records(events)
+        else:
+            records = self._iter_parsed_records(
+                self._parse(xml_file), single_pass, xslt)
+
+        for item in self._iter_load_records(
+                records, object_factory, batch_size, stats, start,
+                incremental, defer_conversion, index, xslt):
+            yield item
+
+    def parse(self, xml_file, use_mmap=False):
+        """Parse XML file the same way `load_file` does.
+
+        Parsed tree can be loaded by `load_tree` of several mappers
+        to parse document only once.
+
+        Args:
+            xml_file: file, file-like object, filename or url to get XML
+                from.
+            use_mmap: Map file into memory, `xml_file` has to be
+                a filename.
+
+        Returns:
+            `etree.ElementTree` of document.
+        """
+        if not use_mmap:
+            return self._parse(xml_file)
+        with open(xml_file, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return self._parse(_Buffer(data))
+        finally:
+            data.close()
+
+    def _get_parser(self):
+        """Returns parser of current thread creating it on first use"""
+        parser = getattr(self._parsers, 'parser', None)
+        if parser is None:
+            parser = etree.XMLParser(**self._parser_options)
+            self._parsers.parser = parser
+        return parser
+
+    def _parse(self, xml_file):
+        parser = self._get_parser()
+        if isinstance(xml_file, _Buffer):
+            if isinstance(xml_file.data, bytes):
+                return etree.fromstring(xml_file.data, parser).getroottree()
+            return self._parse_buffer(parser, xml_file.data)
+        return etree.parse(xml_file, parser)
+
+    def _parse_buffer(self, parser, data):
+        """Parses buffer other than bytes feeding it to parser in slices
+        of `BUFFER_FEED_SIZE`, as older lxml versions only parse bytes
+        and strings with `etree.fromstring`."""
+        view = memoryview(data)
+        try:
+            for start in range(0, len(view), self.BUFFER_FEED_SIZE):
+                parser.feed(view[start:start + self.BUFFER_FEED_SIZE]
+                            .tobytes())
+            return parser.close().getroottree()
+        except BaseException:
+            # parser may be left in the middle of document
+            self._parsers.parser = None
+            raise
+        finally:
+            view.release()
+
+    def load_tree(self, tree, object_factory, **kwargs):
+        """Load objects from already parsed document.
+
+        Args:
+            tree: `etree.ElementTree` or element, as returned by `parse`.
+                Tree is not modified so it can be loaded by other mappers.
+            object_factory: `MapperObjectFactory` for creating objects.
+            **kwargs: Loading options, see `iter_load_tree`.
 
         Returns:
             List of loaded objects as returned by `object_factory`.
         """
-        parser = etree.XMLParser(remove_blank_text=True)
-        root = etree.parse(xml_file, parser)
+        return [obj for _, obj in self.iter_load_tree(
+            tree, object_factory, **kwargs)]
+
+    def iter_load_tree(self, tree, object_factory, batch_size=None,
+                       single_pass=False, stats=None, incremental=None,
+                       defer_conversion=False, index=None, xslt=False):
+        """Same as `load_tree` but yields (object_type, object) pairs.
+
+        Options are the same as for `iter_load_file`.
+        """
+        start = default_timer()
+        records = self._iter_parsed_records(tree, single_pass, xslt)
+        return self._iter_load_records(
+            records, object_factory, batch_size, stats, start, incremental,
+            defer_conversion, index, xslt)
+
+    def _iter_parsed_records(self, root, single_pass, xslt):
+        """Returns (mapping, element) pairs of parsed document, elements
+        are records of XSLT transform result with `xslt`."""
+        if xslt:
+            if single_pass:
+                raise ValueError('xslt can not be used with single_pass')
+            return self._get_stylesheet().iter_records(root)
+        if single_pass:
+            return self._iter_single_pass_records(root)
+        return self._iter_tree_records(root)
+
+    def _iter_load_records(self, records, object_factory, batch_size, stats,
+                           start, incremental, defer_conversion, index,
+                           xslt):
+        """Loads (mapping, element) pairs collecting stats and skipping
+        unchanged records if necessary"""
+        if defer_conversion and batch_size is None:
+            raise ValueError('defer_conversion requires batch_size')
+        if xslt and (stats is not None or incremental is not None):
+            raise ValueError(
+                'stats and incremental can not be used with xslt')
+        if incremental is not None:
+            records = incremental.iter_changed(self, records)
+        if index is not None:
+            state = self._IndexState(
+                index, object_factory, defer_conversion,
+                lookup_missing=incremental is not None)
+        elif incremental is not None:
+            state = self._LookupState(object_factory, defer_conversion)
+        else:
+            state = self._State(defer_conversion)
+
+        if xslt:
+            load_record = self._get_stylesheet().load_record
+        elif stats is None:
+            load_record = self._load_record
+            if batch_size is None and getattr(
+                    object_factory, 'positional', False):
+                load_record = self._load_record_positional
+        else:
+            profiler = state.profiler = self._Profiler(
+                self, stats, object_factory)
+            records = profiler.iter_records(records)
+            load_record, object_factory = self._load_record, profiler
+
+        try:
+            for item in self._iter_load(
+                    records, load_record, object_factory, batch_size, state):
+                yield item
+        except BaseException:
+            if incremental is not None:
+                incremental.rollback()
+            raise
+        finally:
+            if stats is not None:
+                stats.total_time += default_timer() - start
+        if incremental is not None:
+            incremental.commit()
+
+    def _iter_buffer_events(self, data):
+        """Parses buffer incrementally yielding "end" events of record
+        elements, buffer is fed to parser in slices."""
+        parser = self._StreamParser(self)
+        view = memoryview(data)
+        try:
+            for start in range(0, len(view), self.BUFFER_FEED_SIZE):
+                parser.feed(view[start:start + self.BUFFER_FEED_SIZE]
+                            .tobytes())
+                for event in parser.read_events():
+                    yield event
+        finally:
+            view.release()
+        parser.close()
+        for event in parser.read_events():
+            yield event
+
+    def _iter_file_events(self, xml_file):
+        """Same as `_iter_buffer_events` for file-like object, filename
+        or url, which is read in blocks of `BUFFER_FEED_SIZE`.
+
+        Pull parser is used instead of `etree.iterparse` so it accepts
+        the same parser options as other load modes.
+        """
+        if isinstance(xml_file, six.string_types):
+            if self._RX_URL.match(xml_file):
+                source = closing(urlopen(xml_file))
+            else:
+                source = open(xml_file, 'rb')
+            with source as f:
+                for event in self._iter_file_events(f):
+                    yield event
+            return
+        parser = self._StreamParser(self)
+        block = xml_file.read(self.BUFFER_FEED_SIZE)
+        while block:
+            parser.feed(block)
+            for event in parser.read_events():
+                yield event
+            block = xml_file.read(self.BUFFER_FEED_SIZE)
+        parser.close()
+        for event in parser.read_events():
+            yield event
+
+    def _iter_load(self, units, load_unit, object_factory, batch_size,
+                   state=None):
+        """Loads units (records or recorded logs) one by one yielding
+        created objects.
+
+        Args:
+            units: Iterable of units to load.
+            load_unit: Function with (state, unit, object_factory, result)
+                arguments loading single unit.
+            object_factory: `MapperObjectFactory` for creating objects.
+            batch_size: Batch size for `create_many` or None.
+            state: `_State` to use instead of new one.
+        """
+        if state is None:
+            state = self._State()
+        if batch_size is not None:
+            object_factory = self._BatchingFactory(
+                object_factory, batch_size, state.deferred)
+
         result = []
-        state = self._State()
-        for mapping in self._mappings:
-            self._load_mapping(state, root, mapping, object_factory, result)
-        return result
+        for unit in units:
+            load_unit(state, unit, object_factory, result)
+            if batch_size is not None:
+                if not object_factory.full:
+                    continue
+                object_factory.flush(result)
+            for item in result:
+                yield item
+            del result[:]
+
+        if batch_size is not None:
+            object_factory.flush(result)
+            for item in result:
+                yield item
+
+    def load_files(self, xml_files, object_factory, workers=None,
+                   batch_size=None):
+        """Parse and map XML files in process pool and load objects.
+
+        Files are parsed and mapped by worker processes, object fields are
+        sent back and objects are created by `object_factory` in calling
+        process. Objects are created in the same order and "_id" references
+        are resolved in the same way as if all files were loaded one after
+        another by single `load_file` call, so files can reference objects
+        from preceding files. Mapper and its filters have to be picklable
+        unless processes are forked.
 
-    def _load_mapping(self, state, element, mapping, object_factory, result):
-        """Matches mapping and processes its attributes"""
-        objects = []
-        for match_el in mapping.match(element):
-            # load attributes
-            internal_data = {}
-            data = {}
-            for query in mapping.compiled:
-                value = query.run(self, state, match_el,
-                                  object_factory, result)
-                if query.attr.startswith('_'):
-                    internal_data[query.attr] = value
-                else:
-                    data[query.attr] = value
+        Args:
+            xml_files: List of filenames or urls to get XML from.
+            object_factory: `MapperObjectFactory` for creating objects.
+            workers: Number of worker processes, number of CPUs by default.
+            batch_size: Maximum number of objects passed to
+                `MapperObjectFactory.create_many` (see `iter_load_file`).
 
-            obj = object_factory.create(mapping.mapping_type, data)
-            objects.append(obj)
-            result.append(obj)
+        Returns:
+            List of loaded objects as returned by `object_factory`.
+        """
+        from .parallel import iter_file_logs
+        logs = iter_file_logs(self, xml_files, workers)
+        return [obj for _, obj in self._iter_load(
+            logs, self._replay, object_factory, batch_size)]
 
-            # add object to index if necessary
-            if mapping.has_id:
-                assert '_id' in internal_data
-                state.add_object(
-                    match_el, mapping.mapping_type, internal_data['_id'], obj)
+    def load_stream(self, chunks, object_factory):
+        """Parse XML from asynchronous stream of bytes and load objects.
 
+        Coroutine (requires Python 3.5+) feeding chunks into incremental
+        parser, records are loaded as soon as they are closed like in
+        streaming mode of `iter_load_file` so mappings have the same
+        restrictions. If `create` of `object_factory` is a coroutine
+        function it is awaited for each object.
+
+        Args:
+            chunks: Async iterable of bytes.
+            object_factory: `MapperObjectFactory` for creating objects.
+
+        Returns:
+            Awaitable of list of loaded objects as returned by
+            `object_factory`.
+        """
+        from .aio import load_stream
+        return load_stream(self, chunks, object_factory)
+
+    def _record(self, records, recorder=None):
+        """Loads (mapping, element) pairs with `_Recorder`.
+
+        Returns:
+            List of (mapping index, log) pairs, one for each run of
+            consecutive records of the same top-level mapping.
+        """
+        indexes = dict((id(m), i) for i, m in enumerate(self._mappings))
+        recorder = recorder or self._Recorder()
+        groups = []
+        index = None
+        for mapping, element in records:
+            if indexes[id(mapping)] != index:
+                index = indexes[id(mapping)]
+                recorder.log = []
+                groups.append((index, recorder.log))
+            self._load_element(recorder, element, mapping, recorder, [])
+        return groups
+
+    def _load_record(self, state, record, object_factory, result):
+        """Loads (mapping, element) pair"""
+        mapping, element = record
+        self._load_element(state, element, mapping, object_factory, result)
+
+    def _load_record_positional(self, state, record, object_factory,
+                                result):
+        """Loads (mapping, element) pair with `create_positional`"""
+        mapping, element = record
+        self._load_element_positional(
+            state, element, mapping, object_factory, result)
+
+    def _load_element_positional(self, state, element, mapping,
+                                 object_factory, result):
+        """Same as `_load_element` but collects values in order of
+        `mapping.fields` and passes them to `create_positional` of
+        object factory instead of building fields dict."""
+        values = []
+        obj_id = None
+        for query in mapping.compiled:
+            if isinstance(query, self._MappingQuery):
+                value = self._load_mapping(
+                    state, element, query, object_factory, result,
+                    self._load_element_positional)
+            else:
+                value = query.run(self, state, element, object_factory,
+                                  result)
+            if query.attr == '_id':
+                obj_id = value
+            elif not query.attr.startswith('_'):
+                values.append(value)
+
+        obj = object_factory.create_positional(mapping.mapping_type, values)
+        result.append((mapping.mapping_type, obj))
+        if mapping.has_id:
+            state.add_object(element, mapping.mapping_type, obj_id, obj)
+        return obj
+
+    def _replay(self, state, log, object_factory, result):
+        """Creates objects recorded by `_Recorder` adding them to result"""
+        created = []
+        for object_type, fields, has_id, obj_id, tag, line in log:
+            for k, v in six.iteritems(fields):
+                fields[k] = self._resolve_recorded(state, created, v)
+            obj = object_factory.create(object_type, fields)
+            created.append(obj)
+            result.append((object_type, obj))
+            if has_id:
+                state.add_object(
+                    _ElementInfo(tag, line), object_type, obj_id, obj)
+
+    def _resolve_recorded(self, state, created, value):
+        """Replaces `_Created` and `_Reference` in recorded field value
+        with objects"""
+        if isinstance(value, _Created):
+            return created[value.index]
+        if isinstance(value, _Reference):
+            return state.get_object(
+                _ElementInfo(value.tag, value.sourceline),
+                value.obj_type, value.obj_id)
+        if isinstance(value, list):
+            return [self._resolve_recorded(state, created, v) for v in value]
+        return value
+
+    def _load_mapping(self, state, element, mapping, object_factory, result,
+                      load_element=None):
+        """Matches mapping and processes its attributes with
+        `load_element` (`_load_element` by default)"""
+        load_element = load_element or self._load_element
+        profiler = state.profiler
+        if profiler is not None:
+            start = default_timer()
+        objects = []
+        if mapping.shared:
+            elements = mapping.match(element, state.prefix_nodes)
+        else:
+            elements = mapping.match(element)
+        if profiler is not None:
+            profiler.matched(mapping, len(elements), start)
+        for match_el in elements:
+            objects.append(load_element(
+                state, match_el, mapping, object_factory, result))
+        return self._mapping_result(element, mapping, objects)
+
+    def _mapping_result(self, element, mapping, objects):
+        """Returns value of mapping query for objects it loaded"""
         if not mapping.returns_list:
             if len(objects) == 0:
                 return None
@@ -376,3 +1965,40 @@ class XMLMapper:
                     'Nested mapping returned more than one '
                     'object ({}).'.format(len(objects)))
         return objects
+
+    def _load_element(self, state, element, mapping, object_factory, result):
+        """Processes mapping attributes for single matched element"""
+        profiler = state.profiler
+        if profiler is None:
+            if mapping.loader is not None:
+                return mapping.loader(state, element, object_factory, result)
+        else:
+            # generated loaders have no timing hooks
+            start = default_timer()
+
+        # load attributes
+        internal_data = {}
+        data = {}
+        for query in mapping.compiled:
+            if profiler is None:
+                value = query.run(self, state, element, object_factory,
+                                  result)
+            else:
+                value = profiler.run_query(state, element, query,
+                                           object_factory, result)
+            if query.attr.startswith('_'):
+                internal_data[query.attr] = value
+            else:
+                data[query.attr] = value
+
+        obj = object_factory.create(mapping.mapping_type, data)
+        result.append((mapping.mapping_type, obj))
+
+        # add object to index if necessary
+        if mapping.has_id:
+            assert '_id' in internal_data
+            state.add_object(
+                element, mapping.mapping_type, internal_data['_id'], obj)
+        if profiler is not None:
+            profiler.loaded(mapping, start)
+        return obj
@@ -0,0 +1,176 @@
+"""Evaluates all queries of mappings by single XSLT transform.
+
+Mappings are compiled into stylesheet with named template per mapping
+which copies matched element (so its tag and line are kept for error
+messages) and outputs results of attribute queries as its attributes
+named by query index, prefixed by kind of result:
+
+    s<text>  string or single node, as in `_XPathQuery._get_string`
+    n<1.5>   number
+    b<true>  boolean
+    N        element without text before its first child
+    e        more than one node
+
+or no attribute if no nodes are found. Nested mappings output their
+elements in child element per query. Transform runs in libxslt and its
+result is decoded into the same factory calls as
+`XMLMapper._load_element` makes. XPath numbers are formatted by libxml2,
+so results of numeric XPath expressions may have fewer significant
+digits than with interpreter.
+"""
+import threading
+
+from lxml import etree
+
+from .xmlmapper import XMLMapper
+
+XSL_NAMESPACE = 'http://www.w3.org/1999/XSL/Transform'
+EXSL_NAMESPACE = 'http://exslt.org/common'
+
+# XPath result passed to `_XPathQuery.convert` for kind of result
+_MULTIPLE = [None, None]
+_VALUES = {
+    's': lambda value: [value[1:]],
+    'n': lambda value: float(value[1:]),
+    'b': lambda value: value == 'btrue',
+    'N': lambda value: [None],
+    'e': lambda value: _MULTIPLE,
+}
+
+
+class Stylesheet(object):
+    """Mapper compiled into XSLT transform, compiled separately for each
+    thread as XSLT objects can't be shared between threads."""
+
+    def __init__(self, mapper):
+        self._mapper = mapper
+        self._names = dict(
+            (mapping, 'm{}'.format(i))
+            for i, mapping in enumerate(mapper._types.values()))
+        # (query, attribute name or None for nested mapping) per mapping
+        self._fields = {}
+        self.document = self._compile()
+        self._local = threading.local()
+        self._local.transform = etree.XSLT(self.document)
+
+    def iter_records(self, tree):
+        """Transforms tree yielding (mapping, record) pairs of top-level
+        mappings in the same order as `XMLMapper._iter_tree_records`."""
+        try:
+            transform = self._local.transform
+        except AttributeError:
+            transform = self._local.transform = etree.XSLT(self.document)
+        groups = transform(tree).getroot()
+        for mapping, group in zip(self._mapper._mappings, groups):
+            for record in group:
+                yield mapping, record
+
+    def load_record(self, state, record, object_factory, result):
+        """Loads (mapping, record) pair."""
+        mapping, record = record
+        self._load_record(state, record, mapping, object_factory, result)
+
+    def _load_record(self, state, record, mapping, object_factory, result):
+        mapper = self._mapper
+        fields = record.attrib
+        nested = iter(record)
+        internal_data = {}
+        data = {}
+        for query, name in self._fields[mapping]:
+            if name is None:
+                value = mapper._mapping_result(record, query, [
+                    self._load_record(
+                        state, element, query, object_factory, result)
+                    for element in next(nested)])
+            else:
+                value = fields.get(name)
+                if value is None:
+                    value = []
+                elif value[0] == 's':
+                    value = [value[1:]]
+                else:
+                    value = _VALUES[value[0]](value)
+                value = query.convert(mapper, state, record, value)
+            if query.attr.startswith('_'):
+                internal_data[query.attr] = value
+            else:
+                data[query.attr] = value
+
+        obj = object_factory.create(mapping.mapping_type, data)
+        result.append((mapping.mapping_type, obj))
+        if mapping.has_id:
+            state.add_object(
+                record, mapping.mapping_type, internal_data['_id'], obj)
+        return obj
+
+    def _compile(self):
+        root = etree.Element(
+            _xsl('stylesheet'), version='1.0',
+            nsmap={'xsl': XSL_NAMESPACE, 'exsl': EXSL_NAMESPACE})
+        main = etree.SubElement(root, _xsl('template'), match='/')
+        groups = etree.SubElement(etree.SubElement(main, 'out'),
+                                  _xsl('for-each'), select='*')
+        for mapping in self._mapper._mappings:
+            self._call_mapping(etree.SubElement(groups, 'g'), mapping)
+        for mapping, name in self._names.items():
+            template = etree.SubElement(root, _xsl('template'), name=name)
+            record = etree.SubElement(template, _xsl('copy'))
+            fields = self._fields[mapping] = []
+            # attributes have to be added before child elements
+            for i, query in enumerate(mapping.compiled):
+                if not isinstance(query, XMLMapper._MappingQuery):
+                    name = 'f{}'.format(i)
+                    _compile_query(record, query.xpath.path, name)
+                    fields.append((query, name))
+                else:
+                    fields.append((query, None))
+            for query in mapping.compiled:
+                if isinstance(query, XMLMapper._MappingQuery):
+                    self._call_mapping(etree.SubElement(record, 'l'), query)
+        return etree.ElementTree(root)
+
+    def _call_mapping(self, parent, mapping):
+        each = etree.SubElement(parent, _xsl('for-each'),
+                                select=mapping.match_xpath)
+        etree.SubElement(each, _xsl('call-template'),
+                         name=self._names[mapping])
+
+
+def _xsl(tag):
+    return '{{{}}}{}'.format(XSL_NAMESPACE, tag)
+
+
+def _when(choose, test, name, kind, select=None):
+    attribute = etree.SubElement(
+        etree.SubElement(choose, _xsl('when'), test=test),
+        _xsl('attribute'), name=name)
+    attribute.text = kind
+    if select is not None:
+        etree.SubElement(attribute, _xsl('value-of'), select=select)
+
+
+def _compile_query(parent, path, name):
+    """Outputs attribute with kind and value of XPath result."""
+    if XMLMapper._RX_ATTRIBUTE_PATH.match(path):
+        _when(etree.SubElement(parent, _xsl('choose')), path, name, 's', path)
+        return
+
+    var = 'v' + name
+    etree.SubElement(parent, _xsl('variable'), name=var, select=path)
+    var = '$' + var
+    choose = etree.SubElement(parent, _xsl('choose'))
+    node_set = etree.SubElement(
+        choose, _xsl('when'),
+        test="exsl:object-type({}) = 'node-set'".format(var))
+    _when(choose, "exsl:object-type({}) = 'number'".format(var),
+          name, 'n', var)
+    _when(choose, "exsl:object-type({}) = 'boolean'".format(var),
+          name, 'b', var)
+    _when(choose, 'true()', name, 's', var)
+
+    choose = etree.SubElement(node_set, _xsl('choose'))
+    _when(choose, 'count({}) > 1'.format(var), name, 'e')
+    _when(choose, '{}/node()[1][self::text()]'.format(var), name, 's',
+          '{}/node()[1]'.format(var))
+    _when(choose, '{}[self::*]'.format(var), name, 'N')
+    _when(choose, 'count({}) = 1'.format(var), name, 's', var)